@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""
+Yuklash zanjirining bosqichma-bosqich o'tkazuvchanlik benchmark'i (items/s va peak RSS).
+
+Har bir bosqich alohida jarayonda (subprocess) ishga tushadi — peak RSS boshqa bosqichlar bilan aralashmaydi.
+Ma'lumot benchmarks/synth.py bilan generatsiya qilinadi (seed bir xil → har safar bir xil kirish).
+SQL Server o'rniga staging yozuvlari lokal SQLite'ga (DuckDB o'rnatilgan bo'lsa unga ham) yoziladi.
+
+    python benchmarks/bench.py                               # barcha bosqichlar
+    python benchmarks/bench.py --items 200000 --stage decode_stream --stage row_buffer
+    python benchmarks/bench.py --json bench_now.json          # natijani saqlash
+    python benchmarks/bench.py --baseline bench_base.json     # regressiya: items/s TOLERANCE dan ko'p tushsa exit 1
+
+Bosqichlar:
+    decode_stream / decode_full   JSON parse: smartup_stream.iter_json_items va json.loads
+    coerce_scalar / coerce_column to_float / to_date (balance_coerce) — skalyar va ustunli
+    balance_ids                   make_balance_ids (ombor bo'yicha batch)
+    row_buffer                    balance_main.new_row_buffer().add_window (dedupe + row_hash)
+    schema_balance                infer_sql_schema_from_rows (#TmpFact qatorlari)
+    staging_sqlite                #TmpFact/#TmpGroup/#TmpCond qatorlari → SQLite executemany
+    staging_duckdb                xuddi shu, DuckDB'ga (duckdb o'rnatilmagan bo'lsa o'tkazib yuboriladi)
+    order_flatten                 order_group.fetch_and_flatten (soxta oqimli session bilan)
+    schema_order                  order_group.auto_cast_dataframe + _sql_dtypes (order_main)
+    staging_order_sqlite          order_main/products/details DataFrame'lari → SQLite (to_sql)
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+for _p in (REPO_ROOT, os.path.join(REPO_ROOT, "smartup_balance"), os.path.join(REPO_ROOT, "smartup_order"), BENCH_DIR):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+os.environ.setdefault("SMARTUP_ARCHIVE", "0")  # benchmark javoblari raw_archive'ga yozilmasin
+
+import synth  # noqa: E402
+
+DEFAULT_ITEMS = 50_000  # balance elementlari
+DEFAULT_ORDERS = 5_000
+DEFAULT_REPEAT = 3
+TOLERANCE = 0.25  # --baseline bilan: items/s shu ulushdan ko'p tushsa regressiya
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def peak_rss_mb():
+    """Jarayonning hozirgacha bo'lgan eng katta RSS'i (MB); aniqlab bo'lmasa None."""
+    if resource is not None:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return kb / (1 << 20) if sys.platform == "darwin" else kb / 1024  # macOS: bayt, Linux: KiB
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1 << 20)
+    return None
+
+
+# ====== Kirish ma'lumotlari ======
+def _balance_items(args):
+    return synth.gen_balance(synth.Catalog(args.seed), args.items)
+
+
+def _balance_windows(args):
+    """Elementlar balance_main'dagi kabi (ombor, condition) oynalariga guruhlanadi → [(scope, items)]."""
+    windows = defaultdict(list)
+    for item in _balance_items(args):
+        windows[item["warehouse_id"]].append(item)
+    out = []
+    for i, (wh, items) in enumerate(sorted(windows.items())):
+        scope = {"cond": "T" if i % 2 else "B", "warehouse_id": wh, "warehouse_id_int": int(wh),
+                 "warehouse_code": items[0]["warehouse_code"], "filial_id_int": 9161176, "filial_code": "F1"}
+        out.append((scope, items))
+    return out
+
+
+def _filled_buffer(args):
+    import balance_main as bm
+
+    buf = bm.new_row_buffer()
+    for scope, items in _balance_windows(args):
+        buf.add_window(scope, items)
+    return buf
+
+
+class _FakeResponse:
+    status_code = 200
+
+    def __init__(self, body):
+        self.body = body
+        self.content = body
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1 << 16):
+        return synth.iter_chunks(self.body, chunk_size)
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class _FakeSession:
+    def __init__(self, body):
+        self.body = body
+
+    def post(self, url, **kw):
+        return _FakeResponse(self.body)
+
+    get = post
+
+
+def _order_frames(args):
+    import order_group as og
+
+    body = synth.payload_bytes("order", synth.gen_orders(synth.Catalog(args.seed), args.orders))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return og.fetch_and_flatten("bench://order$export", _FakeSession(body), "2025-01-01", "2025-03-31")
+
+
+# ====== Bosqichlar ======
+# Har biri: setup(args) -> run; run() -> qayta ishlangan elementlar soni. Vaqt faqat run() bo'yicha o'lchanadi.
+def stage_decode_stream(args):
+    from smartup_stream import CHUNK_SIZE, iter_json_items
+
+    body = synth.payload_bytes("balance", _balance_items(args))
+    return lambda: sum(1 for _ in iter_json_items(synth.iter_chunks(body, CHUNK_SIZE), "balance"))
+
+
+def stage_decode_full(args):
+    body = synth.payload_bytes("balance", _balance_items(args))
+    return lambda: len(json.loads(body)["balance"])
+
+
+def _coerce_inputs(args):
+    items = _balance_items(args)
+    return ([i["quantity"] for i in items], [i["input_price"] for i in items],
+            [i["date"] for i in items], [i["expiry_date"] for i in items])
+
+
+def stage_coerce_scalar(args):
+    from balance_coerce import to_date, to_float
+
+    qty, price, dates, expiry = _coerce_inputs(args)
+
+    def run():
+        for v in qty:
+            to_float(v)
+        for v in price:
+            to_float(v)
+        for v in dates:
+            to_date(v)
+        for v in expiry:
+            to_date(v)
+        return len(qty)
+    return run
+
+
+def stage_coerce_column(args):
+    from balance_coerce import to_date_column, to_float_column
+
+    qty, price, dates, expiry = _coerce_inputs(args)
+
+    def run():
+        to_float_column(qty)
+        to_float_column(price)
+        to_date_column(dates)
+        to_date_column(expiry)
+        return len(qty)
+    return run
+
+
+def stage_balance_ids(args):
+    import balance_main as bm
+    from balance_coerce import to_date_column
+
+    windows = []
+    for scope, items in _balance_windows(args):
+        dates = to_date_column([i["date"] for i in items])
+        windows.append((scope["warehouse_id"],
+                        [(i["product_id"], i["batch_number"], d) for i, d in zip(items, dates)]))
+    return lambda: sum(len(bm.make_balance_ids(wh, keys)) for wh, keys in windows)
+
+
+def stage_row_buffer(args):
+    import balance_main as bm
+
+    windows = _balance_windows(args)
+
+    def run():
+        buf = bm.new_row_buffer()
+        for scope, items in windows:
+            buf.add_window(scope, items)
+        return sum(len(items) for _, items in windows)
+    return run
+
+
+def stage_schema_balance(args):
+    import balance_main as bm
+
+    buf = _filled_buffer(args)
+    rows = list(buf.fact_rows)
+    columns = [c.strip() for c in bm.FACT_COLUMNS.split(",")]
+    return lambda: (bm.infer_sql_schema_from_rows(rows, columns), len(rows))[1]
+
+
+_SQLITE_DDL = """
+CREATE TABLE TmpFact (
+    balance_id BLOB PRIMARY KEY, inventory_kind TEXT, balance_date TEXT, warehouse_id INTEGER,
+    warehouse_code TEXT, product_code TEXT, product_barcode TEXT, product_id TEXT, card_code TEXT,
+    expiry_date TEXT, serial_number TEXT, batch_number TEXT, quantity REAL, measure_code TEXT,
+    input_price REAL, filial_id INTEGER, filial_code TEXT, row_hash BLOB
+);
+CREATE TABLE TmpGroup (balance_id BLOB NOT NULL, group_code TEXT, type_code TEXT);
+CREATE TABLE TmpCond (balance_id BLOB NOT NULL, product_condition TEXT NOT NULL);
+"""
+
+
+def stage_staging_sqlite(args):
+    import balance_main as bm
+
+    sqlite3.register_adapter(date, date.isoformat)
+    buf = _filled_buffer(args)
+    tables = (("TmpFact", 18, buf.fact_rows), ("TmpGroup", 3, buf.group_rows), ("TmpCond", 2, buf.condition_rows))
+
+    def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, "staging.db"))
+            conn.executescript(_SQLITE_DDL)
+            for table, ncols, rows in tables:
+                for chunk in bm._row_chunks(rows):
+                    conn.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * ncols)})", chunk)
+            conn.commit()
+            conn.close()
+        return len(buf.fact_rows)
+    return run
+
+
+def stage_staging_duckdb(args):
+    import duckdb  # o'rnatilmagan bo'lsa ImportError → bosqich "skipped"
+    import balance_main as bm
+
+    buf = _filled_buffer(args)
+    tables = (("TmpFact", 18, buf.fact_rows), ("TmpGroup", 3, buf.group_rows), ("TmpCond", 2, buf.condition_rows))
+    ddl = _SQLITE_DDL.replace("TEXT", "VARCHAR").replace("REAL", "DOUBLE")
+
+    def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = duckdb.connect(os.path.join(tmp, "staging.duckdb"))
+            conn.execute(ddl)
+            for table, ncols, rows in tables:
+                for chunk in bm._row_chunks(rows):
+                    conn.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * ncols)})", chunk)
+            conn.close()
+        return len(buf.fact_rows)
+    return run
+
+
+def stage_order_flatten(args):
+    import order_group as og
+
+    body = synth.payload_bytes("order", synth.gen_orders(synth.Catalog(args.seed), args.orders))
+    session = _FakeSession(body)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            og.fetch_and_flatten("bench://order$export", session, "2025-01-01", "2025-03-31")
+        return args.orders
+    return run
+
+
+def stage_schema_order(args):
+    import order_group as og
+
+    frames = _order_frames(args)
+    order_df = og._drop_nested_columns(frames["order_main"])
+
+    def run():
+        og._sql_dtypes(og.auto_cast_dataframe(order_df.copy()))
+        return len(order_df)
+    return run
+
+
+def stage_staging_order_sqlite(args):
+    import order_group as og
+
+    frames = {k: og.auto_cast_dataframe(og._drop_nested_columns(df)) for k, df in _order_frames(args).items()}
+
+    def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, "order.db"))
+            for name, df in frames.items():
+                df.to_sql(name, conn, index=False, if_exists="replace", chunksize=10_000)
+            conn.commit()
+            conn.close()
+        return len(frames["order_main"])
+    return run
+
+
+STAGES = {
+    "decode_stream": stage_decode_stream,
+    "decode_full": stage_decode_full,
+    "coerce_scalar": stage_coerce_scalar,
+    "coerce_column": stage_coerce_column,
+    "balance_ids": stage_balance_ids,
+    "row_buffer": stage_row_buffer,
+    "schema_balance": stage_schema_balance,
+    "staging_sqlite": stage_staging_sqlite,
+    "staging_duckdb": stage_staging_duckdb,
+    "order_flatten": stage_order_flatten,
+    "schema_order": stage_schema_order,
+    "staging_order_sqlite": stage_staging_order_sqlite,
+}
+
+
+# ====== O'lchash ======
+def run_stage(name, args) -> dict:
+    """Bosqichni joriy jarayonda o'lchaydi: setup'dan keyingi RSS, repeat marta run(), eng yaxshi vaqt."""
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # balance_main import'dagi print'lar
+            run = STAGES[name](args)
+    except ImportError as e:
+        return {"stage": name, "skipped": str(e)}
+    rss_setup = peak_rss_mb()
+    best, items = None, 0
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        items = run()
+        dt = time.perf_counter() - t0
+        best = dt if best is None or dt < best else best
+    rss_peak = peak_rss_mb()
+    return {
+        "stage": name, "items": items, "seconds": round(best, 4),
+        "items_per_sec": round(items / best, 1) if best else None,
+        "peak_rss_mb": round(rss_peak, 1) if rss_peak is not None else None,
+        "rss_delta_mb": round(rss_peak - rss_setup, 1) if rss_peak is not None else None,
+    }
+
+
+def run_isolated(name, args) -> dict:
+    """Bosqichni alohida python jarayonida ishga tushiradi (toza peak RSS uchun)."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", name, "--items", str(args.items),
+           "--orders", str(args.orders), "--repeat", str(args.repeat), "--seed", str(args.seed)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    lines = [ln for ln in proc.stdout.splitlines() if ln.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        return {"stage": name, "error": (proc.stderr.strip().splitlines() or ["?"])[-1]}
+    return json.loads(lines[-1])
+
+
+def compare(results, baseline_path, tolerance) -> list:
+    """Baseline bilan solishtirish. Qaytadi: regressiya bo'lgan bosqichlar [(stage, old, new)]."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = {r["stage"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = base.get(r["stage"], {}).get("items_per_sec")
+        new = r.get("items_per_sec")
+        if old and new and new < old * (1 - tolerance):
+            regressions.append((r["stage"], old, new))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'bosqich':<22}{'items':>10}{'soniya':>10}{'items/s':>14}{'peak MB':>10}{'Δ MB':>9}")
+    for r in results:
+        if "items_per_sec" not in r:
+            print(f"{r['stage']:<22}  — {r.get('skipped') or r.get('error')}")
+            continue
+        peak = "-" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.1f}"
+        delta = "-" if r["rss_delta_mb"] is None else f"{r['rss_delta_mb']:.1f}"
+        print(f"{r['stage']:<22}{r['items']:>10}{r['seconds']:>10.3f}{r['items_per_sec']:>14,.0f}{peak:>10}{delta:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SmartUp yuklash bosqichlari benchmark'i")
+    parser.add_argument("--stage", action="append", choices=sorted(STAGES), help="faqat shu bosqich(lar)")
+    parser.add_argument("--items", type=int, default=DEFAULT_ITEMS, help="balance elementlari soni")
+    parser.add_argument("--orders", type=int, default=DEFAULT_ORDERS, help="order elementlari soni")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="natijalarni JSON faylga yozish")
+    parser.add_argument("--baseline", help="oldingi --json natijasi bilan solishtirish")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--inline", action="store_true", help="bosqichlarni bitta jarayonda (RSS aralashadi)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_stage(args.child, args)))
+        sys.exit(0)
+
+    results = []
+    for name in args.stage or list(STAGES):
+        r = run_stage(name, args) if args.inline else run_isolated(name, args)
+        results.append(r)
+        print(f"⏱ {name}: " + (f"{r['items_per_sec']:,.0f} items/s" if "items_per_sec" in r
+                                 else r.get("skipped") or r.get("error")))
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "items": args.items, "orders": args.orders,
+                       "python": sys.version.split()[0], "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 {args.json}")
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for stage, old, new in regressions:
+            print(f"❌ Regressiya: {stage}: {old:,.0f} → {new:,.0f} items/s")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ Baseline bilan solishtirildi: regressiya yo'q (chegara {args.tolerance:.0%})")
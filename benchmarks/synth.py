@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+SmartUp $export javoblarining sintetik generatori (benchmark'lar uchun).
+
+Repo ildizidagi namunaviy javoblar (smartup.json, order.json, visit.json, movment.json, stocking.json,
+input.json, product.json) shablon sifatida olinadi: maydonlar to'plami va tiplari (hammasi matn, null'lar)
+aynan shunday qoladi, faqat kalitlar va qiymatlar N ta elementga real kardinalliklar bilan tarqatiladi —
+bir nechta filial/ombor, yuzlab mahsulotlar, har mahsulotda bir necha partiya, cheklangan guruh to'plamlari.
+
+    python benchmarks/synth.py balance 100000 -o balance_100k.json
+    python benchmarks/synth.py order 20000 --seed 7 -o order_20k.json
+
+Kodda:
+    cat = Catalog(seed=1)
+    items = gen_balance(cat, 100_000)
+    body = payload_bytes("balance", items)
+"""
+import argparse
+import copy
+import json
+import os
+import random
+from datetime import date, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (namuna fayl, massiv kaliti)
+SAMPLES = {
+    "balance": ("smartup.json", "balance"),
+    "order": ("order.json", "order"),
+    "visit": ("visit.json", "visit"),
+    "movement": ("movment.json", "movement"),
+    "stocktaking": ("stocking.json", "stocktaking"),
+    "input": ("input.json", "input"),
+}
+
+# Real kardinalliklar (epco ma'lumotlariga yaqin)
+FILIALS = 4
+WAREHOUSES = 14
+PRODUCTS = 400
+BATCHES_PER_PRODUCT = 3
+PERSONS = 3000
+MANAGERS = 40
+DAYS = 90
+START_DATE = date(2025, 1, 1)
+
+_templates = {}
+
+
+def load_template(kind: str) -> dict:
+    """Namuna javobning birinchi elementi (nusxa olinadi, o'zgartirish xavfsiz)."""
+    if kind not in _templates:
+        fname, key = SAMPLES[kind]
+        with open(os.path.join(REPO_ROOT, fname), "r", encoding="utf-8") as f:
+            _templates[kind] = json.load(f)[key]
+    return _templates[kind]
+
+
+def _dmy(d: date) -> str:
+    return d.strftime("%d.%m.%Y")
+
+
+class Catalog:
+    """Filial/ombor/mahsulot/partiya/mijoz ma'lumotnomalari — barcha generatorlar shu bitta to'plamdan oladi."""
+
+    def __init__(self, seed: int = 1, filials: int = FILIALS, warehouses: int = WAREHOUSES, products: int = PRODUCTS,
+                 batches: int = BATCHES_PER_PRODUCT, persons: int = PERSONS, managers: int = MANAGERS,
+                 days: int = DAYS, start: date = START_DATE):
+        self.rnd = random.Random(seed)
+        rnd = self.rnd
+        self.filials = [str(9161176 + i) for i in range(filials)]
+        self.warehouses = [{"warehouse_id": str(65461 + i), "warehouse_code": f"Sklad {i + 1:02d}",
+                            "filial_id": self.filials[i % filials]} for i in range(warehouses)]
+
+        # guruhlar namunadagi group_code/type_code'lardan olinadi
+        groups = {}
+        for item in load_template("balance"):
+            for g in item.get("groups") or []:
+                groups.setdefault(g["group_code"], set()).add(g["type_code"])
+        group_types = {k: sorted(v) for k, v in groups.items()}
+
+        self.products = []
+        for i in range(products):
+            pid = str(2334281 + i)
+            self.products.append({
+                "product_id": pid,
+                "product_code": f"EN-{i // 10:03d}.{i % 10:03d}",
+                "product_barcode": str(2068 + i),
+                "product_name": f"ENOC Product {i}",
+                "price": round(rnd.uniform(2, 60), 2),
+                "groups": [{"group_code": k, "type_code": rnd.choice(v)} for k, v in group_types.items()],
+                "batches": [f"2025{rnd.randint(1, 12):02d}{rnd.randint(1, 28):02d}{rnd.randint(0, 10 ** 12):012d}"
+                            for _ in range(batches)],
+            })
+        self.persons = [{"person_id": str(10155000 + i), "person_code": f"120.01.{i // 100:02d}.{i % 100:03d}",
+                         "person_name": f"Mijoz {i}"} for i in range(persons)]
+        self.managers = [{"sales_manager_id": str(10154400 + i), "sales_manager_name": f"Agent {i}"}
+                         for i in range(managers)]
+        self.dates = [start + timedelta(days=d) for d in range(days)]
+        self._ids = 100_000_000
+
+    def next_id(self) -> str:
+        self._ids += 1
+        return str(self._ids)
+
+    def product(self):
+        # Pareto: mahsulotlarning kichik qismi ko'p uchraydi
+        i = min(int(self.rnd.paretovariate(1.2)) - 1, len(self.products) - 1)
+        return self.products[(i * 7919) % len(self.products)]
+
+
+def gen_balance(cat: Catalog, n: int) -> list:
+    """balance$export elementlari: (ombor, mahsulot, partiya, sana) bo'yicha, miqdor/narx matn ko'rinishida."""
+    tpl = load_template("balance")[0]
+    rnd = cat.rnd
+    out = []
+    for _ in range(n):
+        wh = rnd.choice(cat.warehouses)
+        p = cat.product()
+        item = dict(tpl)
+        item.update({
+            "date": _dmy(rnd.choice(cat.dates)),
+            "warehouse_id": wh["warehouse_id"], "warehouse_code": wh["warehouse_code"],
+            "product_id": p["product_id"], "product_code": p["product_code"],
+            "product_barcode": p["product_barcode"],
+            "batch_number": rnd.choice(p["batches"]),
+            "quantity": str(rnd.randint(1, 3000)),
+            "input_price": f"{p['price']:.2f}",
+            "expiry_date": _dmy(rnd.choice(cat.dates) + timedelta(days=700)) if rnd.random() < 0.1 else None,
+            "groups": [dict(g) for g in p["groups"]],
+        })
+        out.append(item)
+    return out
+
+
+def gen_orders(cat: Catalog, n: int, max_products: int = 6) -> list:
+    """order$export elementlari: har order'da 1..max_products ta product, har product'da 1..2 detail."""
+    tpl = load_template("order")[0]
+    tpl_product = tpl["order_products"][0]
+    tpl_detail = tpl_product["details"][0]
+    rnd = cat.rnd
+    out = []
+    for _ in range(n):
+        person, manager = rnd.choice(cat.persons), rnd.choice(cat.managers)
+        wh = rnd.choice(cat.warehouses)
+        d = rnd.choice(cat.dates)
+        deal_id = cat.next_id()
+        order = {k: v for k, v in tpl.items() if not isinstance(v, list)}
+        order.update(person)
+        order.update(manager)
+        order.update({
+            "filial_id": wh["filial_id"], "deal_id": deal_id,
+            "deal_time": f"{_dmy(d)} {rnd.randint(8, 19):02d}:{rnd.randint(0, 59):02d}:00",
+            "delivery_date": _dmy(d + timedelta(days=1)), "booked_date": _dmy(d + timedelta(days=1)),
+        })
+        products, total = [], 0.0
+        for p in rnd.sample(cat.products, rnd.randint(1, max_products)):
+            qty = rnd.randint(1, 40)
+            batch = rnd.choice(p["batches"])
+            details = []
+            for _ in range(rnd.randint(1, 2)):
+                det = dict(tpl_detail)
+                det.update({"batch_number": batch, "sold_quant": str(qty)})
+                details.append(det)
+            row = dict(tpl_product)
+            row.update({
+                "product_unit_id": cat.next_id(), "product_id": p["product_id"], "product_code": p["product_code"],
+                "product_barcode": p["product_barcode"], "product_name": p["product_name"],
+                "warehouse_code": wh["warehouse_id"], "order_quant": str(qty), "sold_quant": str(qty),
+                "product_price": f"{p['price']:.2f}", "sold_amount": f"{qty * p['price']:.2f}",
+                "batch_number": batch, "details": details,
+            })
+            products.append(row)
+            total += qty * p["price"]
+        order["total_amount"] = f"{total:.2f}"
+        order["order_products"] = products
+        for k in ("order_gifts", "order_actions", "order_consignments"):
+            order[k] = []
+        out.append(order)
+    return out
+
+
+def gen_visits(cat: Catalog, n: int) -> list:
+    """visit$export elementlari: bitta visit_header, ixtiyoriy stocks/comments."""
+    tpl = load_template("visit")[0]
+    tpl_header = tpl["visit_headers"][0]
+    rnd = cat.rnd
+    out = []
+    for _ in range(n):
+        person, manager = rnd.choice(cat.persons), rnd.choice(cat.managers)
+        d = _dmy(rnd.choice(cat.dates))
+        h = dict(tpl_header)
+        h.update(person)
+        h.update(manager)
+        h.update({"visit_id": cat.next_id(), "visit_date": d,
+                  "visit_start_time": f"{d} 09:{rnd.randint(0, 59):02d}:00",
+                  "visit_end_time": f"{d} 10:{rnd.randint(0, 59):02d}:00"})
+        visit = copy.deepcopy(tpl)
+        visit["visit_headers"] = [h]
+        visit["stocks"] = [{"product_code": cat.product()["product_code"], "quantity": str(rnd.randint(0, 50))}
+                           for _ in range(rnd.choice((0, 0, 1, 3)))]
+        visit["comments"] = [{"comment": "ok"}] if rnd.random() < 0.2 else []
+        out.append(visit)
+    return out
+
+
+def gen_documents(cat: Catalog, kind: str, n: int) -> list:
+    """
+    movement / stocktaking / input: sarlavha namunadan, *_id maydonlari yangi id'lar, ichki *_items
+    massivi namuna qatorlaridan katalog mahsulotlari bilan qayta to'ldiriladi.
+    """
+    tpl = load_template(kind)[0]
+    items_key = next(k for k, v in tpl.items() if k.endswith("_items") and isinstance(v, list))
+    samples = tpl[items_key]
+    rnd = cat.rnd
+    out = []
+    for _ in range(n):
+        doc = {k: v for k, v in tpl.items() if k != items_key}
+        for k in doc:
+            if k.endswith("_id") and doc[k] is not None and not isinstance(doc[k], list):
+                doc[k] = cat.next_id()
+        items = []
+        for _ in range(rnd.randint(1, max(2, len(samples)))):
+            row = dict(rnd.choice(samples))
+            p = cat.product()
+            for k in row:
+                if k.endswith("_item_id") or k.endswith("_unit_id"):
+                    row[k] = cat.next_id()
+            row["product_code"] = p["product_code"]
+            if "quantity" in row:
+                row["quantity"] = str(rnd.randint(-100, 3000))
+            items.append(row)
+        doc[items_key] = items
+        out.append(doc)
+    return out
+
+
+GENERATORS = {
+    "balance": gen_balance,
+    "order": gen_orders,
+    "visit": gen_visits,
+    "movement": lambda cat, n: gen_documents(cat, "movement", n),
+    "stocktaking": lambda cat, n: gen_documents(cat, "stocktaking", n),
+    "input": lambda cat, n: gen_documents(cat, "input", n),
+}
+
+
+def generate(kind: str, n: int, seed: int = 1, catalog: Catalog = None) -> list:
+    return GENERATORS[kind](catalog or Catalog(seed), n)
+
+
+def payload_bytes(kind: str, items) -> bytes:
+    """API javobi ko'rinishidagi tana: {"<key>": [...]} (UTF-8, ensure_ascii=False — server kabi)."""
+    return json.dumps({SAMPLES[kind][1]: items}, ensure_ascii=False).encode("utf-8")
+
+
+def iter_chunks(body: bytes, size: int = 1 << 16):
+    """response.iter_content o'rniga: tanani bir xil o'lchamli bo'laklarda beradi."""
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sintetik SmartUp $export javobi")
+    parser.add_argument("kind", choices=sorted(GENERATORS))
+    parser.add_argument("n", type=int, help="elementlar soni")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help="fayl (berilmasa stdout)")
+    args = parser.parse_args()
+
+    body = payload_bytes(args.kind, generate(args.kind, args.n, args.seed))
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(body)
+        print(f"✅ {args.kind}: {args.n} ta element, {len(body) / 1e6:.1f} MB → {args.output}")
+    else:
+        os.write(1, body)
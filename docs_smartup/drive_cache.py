@@ -0,0 +1,236 @@
+"""
+Google Drive fayllari va sheet'lari uchun fingerprint cache: o'zgarmagan fayl yuklanmaydi, o'zgarmagan sheet SQL'ga yuborilmaydi.
+
+Skriptlar har soat ishlaydi, HR/moliya jadvallari esa haftada bir o'zgaradi. Har run'da:
+  1. drive.files().get(fields=META_FIELDS) — faqat metadata (modifiedTime, headRevisionId, md5Checksum);
+     cache'dagi bilan bir xil bo'lsa fayl umuman yuklanmaydi (get_all_records / get_media yo'q);
+  2. fayl o'zgargan bo'lsa sheet'lar o'qiladi va har birining kontent hash'i (sheet_hash) olinadi —
+     hash'i o'zgarmagan sheet'lar natijadan chiqariladi (SQL ishi yo'q);
+  3. SQL'ga yozish muvaffaqiyatli tugagach cache.commit(file_id) — aks holda keyingi run qayta urinadi.
+
+    cache = FingerprintCache()
+    sheets_data = load_changed_sheets(file_id, drive, gspread_client, cache)
+    if sheets_data:
+        write_to_sql(sheets_data, DB_CONN_STR)
+    cache.commit(file_id)
+
+drive / gspread_client o'rniga mahalliy soxta klientlar berilishi mumkin (FakeDrive, FakeSheets) — _self_check'ga qarang:
+    python docs_smartup/drive_cache.py
+"""
+import hashlib
+import io
+import json
+import os
+
+import pandas as pd
+
+CACHE_PATH = os.environ.get("DOCS_FINGERPRINT_CACHE",
+                            os.path.join(os.path.expanduser("~"), ".smartup", "drive_fingerprints.json"))
+META_FIELDS = "id,name,mimeType,modifiedTime,headRevisionId,md5Checksum"
+REVISION_FIELDS = ("modifiedTime", "headRevisionId", "md5Checksum")  # Google Sheets'da faqat modifiedTime bo'ladi
+
+SPREADSHEET_MIME = "application/vnd.google-apps.spreadsheet"
+EXCEL_MIMES = (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.ms-excel",
+)
+
+
+def sheet_hash(df: pd.DataFrame) -> str:
+    """Sheet kontenti (ustun nomlari + qiymatlar, tartib bilan) → hex digest."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    if not df.empty:
+        h.update(pd.util.hash_pandas_object(df.astype(str), index=False).values.tobytes())
+    return h.hexdigest()
+
+
+class FingerprintCache:
+    """file_id → {modifiedTime, headRevisionId, md5Checksum, sheets: {sheet: hash}} (JSON, diskda)."""
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self._pending = {}  # file_id → yozish tugagach saqlanadigan yozuv
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.files = json.load(f)
+        except (OSError, ValueError):
+            self.files = {}
+
+    def file_unchanged(self, meta: dict) -> bool:
+        """Drive metadata'si oxirgi muvaffaqiyatli run'dagi bilan bir xilmi."""
+        entry = self.files.get(meta["id"])
+        if not entry or not any(meta.get(k) for k in REVISION_FIELDS):
+            return False
+        return all(entry.get(k) == meta.get(k) for k in REVISION_FIELDS)
+
+    def changed_sheets(self, meta: dict, sheets_data: dict) -> dict:
+        """Hash'i o'zgargan sheet'larni qaytaradi; yangi fingerprint commit() gacha kutib turadi."""
+        old = (self.files.get(meta["id"]) or {}).get("sheets", {})
+        hashes = {name: sheet_hash(df) for name, df in sheets_data.items()}
+        entry = {k: meta.get(k) for k in REVISION_FIELDS}
+        entry["sheets"] = dict(old, **hashes)
+        self._pending[meta["id"]] = entry
+        return {name: df for name, df in sheets_data.items() if old.get(name) != hashes[name]}
+
+    def commit(self, file_id: str):
+        """SQL'ga yozish tugagach chaqiriladi: kutayotgan fingerprint diskka yoziladi."""
+        entry = self._pending.pop(file_id, None)
+        if entry is None:
+            return
+        self.files[file_id] = entry
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.files, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+def read_sheets(meta: dict, drive, gspread_client, sheet_names=None) -> dict:
+    """Fayldagi sheet'lar (sheet_names berilsa faqat ular) → {nom: DataFrame}."""
+    file_id, mime = meta["id"], meta["mimeType"]
+    sheets_data = {}
+
+    if mime == SPREADSHEET_MIME:
+        for ws in gspread_client.open_by_key(file_id).worksheets():
+            if sheet_names is None or ws.title in sheet_names:
+                sheets_data[ws.title] = pd.DataFrame(ws.get_all_records())
+
+    elif mime in EXCEL_MIMES:
+        fh = io.BytesIO(drive.files().get_media(fileId=file_id).execute())
+        xls = pd.ExcelFile(fh)
+        for sheet_name in xls.sheet_names:
+            if sheet_names is None or sheet_name in sheet_names:
+                sheets_data[sheet_name] = pd.read_excel(xls, sheet_name=sheet_name)
+
+    else:
+        raise RuntimeError("❌ Noto‘g‘ri fayl turi!")
+
+    missing = [s for s in (sheet_names or ()) if s not in sheets_data]
+    if missing:
+        raise RuntimeError(f"❌ Faylda {missing} topilmadi!")
+    return sheets_data
+
+
+def load_changed_sheets(file_id: str, drive, gspread_client, cache: FingerprintCache = None, sheet_names=None) -> dict:
+    """
+    Faqat o'zgargan sheet'lar: fayl metadata'si o'zgarmagan bo'lsa yuklamasdan {} qaytadi.
+    cache=None — eski xulq (hammasi har safar).
+    """
+    meta = drive.files().get(fileId=file_id, fields=META_FIELDS).execute()
+    if cache is not None and cache.file_unchanged(meta):
+        print(f"⏭ {meta.get('name', file_id)} o‘zgarmagan ({meta.get('modifiedTime')}), yuklanmadi.")
+        return {}
+    sheets_data = read_sheets(meta, drive, gspread_client, sheet_names)
+    if cache is None:
+        return sheets_data
+    changed = cache.changed_sheets(meta, sheets_data)
+    for name in sheets_data:
+        if name not in changed:
+            print(f"⏭ {name} sheet o‘zgarmagan, SQL'ga yozilmaydi.")
+    return changed
+
+
+# ---- mahalliy soxta klientlar (tarmoqsiz tekshirish uchun) ----
+
+class _Call:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+
+class FakeDrive:
+    """drive v3 klientining files().get / files().get_media qismi; files: {file_id: {"meta": {...}, "content": bytes}}."""
+
+    def __init__(self, files: dict):
+        self.store = files
+        self.calls = []
+
+    def files(self):
+        return self
+
+    def get(self, fileId, fields=None):
+        self.calls.append(("get", fileId))
+        return _Call(lambda: dict(self.store[fileId]["meta"], id=fileId))
+
+    def get_media(self, fileId):
+        self.calls.append(("get_media", fileId))
+        return _Call(lambda: self.store[fileId]["content"])
+
+
+class _FakeWorksheet:
+    def __init__(self, owner, title, records):
+        self.owner, self.title, self.records = owner, title, records
+
+    def get_all_records(self):
+        self.owner.calls.append(("get_all_records", self.title))
+        return [dict(r) for r in self.records]
+
+
+class FakeSheets:
+    """gspread klientining open_by_key(...).worksheets() qismi; books: {file_id: {sheet: [records]}}."""
+
+    def __init__(self, books: dict):
+        self.books = books
+        self.calls = []
+
+    def open_by_key(self, file_id):
+        owner = self
+        return type("FakeSpreadsheet", (), {
+            "worksheets": lambda _: [_FakeWorksheet(owner, t, r) for t, r in owner.books[file_id].items()]})()
+
+
+def _self_check():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fp.json")
+        fid = "sheet-1"
+        drive = FakeDrive({fid: {"meta": {"name": "HR", "mimeType": SPREADSHEET_MIME,
+                                          "modifiedTime": "2025-07-01T10:00:00.000Z"}}})
+        sheets = FakeSheets({fid: {"A": [{"x": 1, "y": "a"}], "B": [{"x": 2, "y": "b"}]}})
+
+        # 1-run: hammasi yangi
+        cache = FingerprintCache(path)
+        assert set(load_changed_sheets(fid, drive, sheets, cache)) == {"A", "B"}
+        cache.commit(fid)
+
+        # 2-run: modifiedTime o'zgarmagan — worksheet'lar o'qilmaydi
+        sheets.calls.clear()
+        cache = FingerprintCache(path)
+        assert load_changed_sheets(fid, drive, sheets, cache) == {} and not sheets.calls
+
+        # 3-run: fayl tahrirlangan, faqat B o'zgargan
+        drive.store[fid]["meta"]["modifiedTime"] = "2025-07-08T10:00:00.000Z"
+        sheets.books[fid]["B"].append({"x": 3, "y": "c"})
+        assert set(load_changed_sheets(fid, drive, sheets, cache)) == {"B"}
+
+        # yozish muvaffaqiyatsiz (commit yo'q) — keyingi run B'ni yana beradi
+        cache = FingerprintCache(path)
+        assert set(load_changed_sheets(fid, drive, sheets, cache)) == {"B"}
+        cache.commit(fid)
+        assert load_changed_sheets(fid, drive, sheets, FingerprintCache(path)) == {}
+
+        # Excel: headRevisionId bo'yicha, get_media faqat o'zgarganda
+        buf = io.BytesIO()
+        try:
+            pd.DataFrame({"x": [1, 2]}).to_excel(buf, sheet_name="S", index=False)
+        except ImportError:
+            print("⚠️ openpyxl yo‘q — Excel tekshiruvi o‘tkazib yuborildi.")
+        else:
+            xid = "xlsx-1"
+            drive.store[xid] = {"meta": {"name": "Supply", "mimeType": EXCEL_MIMES[0], "headRevisionId": "r1",
+                                         "modifiedTime": "2025-07-01T10:00:00.000Z"}, "content": buf.getvalue()}
+            cache = FingerprintCache(path)
+            assert set(load_changed_sheets(xid, drive, sheets, cache, sheet_names=["S"])) == {"S"}
+            cache.commit(xid)
+            drive.calls.clear()
+            assert load_changed_sheets(xid, drive, sheets, FingerprintCache(path)) == {}
+            assert ("get_media", xid) not in drive.calls
+    print("✅ drive_cache: fingerprint cache tekshiruvi o‘tdi.")
+
+
+if __name__ == "__main__":
+    _self_check()
@@ -0,0 +1,176 @@
+"""
+Google Sheets / Excel sheet'larini SQL Server'ga dublikatlarsiz yozish (hr_1, hr_2, moliya, muhlisa, supply uchun umumiy).
+
+Har sheet uchun:
+  1. row_hash — ustunlar matn ko'rinishida ketma-ket qo'shilib (ustun bo'yicha, vektorlashgan) MD5 olinadi.
+     Bo'sh kataklar o'rnatilgan pandas versiyasidan qat'i nazar "nan"/"None"/"NaT" bo'lib yoziladi — avvalgi
+     df.astype(str).sum(axis=1) ning pandas < 3 dagi qiymati;
+  2. partiya ichidagi takror hash'lar tashlanadi va hammasi bitta fast_executemany bilan #stage ga yoziladi;
+  3. eski hash'larni moslash: pandas >= 3 da astype(str) NaN'ni NaN qoldiradi va sum(axis=1) uni tashlab
+     yuboradi, shuning uchun bo'sh katakli qatorlar jadvalda boshqa hash bilan turgan bo'lishi mumkin. Bunday
+     qatorlar uchun eski variant (legacy_hash) ham stage'ga yoziladi va jadvaldagi mos row_hash bir marta
+     yangisiga almashtiriladi — birinchi run'da ular "yangi" dublikat bo'lib qayta qo'shilmaydi;
+  4. bitta INSERT ... WHERE NOT EXISTS (row_hash bo'yicha, UQ_<table>_hash indeksi) — faqat yangi qatorlar.
+Har qator uchun alohida round trip va IntegrityError yo'q.
+
+Ulanish satridagi eski "{SQL Server}" drayveri (NVARCHAR(MAX) ga fast_executemany'ni yaxshi ko'tarmaydi)
+o'rnatilgan bo'lsa ODBC Driver 17/18 bilan almashtiriladi (odbc_conn_str).
+"""
+import hashlib
+import re
+
+import pandas as pd
+import pyodbc
+
+LEGACY_DRIVER = "{SQL Server}"
+ODBC_DRIVERS = ("ODBC Driver 17 for SQL Server", "ODBC Driver 18 for SQL Server")  # boshqa sink'lar kabi
+
+
+def odbc_conn_str(conn_str: str, installed=None) -> str:
+    """DRIVER={SQL Server} → o'rnatilgan ODBC Driver 17/18 (bo'lmasa satr o'zgarmaydi)."""
+    if LEGACY_DRIVER.lower() not in conn_str.lower():
+        return conn_str
+    installed = pyodbc.drivers() if installed is None else installed
+    driver = next((d for d in ODBC_DRIVERS if d in installed), None)
+    if driver is None:
+        return conn_str
+    start = conn_str.lower().index(LEGACY_DRIVER.lower())
+    conn_str = conn_str[:start] + "{" + driver + "}" + conn_str[start + len(LEGACY_DRIVER):]
+    if "trustservercertificate" not in conn_str.lower():  # Driver 18 standart holatda Encrypt=yes
+        conn_str = conn_str.rstrip(";") + ";TrustServerCertificate=yes;"
+    return conn_str
+
+
+def clean_table_name(name: str) -> str:
+    """SQL Server uchun xavfsiz jadval nomi yaratadi"""
+    name = re.sub(r"\W+", "_", name)
+    return name[:50]
+
+
+def detect_sql_type(series: pd.Series) -> str:
+    """Pandas ustun turiga qarab SQL turini belgilash"""
+    if pd.api.types.is_integer_dtype(series):
+        return "BIGINT"
+    elif pd.api.types.is_float_dtype(series):
+        return "FLOAT"
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        return "DATETIME"
+    else:
+        return "NVARCHAR(MAX)"
+
+
+def _as_text(series: pd.Series, missing: str = None) -> pd.Series:
+    """
+    series.astype(str), bo'sh qiymatlar ham matn: missing=None bo'lsa "nan"/"None"/"NaT" (pandas < 3 kabi —
+    yangi pandas ularni NaN qoldiradi), aks holda missing (pandas >= 3 dagi sum(axis=1) uchun "").
+    """
+    text = series.astype(str).astype(object)
+    empty = text.isna() if missing is None else series.isna()
+    if empty.any():
+        text[empty] = series[empty].map(str) if missing is None else missing
+    return text
+
+
+def row_hashes(df: pd.DataFrame, missing: str = None) -> pd.Series:
+    """Qator hash'lari: md5(str(c1) + str(c2) + ...) — ustunlar bo'yicha qo'shiladi, qatorma-qator apply yo'q."""
+    if df.columns.empty:
+        return pd.Series([], dtype=object, index=df.index)
+    text = _as_text(df.iloc[:, 0], missing)
+    for i in range(1, df.shape[1]):
+        text = text + _as_text(df.iloc[:, i], missing)
+    return pd.Series([hashlib.md5(s.encode()).hexdigest() for s in text], index=df.index)
+
+
+def legacy_row_hashes(df: pd.DataFrame) -> pd.Series:
+    """
+    pandas >= 3 dagi eski df.astype(str).sum(axis=1) hash'i (bo'sh kataklar tashlab yuborilgan). Faqat bo'sh
+    katakli qatorlar uchun — qolganlarida row_hashes bilan bir xil, shuning uchun None.
+    """
+    has_missing = df.isna().any(axis=1)
+    legacy = pd.Series([None] * len(df), dtype=object, index=df.index)
+    if has_missing.any():
+        legacy[has_missing] = row_hashes(df[has_missing], missing="")
+    return legacy
+
+
+def _sql_values(df: pd.DataFrame) -> list:
+    """Qiymatlar avvalgidek matn sifatida yuboriladi (NaN/None → NULL)."""
+    text = df.astype(str).astype(object).where(df.notna(), None)
+    return list(text.itertuples(index=False, name=None))
+
+
+def insert_new_rows(cursor, table_name: str, df: pd.DataFrame, legacy: pd.Series = None) -> int:
+    """
+    df (row_hash bilan) → #stage → eski hash'larni moslash → INSERT WHERE NOT EXISTS.
+    legacy — legacy_row_hashes (df bilan bir xil index). Qaytadi: qo'shilgan qatorlar soni.
+    """
+    existing = {r[0] for r in cursor.execute(
+        "SELECT name FROM sys.columns WHERE object_id = OBJECT_ID(?)", table_name).fetchall()}
+    for col in df.columns:
+        if col not in existing:  # sheet'ga yangi ustun qo'shilgan
+            cursor.execute(f"ALTER TABLE {table_name} ADD [{col}] {detect_sql_type(df[col])} NULL")
+
+    col_names = ",".join([f"[{c}]" for c in df.columns])
+    stage = f"#stage_{table_name}"
+    cursor.execute(f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage}; "
+                   f"SELECT TOP 0 {col_names}, CAST(NULL AS CHAR(32)) AS legacy_hash INTO {stage} FROM {table_name};")
+
+    if legacy is None:
+        legacy = pd.Series([None] * len(df), dtype=object, index=df.index)
+    rows = [row + (h,) for row, h in zip(_sql_values(df), legacy.reindex(df.index).tolist())]
+    cursor.fast_executemany = True
+    placeholders = ", ".join(["?"] * (len(df.columns) + 1))
+    cursor.executemany(f"INSERT INTO {stage} ({col_names}, legacy_hash) VALUES ({placeholders})", rows)
+
+    if legacy.notna().any():
+        # bir martalik: pandas >= 3 bilan yozilgan eski hash'lar yangisiga almashtiriladi
+        cursor.execute(f"""
+            UPDATE T SET T.row_hash = S.row_hash
+            FROM {table_name} AS T
+            JOIN {stage} AS S ON T.row_hash = S.legacy_hash
+            WHERE NOT EXISTS (SELECT 1 FROM {table_name} AS T2 WHERE T2.row_hash = S.row_hash);
+        """)
+
+    cursor.execute(f"""
+        SET NOCOUNT ON;
+        INSERT INTO {table_name} ({col_names})
+        SELECT {col_names} FROM {stage} AS S
+        WHERE NOT EXISTS (SELECT 1 FROM {table_name} AS T WHERE T.row_hash = S.row_hash);
+        SELECT @@ROWCOUNT;
+    """)
+    inserted = cursor.fetchone()[0]
+    cursor.execute(f"DROP TABLE {stage}")
+    return inserted or 0
+
+
+def write_to_sql(sheets_data: dict, conn_str: str):
+    """DataFrame’larni SQL Server ga yozish (dublikatlarsiz)"""
+    conn = pyodbc.connect(odbc_conn_str(conn_str))
+    cursor = conn.cursor()
+
+    for sheet_name, df in sheets_data.items():
+        if df.empty:
+            print(f"⚠️ {sheet_name} bo‘sh, o‘tkazildi.")
+            continue
+
+        table_name = clean_table_name(sheet_name)
+        print(f"📥 {table_name} jadvaliga tekshirilmoqda... ({len(df)} qator)")
+
+        # Jadval yaratish (agar yo‘q bo‘lsa)
+        cols = ", ".join([f"[{col}] {detect_sql_type(df[col])}" for col in df.columns])
+        cols += ", [row_hash] CHAR(32)"  # dublikatni aniqlash uchun hash
+        cursor.execute(f"""
+            IF OBJECT_ID('{table_name}', 'U') IS NULL
+            CREATE TABLE {table_name} ({cols}, CONSTRAINT UQ_{table_name}_hash UNIQUE (row_hash))
+        """)
+
+        # Hash qo‘shish; sheet ichidagi takrorlar stage'ga yuborilmaydi
+        df = df.assign(row_hash=row_hashes(df)).drop_duplicates(subset=["row_hash"])
+        legacy = legacy_row_hashes(df.drop(columns=["row_hash"]))
+
+        inserted = insert_new_rows(cursor, table_name, df, legacy)
+        conn.commit()
+        print(f"✅ {table_name} ga {inserted} yangi qator qo‘shildi ({len(df) - inserted} dublikat).")
+
+    cursor.close()
+    conn.close()
@@ -1,21 +1,13 @@
 import json
 import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from sqlalchemy import create_engine
 import urllib
 
+from smartup_flatten import INVENTORY_TABLES, flatten
+from smartup_session import get_session
+from smartup_stream import iter_response_items
 
-def get_cookies_from_browser(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-    input("🌐 Saytga login bo‘lgach Enter ni bosing...")
-    cookies = driver.get_cookies()
-    driver.quit()
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+STREAM_JSON = True  # inventory$export javobini oqim rejimida o'qish
 
 
 def auto_cast_dataframe(df: pd.DataFrame) -> pd.DataFrame:
@@ -48,82 +40,19 @@ def auto_cast_dataframe(df: pd.DataFrame) -> pd.DataFrame:
 
 def fetch_inventory_tables(inventory_url, group_url):
     try:
-        cookies = get_cookies_from_browser("https://smartup.online")
+        session = get_session()
         print("⬇️ Ma'lumotlar yuklanmoqda...")
 
-        inv_data = requests.get(inventory_url, cookies=cookies).json()
-        group_data = requests.get(group_url, cookies=cookies).json()
-
-        inventory_raw = inv_data.get("inventory", [])
-
-        # ---------------- inventory ----------------
-        inv_df = pd.json_normalize(inventory_raw)
-
-        # ---------------- inventory_groups ----------------
-        group_rows = []
-        for item in inventory_raw:
-            pid = item.get("product_id")
-            code = item.get("code")
-            for g in item.get("groups", []):
-                group_rows.append({
-                    "product_id": pid,
-                    "code": code,
-                    "group_id": g.get("group_id"),  # ✅ TUZATILDI
-                    "group_code": g.get("group_code"),
-                    "type_id": g.get("type_id")
-                })
-        group_df = pd.DataFrame(group_rows)
-
-        # ---------------- inventory_kinds ----------------
-        kind_rows = []
-        for item in inventory_raw:
-            pid = item.get("product_id")
-            code = item.get("code")
-            for k in item.get("inventory_kinds", []):
-                kind_rows.append({
-                    "product_id": pid,
-                    "code": code,
-                    "kind_code": k.get("kind_code"),  # ✅ TUZATILDI
-                    "state": k.get("state")
-                })
-        kind_df = pd.DataFrame(kind_rows)
-
-        # ---------------- inventory_return ----------------
-        return_rows = []
-        for item in inventory_raw:
-            pid = item.get("product_id")
-            code = item.get("code")
-            for r in item.get("return_conditions", []):
-                return_rows.append({
-                    "product_id": pid,
-                    "code": code,
-                    "condition_code": r.get("condition_code"),
-                    "is_default": r.get("is_default")
-                })
-        return_df = pd.DataFrame(return_rows)
-
-        # ---------------- inventory_sectors ----------------
-        sector_rows = []
-        for item in inventory_raw:
-            pid = item.get("product_id")
-            code = item.get("code")
-            for s in item.get("sector_codes", []):
-                sector_code = s.get("sector_code") if isinstance(s, dict) else s
-                sector_rows.append({
-                    "product_id": pid,
-                    "code": code,
-                    "sector_code": sector_code
-                })
-        sector_df = pd.DataFrame(sector_rows)
-
-        # Auto-cast all tables
-        df_dict = {
-            "inventory": inv_df,
-            "inventory_groups": group_df,
-            "inventory_kinds": kind_df,
-            "inventory_return": return_df,
-            "inventory_sectors": sector_df
-        }
+        inv_resp = session.get(inventory_url, stream=STREAM_JSON)
+        inv_resp.raise_for_status()
+        if STREAM_JSON:
+            inventory_raw = iter_response_items(inv_resp, "inventory")
+        else:
+            inventory_raw = inv_resp.json().get("inventory", [])
+
+        # inventory + groups / kinds / return / sectors — bitta o'tishda (smartup_flatten.INVENTORY_TABLES)
+        df_dict = flatten(INVENTORY_TABLES, inventory_raw)
+        group_data = session.get(group_url).json()
 
         for name, df in df_dict.items():
             if not df.empty:
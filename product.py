@@ -1,21 +1,9 @@
 import json
 import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from sqlalchemy import create_engine
 import urllib
 
-
-def get_cookies_from_browser(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-    input("🌐 Saytga login bo‘ling va Enter bosing...")
-    cookies = driver.get_cookies()
-    driver.quit()
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+from smartup_session import get_session
 
 
 def auto_cast_dataframe(df: pd.DataFrame) -> pd.DataFrame:
@@ -48,9 +36,9 @@ def auto_cast_dataframe(df: pd.DataFrame) -> pd.DataFrame:
 
 def fetch_and_flatten(data_url):
     try:
-        cookies = get_cookies_from_browser("https://smartup.online")
+        session = get_session()
         print("⬇️ Ma'lumotlar yuklanmoqda...")
-        response = requests.get(data_url, cookies=cookies)
+        response = session.get(data_url)
         response.raise_for_status()
         data = response.json()
 
@@ -1,25 +1,23 @@
-import json
-import pandas as pd
-import requests
+import os
+import sys
+import urllib
+
 from pandas import json_normalize
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from sqlalchemy import create_engine
-import urllib
 
+# repo ildizidagi umumiy modullar (smartup_session, smartup_sink)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def get_cookies_from_browser(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-    input("🌐 Login qilib bo‘lgach Enter ni bosing...")
-    cookies = driver.get_cookies()
-    driver.quit()
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+from smartup_session import get_session  # noqa: E402
+from smartup_sink import upsert_keyed  # noqa: E402
+
+TABLE_KEYS = {"smartup_data": ["deal_id"]}  # natural key (order$export)
 
 
 def flatten_json_data(data):
+    # {"order": [...]} → har order alohida qator (aks holda butun javob bitta qatorga tushadi va kalit yo'q)
+    if isinstance(data, dict) and len(data) == 1 and isinstance(next(iter(data.values())), list):
+        data = next(iter(data.values()))
     if isinstance(data, list):
         return json_normalize(data, sep="_", max_level=2)
     elif isinstance(data, dict):
@@ -30,9 +28,9 @@ def flatten_json_data(data):
 
 def fetch_and_process_data(data_url, csv_file):
     try:
-        cookies = get_cookies_from_browser("https://smartup.online")
+        session = get_session()
         print("⬇️ Ma'lumot yuklanmoqda...")
-        response = requests.get(data_url, cookies=cookies)
+        response = session.get(data_url)
         response.raise_for_status()
         data = response.json()
 
@@ -58,20 +56,12 @@ def upload_to_sql(df, table_name="smartup_data"):
             "TrustServerCertificate=yes;"
             "Trusted_Connection=yes;"
         )
-        engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-
-        # Eski yozuvlarni olish va dublikate olib tashlash
-        try:
-            existing_df = pd.read_sql(f"SELECT * FROM {table_name}", con=engine)
-            print(f"📊 Eski yozuvlar: {len(existing_df)}")
-            combined_df = pd.concat([existing_df, df])
-            df_clean = combined_df.drop_duplicates()
-        except Exception:
-            print("🆕 Yangi jadval, to‘g‘ridan-to‘g‘ri yoziladi.")
-            df_clean = df
+        engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}", fast_executemany=True)
 
-        df_clean.to_sql(table_name, con=engine, index=False, if_exists="replace")
-        print(f"✅ '{table_name}' jadvalga {len(df_clean)} ta noyob yozuv yozildi.")
+        # Faqat yangi/o'zgargan yozuvlar MERGE qilinadi (kalit: TABLE_KEYS), jadval qayta yaratilmaydi
+        stats = upsert_keyed(df, table_name, TABLE_KEYS[table_name], engine)
+        print(f"✅ '{table_name}': {stats['inserted']} ta yangi, {stats['updated']} ta yangilangan, "
+              f"{stats['unchanged']} ta o‘zgarmagan.")
     except Exception as e:
         print(f"❌ SQL yozishda xatolik: {e}")
 
@@ -1,21 +1,18 @@
-import json
+import os
+import sys
+import urllib
+
 import pandas as pd
-import requests
 from pandas import json_normalize
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from sqlalchemy import create_engine
-import urllib
 
-def get_cookies_from_browser(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-    input("🌐 Login qilib bo‘lgach Enter ni bosing...")
-    cookies = driver.get_cookies()
-    driver.quit()
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+# repo ildizidagi umumiy modullar (smartup_session, smartup_sink)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartup_session import get_session  # noqa: E402
+from smartup_sink import upsert_keyed  # noqa: E402
+
+TABLE_KEYS = {"natural_person": ["person_id"]}  # natural key (natural_person$export)
 
 def auto_flatten_json(data):
     if isinstance(data, dict) and len(data) == 1:
@@ -32,9 +29,9 @@ def auto_flatten_json(data):
 
 def fetch_and_flatten(data_url):
     try:
-        cookies = get_cookies_from_browser("https://smartup.online")
+        session = get_session()
         print("⬇️ Ma'lumot yuklanmoqda...")
-        response = requests.get(data_url, cookies=cookies)
+        response = session.get(data_url)
         response.raise_for_status()
         data = response.json()
 
@@ -55,16 +52,12 @@ def upload_to_sql(df, table_name):
             "Trusted_Connection=yes;"
             "TrustServerCertificate=yes;"
         )
-        engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-
-        try:
-            existing_df = pd.read_sql(f"SELECT * FROM {table_name}", con=engine)
-            df = pd.concat([existing_df, df]).drop_duplicates()
-        except Exception:
-            print("🆕 Jadval yangi, birinchi marta yozilmoqda.")
+        engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}", fast_executemany=True)
 
-        df.to_sql(table_name, con=engine, index=False, if_exists="replace")
-        print(f"✅ '{table_name}' jadvalga yozildi. {len(df)} ta satr.")
+        # Faqat yangi/o'zgargan yozuvlar MERGE qilinadi (kalit: TABLE_KEYS), jadval qayta yaratilmaydi
+        stats = upsert_keyed(df, table_name, TABLE_KEYS[table_name], engine)
+        print(f"✅ '{table_name}': {stats['inserted']} ta yangi, {stats['updated']} ta yangilangan, "
+              f"{stats['unchanged']} ta o‘zgarmagan.")
     except Exception as e:
         print(f"❌ SQL yozishda xatolik: {e}")
 
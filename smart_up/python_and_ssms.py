@@ -1,11 +1,15 @@
+import os
+import sys
 import json
 import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from pandas import json_normalize
 import sqlalchemy
 
+# repo ildizidagi umumiy modullar (smartup_session va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartup_session import get_session  # noqa: E402
+
 
 # ✅ SSMS Ulanish sozlamalari
 SERVER = '213.230.120.114:7002'
@@ -13,25 +17,6 @@ DATABASE = 'Test'
 DRIVER = 'ODBC+Driver+17+for+SQL+Server'
 TABLE_NAME = 'SmartupOrders'
 
-# ✅ Foydali funksiya: cookie olish
-def get_cookies_from_browser(url):
-    print("🌐 Brauzer ochilmoqda... Login qiling...")
-
-    chrome_options = Options()
-    chrome_options.add_experimental_option("detach", False)
-    chrome_options.add_argument("--start-maximized")
-
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-
-    input("⏳ Tizimga kirib bo‘lgach Enter bosing...")
-
-    cookies = driver.get_cookies()
-    driver.quit()
-
-    return {cookie['name']: cookie['value'] for cookie in cookies}
-
-
 # ✅ Nested list kalitlarini topish
 def explore_json(data, prefix=""):
     if isinstance(data, dict):
@@ -55,10 +40,10 @@ def flatten_json_data(data):
 # ✅ Asosiy ish: JSON olish, CSV saqlash, DB ga yozish
 def fetch_and_store_to_sql(data_url, json_file, csv_file):
     try:
-        cookies = get_cookies_from_browser("https://smartup.online")
+        session = get_session()
 
         print("⬇️ Ma'lumot yuklanmoqda...")
-        response = requests.get(data_url, cookies=cookies)
+        response = session.get(data_url)
         response.raise_for_status()
 
         print("🔍 JSON pars qilinmoqda...")
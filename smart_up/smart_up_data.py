@@ -1,27 +1,13 @@
+import os
+import sys
 import json
 
 import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 
+# repo ildizidagi umumiy modullar (smartup_session va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def get_cookies_from_browser(url):
-    print("🌐 Brauzer ochilmoqda... Login qiling...")
-
-    chrome_options = Options()
-    chrome_options.add_experimental_option("detach", False)  # optional: avtomatik yopish
-    chrome_options.add_argument("--start-maximized")  # fullscreen
-
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-
-    input("⏳ Iltimos, tizimga kirib bo‘lgach Enter ni bosing...")
-
-    cookies = driver.get_cookies()
-    driver.quit()
-
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+from smartup_session import get_session  # noqa: E402
 
 
 def explore_json(data, prefix=""):
@@ -35,10 +21,10 @@ def explore_json(data, prefix=""):
 
 def fetch_and_export_data(data_url, output_file):
     try:
-        cookies = get_cookies_from_browser("https://smartup.online")
+        session = get_session()
 
         print("⬇️ Ma'lumot yuklanmoqda...")
-        response = requests.get(data_url, cookies=cookies)
+        response = session.get(data_url)
         response.raise_for_status()
 
         content_type = response.headers.get('Content-Type', '').lower()
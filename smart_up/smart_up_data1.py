@@ -1,52 +1,16 @@
-import requests
-import pandas as pd
 import json
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-# === STEP 1: Cookie'ni avtomatik olish uchun login qilamiz ===
-def get_cookies_after_login(url, email, password):
-    print("🔐 Avtomatik login boshlandi...")
-
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # Brauzer ko‘rinmasin
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920,1080")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-
-    try:
-        # ⌛ Login formani kutamiz
-        WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.NAME, "email")))
+import os
+import sys
 
-        driver.find_element(By.NAME, "email").send_keys(email)
-        driver.find_element(By.NAME, "password").send_keys(password)
-
-        # Submit button topamiz
-        submit_btn = driver.find_element(By.XPATH, "//button[@type='submit']")
-        submit_btn.click()
-
-        # ⌛ Login tugaguncha kutamiz (masalan: sahifa o‘zgarsa yoki dashboard keladi)
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.XPATH, "//div[contains(text(),'Dashboard') or contains(text(),'Boshqaruv')]"))
-        )
-
-        cookies = driver.get_cookies()
-        print("✅ Cookie’lar olindi.")
-        return {cookie['name']: cookie['value'] for cookie in cookies}
+import pandas as pd
 
-    except Exception as e:
-        print(f"❌ Login muammosi: {e}")
-        return {}
+# repo ildizidagi umumiy modullar (smartup_session va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-    finally:
-        driver.quit()
+from smartup_session import get_session  # noqa: E402
 
 
-# === STEP 2: JSONni tahlil qilish ===
+# === STEP 1: JSONni tahlil qilish ===
 def explore_json(data, prefix=""):
     if isinstance(data, dict):
         for key, value in data.items():
@@ -56,15 +20,14 @@ def explore_json(data, prefix=""):
         yield prefix[:-1]
 
 
-# === STEP 3: Asosiy ishchi funksiya ===
-def fetch_and_export_data(data_url, export_file, email, password):
+# === STEP 2: Asosiy ishchi funksiya ===
+def fetch_and_export_data(data_url, export_file):
     try:
-        cookies = get_cookies_after_login("https://smartup.online", email, password)
-        if not cookies:
-            raise Exception("Cookie olishda muammo bo‘ldi (login muvaffaqiyatsiz)")
+        # login smartup_session'da (SMARTUP_USERNAME / SMARTUP_PASSWORD)
+        session = get_session()
 
         print("⬇️ Ma'lumot yuklanmoqda...")
-        response = requests.get(data_url, cookies=cookies)
+        response = session.get(data_url)
         response.raise_for_status()
 
         data = response.json()
@@ -107,10 +70,8 @@ def fetch_and_export_data(data_url, export_file, email, password):
             pass
 
 
-# === STEP 4: Ishga tushirish ===
+# === STEP 3: Ishga tushirish ===
 if __name__ == "__main__":
-    EMAIL = "powerbi@epco.com"
-    PASSWORD = "said_2021"
     DATA_URL = "https://smartup.online/b/anor/mxsx/mdeal/return$export"
     OUTPUT_FILE = "smartup_return_export.json"
-    fetch_and_export_data(DATA_URL, OUTPUT_FILE, EMAIL, PASSWORD)
+    fetch_and_export_data(DATA_URL, OUTPUT_FILE)
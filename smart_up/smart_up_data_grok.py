@@ -1,11 +1,10 @@
 import json
 import logging
+import os
 import sys
-import time
 from typing import Optional
 
 import pandas as pd
-import requests
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.chrome.options import Options
@@ -13,6 +12,11 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
+# repo ildizidagi umumiy modullar (smartup_stream va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartup_session import SessionManager, get_session  # noqa: E402
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -45,7 +49,6 @@ def get_cookies_with_login(login_url, dashboard_url, email, password) -> dict:
         logger.info("🌐 Saytga kirilmoqda...")
         driver.get(login_url)
         WebDriverWait(driver, 30).until(lambda d: d.execute_script("return document.readyState") == "complete")
-        time.sleep(5)
 
         driver.save_screenshot("login_page.png")
         with open("login_page.html", "w", encoding="utf-8") as f:
@@ -97,10 +100,10 @@ def explore_json(data, prefix="") -> list:
     return keys
 
 
-def fetch_and_export_data(data_url, output_file, cookies):
+def fetch_and_export_data(data_url, output_file, session):
     logger.info("⬇️ Ma'lumotlar yuklanmoqda...")
     try:
-        r = requests.get(data_url, cookies=cookies, timeout=30)
+        r = session.get(data_url, timeout=30)
         r.raise_for_status()
         data = r.json()
 
@@ -133,8 +136,14 @@ def fetch_and_export_data(data_url, output_file, cookies):
 
 if __name__ == "__main__":
     try:
-        cookies = get_cookies_with_login(LOGIN_URL, DASHBOARD_URL, EMAIL, PASSWORD)
-        fetch_and_export_data(DATA_URL, OUTPUT_FILE, cookies)
+        if os.environ.get("SMARTUP_AUTH_MODE") == "cookie":
+            # cookie rejimi: brauzer orqali login faqat kesh eskirganda yoki 401 kelganda
+            manager = SessionManager(mode="cookie", login=lambda: get_cookies_with_login(
+                LOGIN_URL, DASHBOARD_URL, EMAIL, PASSWORD))
+            session = manager.session()
+        else:
+            session = get_session()
+        fetch_and_export_data(DATA_URL, OUTPUT_FILE, session)
     except Exception as e:
         logger.error(f"🏁 Umumiy xatolik: {e}")
         sys.exit(1)
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+SmartUp $export javoblarining siqilgan arxivi va offline replay.
+
+Har bir javob tanasi (xom baytlar) o'zgartirilmasdan, siqilgan holda append-only segment fayllariga
+yoziladi; index.jsonl esa (endpoint, so'rov parametrlari) kaliti → blob joylashuvini saqlaydi:
+
+    <ARCHIVE_DIR>/seg-000001.dat   gzip/zstd bo'laklari ketma-ket
+    <ARCHIVE_DIR>/index.jsonl      {"key", "endpoint", "request", "window", "blob", "segment", "offset", ...}
+
+Blob'lar kontent bo'yicha adreslanadi (SHA-256 xom tana bo'yicha): bir xil javob ikkinchi marta
+yozilmaydi, faqat index'ga yangi satr qo'shiladi. Bir kalit bir necha marta yuklangan bo'lsa oxirgisi olinadi.
+
+Arxiv ish papkasidan tashqarida (~/.smartup/raw_archive) turadi va standart holatda hech narsa o'chirilmaydi:
+tarixiy oynalar bir marta yuklanadi, --replay ularni yillar o'tib ham arxivdan olishi kerak. Tozalash faqat
+qo'lda, aniq buyruq bilan — N kundan eski index yozuvlari va ularga bog'liq segmentlar (prune()):
+
+    python smartup_archive.py --prune 365
+
+Yuklash paytida:
+    for item in iter_archived_items(resp.iter_content(CHUNK_SIZE), "order", get_archive(), url, request):
+        ...
+Replay (tarmoqsiz):
+    for entry in get_archive().entries(url):
+        for item in iter_json_items(get_archive().iter_chunks(entry), "order"):
+            ...
+"""
+import hashlib
+import json
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from smartup_stream import iter_json_items
+
+ARCHIVE_DIR = os.environ.get("SMARTUP_ARCHIVE_DIR",
+                             os.path.join(os.path.expanduser("~"), ".smartup", "raw_archive"))
+ARCHIVE_ENABLED = os.environ.get("SMARTUP_ARCHIVE", "1") not in ("0", "false", "no")
+ARCHIVE_RETENTION_DAYS = int(os.environ.get("SMARTUP_ARCHIVE_RETENTION_DAYS", "0"))  # --prune standarti; 0 — cheksiz
+SEGMENT_MAX_BYTES = 256 << 20
+READ_CHUNK = 1 << 20
+
+try:  # zstd ixtiyoriy: o'rnatilmagan bo'lsa gzip
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+ARCHIVE_CODEC = os.environ.get("SMARTUP_ARCHIVE_CODEC", "zstd" if zstandard else "gzip")
+
+
+class ArchiveMiss(KeyError):
+    """Replay rejimida so'ralgan javob arxivda yo'q."""
+
+
+def request_key(endpoint: str, request) -> str:
+    raw = json.dumps([endpoint, request], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _compressor(codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compressobj()
+    return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 → gzip formati
+
+
+def _decompressor(codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Arxiv zstd bilan yozilgan, lekin 'zstandard' paketi o'rnatilmagan")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+class RawArchive:
+    def __init__(self, root: str = ARCHIVE_DIR, codec: str = ARCHIVE_CODEC, segment_max: int = SEGMENT_MAX_BYTES):
+        self.root = root
+        self.codec = codec
+        self.segment_max = segment_max
+        self.index_path = os.path.join(root, "index.jsonl")
+        self._lock = threading.Lock()
+        self._blobs = None  # blob sha → joylashuv
+        self._keys = None  # kalit → oxirgi index yozuvi
+
+    # ---- index ----
+    def _load(self):
+        if self._blobs is not None:
+            return
+        self._blobs, self._keys = {}, {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue  # uzilib qolgan oxirgi satr
+                    self._blobs.setdefault(e["blob"], e)
+                    self._keys[e["key"]] = e
+        except OSError:
+            pass
+
+    def _segments(self) -> list:
+        return sorted(n for n in os.listdir(self.root) if n.startswith("seg-") and n.endswith(".dat"))
+
+    def _segment_for(self, size: int) -> str:
+        segs = self._segments()
+        if segs:
+            last = os.path.join(self.root, segs[-1])
+            if os.path.getsize(last) + size <= self.segment_max:
+                return segs[-1]
+            # prune() eski segmentlarni o'chirgan bo'lishi mumkin — raqam soniga emas, oxirgisiga qarab
+            return f"seg-{int(segs[-1][4:-4]) + 1:06d}.dat"
+        return "seg-000001.dat"
+
+    def _commit(self, endpoint, request, window, sha, raw_len, codec, parts):
+        with self._lock:
+            self._load()
+            os.makedirs(self.root, exist_ok=True)
+            entry = {"key": request_key(endpoint, request), "endpoint": endpoint, "request": request,
+                     "window": list(window) if window else None, "blob": sha, "raw_bytes": raw_len,
+                     "ts": datetime.now().isoformat(timespec="seconds")}
+            blob = self._blobs.get(sha)
+            if blob is None:
+                length = sum(len(p) for p in parts)
+                segment = self._segment_for(length)
+                path = os.path.join(self.root, segment)
+                with open(path, "ab") as f:
+                    offset = f.tell()
+                    for p in parts:
+                        f.write(p)
+                blob = {"segment": segment, "offset": offset, "length": length, "codec": codec}
+            entry.update({k: blob[k] for k in ("segment", "offset", "length", "codec")})
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            self._blobs.setdefault(sha, entry)
+            self._keys[entry["key"]] = entry
+            return entry
+
+    # ---- yozish ----
+    def tee(self, endpoint: str, request, chunks, window=None):
+        """
+        Bo'laklarni o'zgartirmasdan uzatadi va bir vaqtda siqib, hash'laydi. Oqim oxirigacha o'qilgandagina
+        arxivga yoziladi (uzilib qolgan/yarim javob saqlanmaydi).
+        """
+        sha = hashlib.sha256()
+        comp = _compressor(self.codec)
+        parts, raw_len = [], 0
+        for chunk in chunks:
+            if not chunk:
+                continue
+            sha.update(chunk)
+            raw_len += len(chunk)
+            c = comp.compress(chunk)
+            if c:
+                parts.append(c)
+            yield chunk
+        parts.append(comp.flush())
+        self._commit(endpoint, request, window, sha.hexdigest(), raw_len, self.codec, parts)
+
+    def put(self, endpoint: str, request, body: bytes, window=None):
+        for _ in self.tee(endpoint, request, [body], window):
+            pass
+
+    # ---- saqlash muddati ----
+    def prune(self, max_age_days: int = ARCHIVE_RETENTION_DAYS) -> dict:
+        """
+        ts'i max_age_days dan eski index yozuvlarini tashlaydi (index.jsonl qayta yoziladi) va qolgan
+        yozuvlar murojaat qilmaydigan segmentlarni o'chiradi. Yangi yozuv eski segmentdagi blob'ni qayta
+        ishlatgan bo'lsa, segment saqlanib qoladi. Qaytadi: {"entries": tashlangan, "segments": o'chirilgan}.
+        """
+        stats = {"entries": 0, "segments": 0}
+        if max_age_days <= 0 or not os.path.isdir(self.root):
+            return stats
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat(timespec="seconds")
+        with self._lock:
+            self._load()
+            kept = []
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            e = json.loads(line)
+                        except ValueError:
+                            continue
+                        if e.get("ts", "") >= cutoff:
+                            kept.append(e)
+                        else:
+                            stats["entries"] += 1
+            except OSError:
+                return stats
+            if stats["entries"]:
+                tmp = self.index_path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for e in kept:
+                        f.write(json.dumps(e, ensure_ascii=False, default=str) + "\n")
+                os.replace(tmp, self.index_path)
+                self._blobs, self._keys = None, None
+                self._load()
+            used = {e["segment"] for e in kept}
+            for name in self._segments():
+                if name not in used:
+                    os.remove(os.path.join(self.root, name))
+                    stats["segments"] += 1
+        return stats
+
+    # ---- o'qish ----
+    def entries(self, endpoint: str, since: str = None, until: str = None) -> list:
+        """
+        endpoint bo'yicha har kalitning oxirgi yozuvi, window boshi bo'yicha tartiblangan.
+        since/until ("yyyy-mm-dd") berilsa — faqat shu oraliq bilan kesishgan oynalar.
+        """
+        with self._lock:
+            self._load()
+            out = [e for e in self._keys.values() if e["endpoint"] == endpoint]
+        if since or until:
+            def _hit(e):
+                w = e.get("window") or [None, None]
+                return (not until or not w[0] or w[0] <= until) and (not since or not w[1] or w[1] >= since)
+            out = [e for e in out if _hit(e)]
+        return sorted(out, key=lambda e: ((e.get("window") or [""])[0] or "", e["ts"]))
+
+    def find(self, endpoint: str, request):
+        with self._lock:
+            self._load()
+            return self._keys.get(request_key(endpoint, request))
+
+    def iter_chunks(self, entry):
+        """Index yozuvi → xom (siqilmagan) javob bo'laklari."""
+        d = _decompressor(entry.get("codec", "gzip"))
+        left = entry["length"]
+        with open(os.path.join(self.root, entry["segment"]), "rb") as f:
+            f.seek(entry["offset"])
+            while left > 0:
+                buf = f.read(min(READ_CHUNK, left))
+                if not buf:
+                    raise ValueError(f"Arxiv segmenti qisqa: {entry['segment']}")
+                left -= len(buf)
+                out = d.decompress(buf)
+                if out:
+                    yield out
+        tail = d.flush() if hasattr(d, "flush") else b""
+        if tail:
+            yield tail
+
+    def chunks_for(self, endpoint: str, request):
+        entry = self.find(endpoint, request)
+        if entry is None:
+            raise ArchiveMiss(f"Arxivda yo'q: {endpoint} {json.dumps(request, ensure_ascii=False, default=str)}")
+        return self.iter_chunks(entry)
+
+
+def iter_archived_items(chunks, key: str, archive: "RawArchive" = None, endpoint: str = None, request=None,
+                        window=None):
+    """
+    iter_json_items + arxivga yozish: archive berilsa, javob tanasi tee orqali saqlanadi.
+    Parser yopuvchi '}' da to'xtaydi — qolgan bo'laklar (oxirgi bo'sh joylar) ham o'qib olinadi, aks holda
+    tee tugamaydi va javob arxivlanmaydi.
+    """
+    if archive is None:
+        yield from iter_json_items(chunks, key)
+        return
+    stream = archive.tee(endpoint, request, chunks, window)
+    yield from iter_json_items(stream, key)
+    for _ in stream:
+        pass
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_archive(required: bool = False):
+    """
+    Umumiy arxiv. SMARTUP_ARCHIVE=0 bo'lsa yozish o'chiriladi (None), replay esa required=True bilan oladi.
+    Ochish arxivga tegmaydi — tozalash faqat `python smartup_archive.py --prune DAYS` bilan.
+    """
+    global _default
+    if not ARCHIVE_ENABLED and not required:
+        return None
+    with _default_lock:
+        if _default is None:
+            _default = RawArchive()
+        return _default
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SmartUp xom javoblar arxivi")
+    parser.add_argument("--prune", type=int, metavar="DAYS", nargs="?", const=ARCHIVE_RETENTION_DAYS,
+                        help="DAYS kundan eski yozuvlar va bo'shagan segmentlarni o'chirish "
+                             "(standart: SMARTUP_ARCHIVE_RETENTION_DAYS)")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help=f"arxiv papkasi (standart: {ARCHIVE_DIR})")
+    args = parser.parse_args()
+    if args.prune is None:
+        parser.print_help()
+    elif args.prune <= 0:
+        parser.error("--prune: kun soni musbat bo'lishi kerak (0 — cheksiz saqlash, hech narsa o'chirilmaydi)")
+    else:
+        stats = RawArchive(args.dir).prune(args.prune)
+        print(f"🧹 Arxiv: {stats['entries']} eski yozuv, {stats['segments']} segment o'chirildi (>{args.prune} kun)")
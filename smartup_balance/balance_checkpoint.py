@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+balance$export yuklashlari uchun checkpoint jurnali (append-only JSON Lines fayl).
+
+Har bir (scope, oyna) holati yoziladi:
+  {"run": ..., "event": "plan",   "scope_key": ..., "start": "2025-01-01", "finish": "2025-01-30"}
+  {"run": ..., "event": "done",   ..., "max_date": "2025-01-30", "rows": 1234}   — ma'lumot DB'da commit bo'lgach
+  {"run": ..., "event": "failed", ..., "error": "..."}                           — barcha urinishlardan keyin
+
+--resume faqat oxirgi run'ning "done" bo'lmagan (pending/failed) oynalarini qayta yuklaydi; resume yozuvlari
+ham shu run'ga qo'shiladi, shuning uchun resume'ni bir necha marta takrorlash mumkin.
+
+Jurnal cheksiz o'smaydi: yangi run boshlanganda faqat oxirgi KEEP_RUNS - 1 ta run yozuvlari qoldiriladi
+(fayl atomar qayta yoziladi) — resume'ga baribir faqat oxirgi run kerak.
+"""
+import json
+import os
+import threading
+import uuid
+from datetime import date, datetime
+
+_DAY = "%Y-%m-%d"
+KEEP_RUNS = 5  # jurnalda saqlanadigan run'lar (yangisi bilan birga)
+
+
+def _day(d) -> str:
+    return d.strftime(_DAY)
+
+
+class CheckpointJournal:
+    def __init__(self, path: str, keep_runs: int = KEEP_RUNS):
+        self.path = path
+        self.keep_runs = keep_runs
+        self.run_id = None
+        self._lock = threading.Lock()
+
+    # ---- yozish ----
+    def _append(self, records):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                for r in records:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _compact(self, keep: int):
+        """Faqat oxirgi keep ta run yozuvlarini qoldiradi (tmp fayl + os.replace)."""
+        records = list(self._records())
+        order = list(dict.fromkeys(r.get("run") for r in records))
+        if len(order) <= keep:
+            return
+        kept = set(order[-keep:]) if keep > 0 else set()
+        tmp = self.path + ".tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for r in records:
+                    if r.get("run") in kept:
+                        f.write(json.dumps(r, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+    def start_run(self, scopes) -> str:
+        """Yangi run: barcha rejalashtirilgan oynalar "plan" (pending) bo'lib yoziladi, eski run'lar tashlanadi."""
+        self._compact(self.keep_runs - 1)
+        self.run_id = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self._append({"run": self.run_id, "event": "plan", "scope_key": s["scope_key"],
+                      "start": _day(start), "finish": _day(finish)}
+                     for s in scopes for start, finish in s["windows"])
+        return self.run_id
+
+    def mark_done(self, windows):
+        """windows: [(scope_key, start, finish, max_date | None, rows)] — faqat commit'dan keyin chaqiriladi."""
+        self._append({"run": self.run_id, "event": "done", "scope_key": k, "start": _day(s), "finish": _day(f),
+                      "max_date": m.isoformat() if m else None, "rows": n}
+                     for k, s, f, m, n in windows)
+
+    def mark_failed(self, scope_key, start, finish, error):
+        self._append([{"run": self.run_id, "event": "failed", "scope_key": scope_key,
+                       "start": _day(start), "finish": _day(finish), "error": str(error)[:500]}])
+
+    # ---- o'qish ----
+    def _records(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue  # uzilib qolgan oxirgi satr
+        except OSError:
+            return
+
+    def load_last_run(self):
+        """
+        Oxirgi run'ni tiklaydi va self.run_id ni unga o'rnatadi.
+        Qaytadi: {(scope_key, start, finish): {"status": "pending|failed|done", "max_date": date|None, "rows": int}}
+        (jurnal bo'sh bo'lsa — None).
+        """
+        runs = {}
+        last = None
+        for r in self._records():
+            run = r.get("run")
+            windows = runs.setdefault(run, {})
+            key = (r["scope_key"], datetime.strptime(r["start"], _DAY), datetime.strptime(r["finish"], _DAY))
+            if r.get("event") == "plan":
+                windows.setdefault(key, {"status": "pending", "max_date": None, "rows": 0})
+                last = run
+            elif r.get("event") == "done":
+                m = r.get("max_date")
+                windows[key] = {"status": "done", "max_date": date.fromisoformat(m) if m else None,
+                                "rows": r.get("rows") or 0}
+            elif r.get("event") == "failed" and windows.get(key, {}).get("status") != "done":
+                windows[key] = {"status": "failed", "max_date": None, "rows": 0}
+        if last is None:
+            return None
+        self.run_id = last
+        return runs[last]
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Qiymatlarni SQL tiplariga keltirish: skalyar (to_date / to_float / safe_int) va ustunli (column) variantlar.
+
+Ustunli funksiyalar butun ustunni bir yo'la ishlaydi: qiymatlar pandas string amallari bilan tozalanadi,
+ma'lum formatlar (dd.mm.yyyy, yyyy-mm-dd, oddiy son) oldindan kompilyatsiya qilingan regex bilan ajratilib
+vektorli o'giriladi. Qolgan "g'alati" qiymatlar skalyar funksiyaga beriladi — shuning uchun NULL va
+yaroqsiz qiymatlar bo'yicha natija skalyar funksiyalar bilan aynan bir xil.
+
+Paritetni tekshirish:  python balance_coerce.py
+"""
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+import pandas as pd
+
+_WS_CHARS = "\u00A0\u202F\u2007"  # NBSP, thin space, figure space
+_WS_TABLE = str.maketrans({c: " " for c in _WS_CHARS})
+
+# Kichik ustunlarda pandas overhead'i foydadan katta — skalyar yo'l ishlatiladi
+COLUMNAR_MIN_ROWS = 256
+
+_RE_FLOAT_FAST = r"-?[0-9]+(?:\.[0-9]+)?"
+_RE_INT_FAST = r"-?[0-9]{1,18}"
+_RE_DATE_ISO = r"[0-9]{4}-[0-9]{2}-[0-9]{2}"
+_RE_DATE_DMY = r"[0-9]{2}\.[0-9]{2}\.[0-9]{4}"
+
+
+def _clean_str(s: str) -> str:
+    return s.translate(_WS_TABLE).strip()
+
+
+# ====== SKALYAR ======
+def to_date(val):
+    """Matn/iso datetime -> date (yaroqsiz bo'lsa None)."""
+    if val is None:
+        return None
+    s = _clean_str(str(val))
+    if not s:
+        return None
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(s[:10], fmt).date()
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(s[:19]).date()
+    except Exception:
+        return None
+
+
+def to_float(val):
+    """Har xil formatdagi sonlarni (NBSP, vergul, NaN, —, va h.k.) DECIMAL(18,4) ga mos float qiladi."""
+    if val is None:
+        return None
+    s = _clean_str(str(val))
+    if s == "" or s.lower() in {"null", "nan"} or s in {"-", "—"}:
+        return None
+    s = s.replace(" ", "")  # ming ajratkichlarni olib tashlash
+    s = s.replace(",", ".")  # vergul -> nuqta
+    s = re.sub(r"[^0-9\.\-]", "", s)  # faqat raqam, nuqta, minus
+    if s in {"", "-", ".", "-.", ".-"}:
+        return None
+    try:
+        return float(Decimal(s))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def safe_int(val):
+    if val is None:
+        return None
+    s = _clean_str(str(val))
+    if s == "" or s.lower() in {"null", "nan"} or s in {"-", "—"}:
+        return None
+    s = s.replace(" ", "")
+    s = re.sub(r"[^0-9\-]", "", s)
+    if s in {"", "-"}:
+        return None
+    try:
+        return int(s)
+    except ValueError:
+        try:
+            return int(float(s))
+        except Exception:
+            return None
+
+
+# ====== USTUNLI ======
+def _cleaned(values):
+    """
+    Qaytadi: (out, idx, cleaned)
+      out     — natija uchun None bilan to'ldirilgan object massiv
+      idx     — NULL bo'lmagan qiymatlar indekslari
+      cleaned — ularning _clean_str(str(val)) ko'rinishi (object dtype, Python str semantikasi)
+    """
+    s = pd.Series(values, dtype=object)
+    out = np.full(len(s), None, dtype=object)
+    notnull = s.notna().to_numpy()  # None / NaN / NaT skalyar yo'lda ham None beradi
+    idx = np.flatnonzero(notnull)
+    cleaned = s[notnull].map(str).astype(object).str.translate(_WS_TABLE).str.strip().astype(object)
+    return out, idx, cleaned
+
+
+def _fallback(out, idx, values, mask, func):
+    """Tez yo'lga tushmagan qiymatlar uchun skalyar funksiya."""
+    for i in idx[mask]:
+        out[i] = func(values[i])
+
+
+def to_date_column(values) -> list:
+    """Ustun bo'yicha to_date. Natija: datetime.date yoki None ro'yxati."""
+    values = list(values)
+    if len(values) < COLUMNAR_MIN_ROWS:
+        return [to_date(v) for v in values]
+    out, idx, cleaned = _cleaned(values)
+    s10 = cleaned.str.slice(0, 10)
+    done = np.zeros(len(idx), dtype=bool)
+    for pattern, fmt in ((_RE_DATE_ISO, "%Y-%m-%d"), (_RE_DATE_DMY, "%d.%m.%Y")):
+        m = s10.str.fullmatch(pattern).fillna(False).to_numpy(dtype=bool) & ~done
+        if not m.any():
+            continue
+        parsed = pd.to_datetime(s10[m], format=fmt, errors="coerce")
+        ok = parsed.notna().to_numpy()
+        out[idx[m][ok]] = parsed[ok].dt.date.to_numpy(dtype=object)
+        sel = np.flatnonzero(m)
+        done[sel[ok]] = True
+    _fallback(out, idx, values, ~done, to_date)
+    return out.tolist()
+
+
+def to_float_column(values) -> list:
+    """Ustun bo'yicha to_float. Natija: float yoki None ro'yxati."""
+    values = list(values)
+    if len(values) < COLUMNAR_MIN_ROWS:
+        return [to_float(v) for v in values]
+    out, idx, cleaned = _cleaned(values)
+    fast = cleaned.str.fullmatch(_RE_FLOAT_FAST).fillna(False).to_numpy(dtype=bool)
+    if fast.any():
+        # object → float64 har bir satrga float() qo'llaydi: yaxlitlash Decimal bilan aynan bir xil
+        out[idx[fast]] = cleaned[fast].to_numpy().astype(np.float64).astype(object)
+    _fallback(out, idx, values, ~fast, to_float)
+    return out.tolist()
+
+
+def safe_int_column(values) -> list:
+    """Ustun bo'yicha safe_int. Natija: int yoki None ro'yxati."""
+    values = list(values)
+    if len(values) < COLUMNAR_MIN_ROWS:
+        return [safe_int(v) for v in values]
+    out, idx, cleaned = _cleaned(values)
+    fast = cleaned.str.fullmatch(_RE_INT_FAST).fillna(False).to_numpy(dtype=bool)
+    if fast.any():
+        out[idx[fast]] = cleaned[fast].to_numpy().astype(np.int64).astype(object)
+    _fallback(out, idx, values, ~fast, safe_int)
+    return out.tolist()
+
+
+# ====== PARITET ======
+PARITY_SAMPLES = [
+    None, "", " ", "\u00A0", "null", "NULL", "nan", "NaN", "-", "—", ".", "-.", ".-",
+    0, 1, -1, 0.0, 1.5, -2.25, 1e-05, 1e20, float("nan"), True, False,
+    "0", "12", "-12", "007", "12.5", "-0.5", ".5", "5.", "1 200,50", "1\u00A0200,50", "1 200.5",
+    "1,5", "1.2.3", "1-2", "--5", "+5", "5e3", "abc", "12abc", "  42  ", "99999999999999999999",
+    "123456789012345678", "1234567890123456789",
+    "2025-01-15", "2025-1-5", "2025-02-30", "15.01.2025", "5.1.2025", "31.02.2025", "15.01.25",
+    "2025-01-15T10:20:30", "2025-01-15 10:20:30", "2025-01-15T10:20:30+05:00", "20250115",
+    " 15.01.2025 ", "15.01.2025 12:00", "\u0661\u0662.\u0660\u0661.\u0662\u0660\u0662\u0665", "2025/01/15",
+]
+
+
+def check_parity(samples=None, repeat: int = COLUMNAR_MIN_ROWS) -> int:
+    """
+    Ustunli funksiyalarni skalyar funksiyalar bilan solishtiradi. Qaytadi: farqlar soni.
+    Namunalar COLUMNAR_MIN_ROWS dan oshadigan qilib takrorlanadi — aks holda faqat skalyar yo'l sinaladi.
+    """
+    samples = list(PARITY_SAMPLES if samples is None else samples)
+    column = samples * max(1, -(-repeat // max(1, len(samples))))
+    mismatches = 0
+    for scalar, columnar in ((to_date, to_date_column), (to_float, to_float_column), (safe_int, safe_int_column)):
+        got = columnar(column)
+        for v, g in zip(column[:len(samples)], got[:len(samples)]):
+            exp = scalar(v)
+            same = (exp == g and type(exp) is type(g)) or (exp is None and g is None)
+            if not same:
+                mismatches += 1
+                print(f"❌ {scalar.__name__}({v!r}): skalyar={exp!r}, ustunli={g!r}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    n = check_parity()
+    print("✅ Paritet: farq yo'q" if n == 0 else f"❌ Paritet: {n} ta farq")
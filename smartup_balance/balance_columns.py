@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Ixcham ustunli (columnar) bufer uchun konteynerlar.
+
+Tuple'lar ro'yxati o'rniga har bir ustun alohida tipli massivda saqlanadi:
+  - ValueDict   — takrorlanuvchi matnlar (kodlar, nomlar) lug'at bilan kodlanadi, qatorda faqat int32 kod turadi;
+  - FixedBytes  — bir xil uzunlikdagi kalitlar (balance_id) bitta bytearray'da;
+  - KeyIndex    — dedupe uchun kalitlar to'plami: saralangan numpy bo'laklari (LSM), har kalit uchun faqat
+                  kalit baytlari (+ ixtiyoriy int32 tartib raqami) sarflanadi, tekshirish esa butun oyna bo'yicha
+                  vektorli. Kalit bayt (np.void) yoki int64 bo'lishi mumkin — Group/Condition kalitlari
+                  (fact tartib raqami, kod) juftligi bitta int64'ga joylanadi.
+
+Python obyektlari (tuple, bytes, str, date) faqat staging'ga yozish paytida, qator-baqator tiklanadi.
+
+Tekshirish:  python balance_columns.py
+"""
+import numpy as np
+
+NULL_CODE = -1
+INT_NULL = -(1 << 63)  # array('q') da None
+
+
+class ValueDict:
+    """Qiymat → int kod. None → NULL_CODE. 1, 1.0 va True bir-biridan farqlanadi (kalit tip bilan)."""
+
+    def __init__(self):
+        self._codes = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, v) -> int:
+        if v is None:
+            return NULL_CODE
+        key = (v.__class__, v)
+        c = self._codes.get(key)
+        if c is None:
+            c = len(self.values)
+            self._codes[key] = c
+            self.values.append(v)
+        return c
+
+    def value(self, c: int):
+        return None if c == NULL_CODE else self.values[c]
+
+
+class FixedBytes:
+    """Bir xil uzunlikdagi bayt qiymatlar ustuni (bytearray ichida ketma-ket)."""
+
+    def __init__(self, width: int):
+        self.width = width
+        self.data = bytearray()
+
+    def __len__(self):
+        return len(self.data) // self.width
+
+    def append(self, b: bytes):
+        if len(b) != self.width:
+            raise ValueError(f"FixedBytes: {self.width} bayt kutilgan, {len(b)} keldi")
+        self.data += b
+
+    def __getitem__(self, i: int) -> bytes:
+        w = self.width
+        return bytes(self.data[i * w:(i + 1) * w])
+
+
+class KeyIndex:
+    """
+    Kalitlar to'plami (faqat qo'shish). Kalitlar saralangan bo'laklarda saqlanadi; bo'laklar ikkilik hisoblagich
+    kabi birlashtiriladi — bo'laklar soni O(log n), qo'shish amortizatsiyalangan O(log n) va hammasi numpy ichida.
+    key: int (bayt kenglik, np.void) yoki numpy dtype (masalan np.int64).
+    with_ids=True bo'lsa har kalitga qo'shilish tartibidagi raqami (0, 1, ...) yoniga int32 bo'lib yoziladi
+    va add() barcha kalitlar uchun shu raqamlarni ham qaytaradi.
+    """
+
+    def __init__(self, key, with_ids: bool = False):
+        self.dtype = np.dtype(f"V{key}") if isinstance(key, int) else np.dtype(key)
+        self.width = self.dtype.itemsize
+        self.with_ids = with_ids
+        self._runs = []  # (saralangan kalitlar, ularning raqamlari | None)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def keys(self, parts) -> np.ndarray:
+        """Bayt kalitlar ro'yxati → np.void massivi."""
+        return np.frombuffer(b"".join(parts), dtype=self.dtype) if parts else np.empty(0, dtype=self.dtype)
+
+    def add(self, keys: np.ndarray):
+        """
+        Kalitlarni qo'shadi. Qaytadi: bool maska — kalit yangi bo'lsa va massiv ichida birinchi uchrashi bo'lsa True
+        (ya'ni tartib bo'yicha "birinchisi yutadi", set bilan dedupe qilishdagi kabi).
+        with_ids=True bo'lsa: (maska, raqamlar) — raqamlar int64, har kalit uchun (eskisi ham, yangisi ham).
+        """
+        n = len(keys)
+        mask = np.zeros(n, dtype=bool)
+        if not n:
+            return (mask, np.empty(0, dtype=np.int64)) if self.with_ids else mask
+        uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        found = np.zeros(len(uniq), dtype=bool)
+        ids = np.full(len(uniq), -1, dtype=np.int64) if self.with_ids else None
+        for run, run_ids in self._runs:
+            pos = np.searchsorted(run, uniq)
+            inside = pos < len(run)
+            hit = np.zeros(len(uniq), dtype=bool)
+            hit[inside] = run[pos[inside]] == uniq[inside]
+            found |= hit
+            if ids is not None:
+                ids[hit] = run_ids[pos[hit]]
+        new = np.flatnonzero(~found)  # uniq ichidagi indekslar — kalit bo'yicha saralangan
+        mask[first[new]] = True
+        if len(new):
+            run_ids = None
+            if ids is not None:
+                # yangi raqamlar massivdagi birinchi uchrash tartibida beriladi
+                ids[new[np.argsort(first[new], kind="stable")]] = self._n + np.arange(len(new))
+                run_ids = ids[new].astype(np.int32)
+            self._runs.append((uniq[new], run_ids))
+            self._n += len(new)
+            while len(self._runs) > 1 and len(self._runs[-2][0]) <= 2 * len(self._runs[-1][0]):
+                b, b_ids = self._runs.pop()
+                a, a_ids = self._runs.pop()
+                merged = np.concatenate((a, b))
+                order = np.argsort(merged, kind="stable")
+                self._runs.append((merged[order], None if a_ids is None else np.concatenate((a_ids, b_ids))[order]))
+        if ids is None:
+            return mask
+        return mask, ids[inverse.reshape(-1)]
+
+    def nbytes(self) -> int:
+        return sum(r.nbytes + (0 if i is None else i.nbytes) for r, i in self._runs)
+
+
+def _self_check() -> int:
+    """ValueDict / FixedBytes / KeyIndex'ni oddiy Python set/list bilan solishtiradi. Qaytadi: xatolar soni."""
+    import os
+    import random
+
+    errors = 0
+    d = ValueDict()
+    samples = [None, "a", "b", "a", 1, 1.0, True, "", 0, False, None, "b"]
+    codes = [d.code(v) for v in samples]
+    back = [d.value(c) for c in codes]
+    if any(x is not y and (x != y or type(x) is not type(y)) for x, y in zip(samples, back)):
+        errors += 1
+        print(f"❌ ValueDict: {samples} → {back}")
+
+    fb = FixedBytes(4)
+    for i in range(5):
+        fb.append(i.to_bytes(4, "big"))
+    if [fb[i] for i in range(5)] != [i.to_bytes(4, "big") for i in range(5)]:
+        errors += 1
+        print("❌ FixedBytes")
+
+    rnd = random.Random(1)
+    pool = [os.urandom(16) for _ in range(3000)]
+    idx, seen = KeyIndex(16), set()
+    for _ in range(200):
+        batch = [rnd.choice(pool) for _ in range(rnd.randint(0, 60))]
+        got = idx.add(idx.keys(batch)).tolist()
+        exp = []
+        for k in batch:
+            exp.append(k not in seen)
+            seen.add(k)
+        if got != exp:
+            errors += 1
+            print("❌ KeyIndex: set bilan mos emas")
+            break
+    if len(idx) != len(seen):
+        errors += 1
+        print(f"❌ KeyIndex: {len(idx)} != {len(seen)}")
+
+    # int64 kalitlar + tartib raqamlari (dict bilan solishtiriladi)
+    idx, order = KeyIndex(np.int64, with_ids=True), {}
+    for _ in range(200):
+        batch = [rnd.randrange(-5000, 5000) << 20 for _ in range(rnd.randint(0, 60))]
+        mask, ids = idx.add(np.array(batch, dtype=np.int64))
+        exp_mask = []
+        for k in batch:
+            exp_mask.append(k not in order)
+            order.setdefault(k, len(order))
+        if mask.tolist() != exp_mask or ids.tolist() != [order[k] for k in batch]:
+            errors += 1
+            print("❌ KeyIndex(int64, with_ids): dict bilan mos emas")
+            break
+    return errors
+
+
+if __name__ == "__main__":
+    n = _self_check()
+    print("✅ balance_columns: xato yo'q" if n == 0 else f"❌ balance_columns: {n} ta xato")
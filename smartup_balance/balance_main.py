@@ -1,15 +1,41 @@
 # -*- coding: utf-8 -*-
+import csv
 import hashlib
 import json
+import argparse
+import os
 import platform
-import re
+import queue
+import random
 import sys
-from datetime import datetime, timedelta
-from decimal import Decimal, InvalidOperation
-
+import tempfile
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+from urllib.parse import urlsplit
+
+import numpy as np
 import pyodbc
 import requests
 
+# repo ildizidagi umumiy modullar (smartup_stream va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartup_session import get_session  # noqa: E402
+from smartup_archive import get_archive, iter_archived_items  # noqa: E402
+from smartup_metrics import METRICS, metered_chunks, timer  # noqa: E402
+from smartup_stream import CHUNK_SIZE, iter_json_items  # noqa: E402
+from balance_coerce import (  # noqa: E402
+    _clean_str, safe_int, to_date, to_date_column, to_float, to_float_column,
+)
+from balance_columns import FixedBytes, KeyIndex, ValueDict  # noqa: E402
+from balance_checkpoint import CheckpointJournal  # noqa: E402
+
 print(sys.getdefaultencoding())
 
 # ====== KONFIG ======
@@ -36,10 +62,77 @@ COLLATION = "Cyrillic_General_CI_AS"
 # ====== INCREMENTAL SETTINGS ======
 INCREMENTAL_BUFFER_DAYS = 3
 
-# ====== UTIL ======
-_WS_CHARS = "\u00A0\u202F\u2007"  # NBSP, thin space, figure space
-_WS_TABLE = str.maketrans({c: " " for c in _WS_CHARS})
+# ====== BALANCE KEY ======
+# "binary": balance_id = SHA-256 ning birinchi 16 bayti → BINARY(16) (indekslar ~4x kichik)
+# "hex":    eski format, 64 belgili hex → CHAR(64)
+BALANCE_KEY_MODE = "binary"
+BALANCE_ID_SQL = "BINARY(16)" if BALANCE_KEY_MODE == "binary" else "CHAR(64)"
+BALANCE_KEY_BYTES = 16
+
+# ====== O'ZGARISHNI ANIQLASH (row_hash) ======
+# Fact qatorining kontent hash'i staging paytida hisoblanadi va FactBalance.row_hash'da saqlanadi.
+# MERGE faqat hash'i farq qilgan qatorlarni UPDATE qiladi (INCREMENTAL_BUFFER_DAYS qayta yuklashlari deyarli o'zgarmaydi).
+ROW_HASH_BYTES = 16
+ROW_HASH_SQL = f"BINARY({ROW_HASH_BYTES})"
+
+# ====== SAQLASH REJIMI ======
+# "daily":  FactBalance — har (ombor, mahsulot, partiya, kun) uchun bitta qator (standart)
+# "ranges": FactBalanceRange — ketma-ket kunlardagi bir xil snapshot'lar [valid_from, valid_to] oralig'iga
+#           yig'iladi (SCD2). Kun bo'yicha holat: SELECT * FROM dbo.fn_BalanceAsOf('2025-03-01')
+BALANCE_STORAGE = "daily"
+RANGE_TABLE = "dbo.FactBalanceRange"
+RANGE_GROUP_TABLE = "dbo.BalanceRangeGroup"
+RANGE_CONDITION_TABLE = "dbo.BalanceRangeCondition"
+RANGE_ASOF_FUNCTION = "dbo.fn_BalanceAsOf"
+
+# ====== FACT LAYOUT ======
+# "rowstore":    PK(balance_id) + FK'lar, MERGE orqali yuklash (standart)
+# "partitioned": balance_date bo'yicha oylik partition; yuklash oyni staging jadvalda yig'ib
+#                partition SWITCH qilish orqali. Group/Condition'dan FK olib tashlanadi (SWITCH/TRUNCATE talabi).
+FACT_LAYOUT = "rowstore"
+FACT_COMPRESSION = "columnstore"  # partitioned rejimda: "columnstore" (clustered columnstore) yoki "page"
+PARTITION_FUNCTION = "pf_BalanceMonth"
+PARTITION_SCHEME = "ps_BalanceMonth"
+PARTITION_FILEGROUP = "PRIMARY"
+PARTITION_START = date(2025, 1, 1)
+PARTITION_MONTHS_AHEAD = 3  # oldindan ochib qo'yiladigan bo'sh oylar (SPLIT bo'sh partition'da arzon)
+
+# ====== CONCURRENCY SETTINGS ======
+HOST_MAX_CONCURRENCY = {"smartup.online": 4}  # host bo'yicha bir vaqtdagi so'rovlar chegarasi
+DEFAULT_HOST_CONCURRENCY = 4
+# parallel balance$export so'rovlari (thread pool): host chegarasidan ko'p thread semaphore'da bekor turadi
+FETCH_WORKERS = HOST_MAX_CONCURRENCY.get(urlsplit(URL).hostname or "", DEFAULT_HOST_CONCURRENCY)
+PREFETCH_WINDOWS = 16  # tartibda kutayotgan (yuklangan/yuklanayotgan) oynalar chegarasi
+ITEM_BATCH = 2000  # oqimdan buferga bir yo'la beriladigan balance item'lari
+WINDOW_QUEUE_BATCHES = 2  # har oyna uchun navbatda turadigan partiyalar (xotira ≈ PREFETCH × shu × ITEM_BATCH item)
+
+# ====== RETRY / CHECKPOINT ======
+FETCH_RETRIES = 4  # birinchi urinishdan keyingi qayta urinishlar soni
+FETCH_BACKOFF_BASE = 2.0  # soniya: 2, 4, 8, ... (+ jitter)
+FETCH_BACKOFF_MAX = 60.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+CHECKPOINT_FILE = os.environ.get("SMARTUP_BALANCE_CHECKPOINT",
+                                 os.path.join(os.path.expanduser("~"), ".smartup", "balance_checkpoint.jsonl"))
+
+# ====== ROW BUFFER ======
+ROW_BUFFER = "columnar"  # "columnar" (tipli massivlar + KeyIndex) yoki "tuples" (tuple ro'yxatlari + set)
+STAGING_CHUNK_ROWS = 50_000  # columnar bufer executemany'ga shu o'lchamdagi bo'laklarda beriladi
+
+# ====== PIPELINE SETTINGS ======
+PIPELINE_MODE = True  # True: batch'lab staging+MERGE+commit; False: hammasini yig'ib bitta MERGE
+PIPELINE_BATCH_ROWS = 200_000  # Fact+Group+Condition qatorlari shu songa yetganda flush
+
+# ====== STAGING WRITER ======
+STAGING_WRITER = "executemany"  # "executemany" (fast_executemany) yoki "bulk" (CSV + BULK INSERT)
+BULK_DIR = tempfile.gettempdir()  # SQL Server servisi o'qiy oladigan papka bo'lishi shart
+BULK_BATCH_SIZE = 100_000
+BULK_TABLOCK = True
+
+# ====== PARSER SETTINGS ======
+STREAM_JSON = True  # javobni oqim rejimida parse qilish (butun tanani xotiraga olmasdan)
+REPLAY = False  # --replay: javoblar tarmoqdan emas, smartup_archive'dan o'qiladi
 
+# ====== UTIL ======
 
 def today_samarkand_date():
     # Asia/Samarkand = UTC+5 (DST yo‘q)
@@ -93,65 +186,6 @@ def connect_sql():
     return conn
 
 
-def _clean_str(s: str) -> str:
-    return s.translate(_WS_TABLE).strip()
-
-
-def to_date(val):
-    """Matn/iso datetime -> date (yaroqsiz bo'lsa None)."""
-    if val is None:
-        return None
-    s = _clean_str(str(val))
-    if not s:
-        return None
-    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
-        try:
-            return datetime.strptime(s[:10], fmt).date()
-        except ValueError:
-            pass
-    try:
-        return datetime.fromisoformat(s[:19]).date()
-    except Exception:
-        return None
-
-
-def to_float(val):
-    """Har xil formatdagi sonlarni (NBSP, vergul, NaN, —, va h.k.) DECIMAL(18,4) ga mos float qiladi."""
-    if val is None:
-        return None
-    s = _clean_str(str(val))
-    if s == "" or s.lower() in {"null", "nan"} or s in {"-", "—"}:
-        return None
-    s = s.replace(" ", "")  # ming ajratkichlarni olib tashlash
-    s = s.replace(",", ".")  # vergul -> nuqta
-    s = re.sub(r"[^0-9\.\-]", "", s)  # faqat raqam, nuqta, minus
-    if s in {"", "-", ".", "-.", ".-"}:
-        return None
-    try:
-        return float(Decimal(s))
-    except (InvalidOperation, ValueError):
-        return None
-
-
-def safe_int(val):
-    if val is None:
-        return None
-    s = _clean_str(str(val))
-    if s == "" or s.lower() in {"null", "nan"} or s in {"-", "—"}:
-        return None
-    s = s.replace(" ", "")
-    s = re.sub(r"[^0-9\-]", "", s)
-    if s in {"", "-"}:
-        return None
-    try:
-        return int(s)
-    except ValueError:
-        try:
-            return int(float(s))
-        except Exception:
-            return None
-
-
 def sha256(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
@@ -173,6 +207,55 @@ def make_balance_id(warehouse_id, product_id, batch_number, balance_date) -> str
     return sha256("|".join(parts))
 
 
+def make_balance_key(warehouse_id, product_id, batch_number, balance_date):
+    """BALANCE_KEY_MODE bo'yicha kalit: binary → 16 bayt, hex → 64 belgili matn (make_balance_id)."""
+    return make_balance_ids(warehouse_id, [(product_id, batch_number, balance_date)])[0]
+
+
+def make_balance_ids(warehouse_id, keys):
+    """
+    Bitta ombor uchun kalitlarni to'plam (batch) bo'lib hisoblaydi.
+    keys: [(product_id, batch_number, balance_date), ...]
+    Kalit make_balance_id bilan bir xil satrdan olinadi, binary rejimda esa SHA-256 digest'ning
+    birinchi BALANCE_KEY_BYTES bayti qaytadi — ya'ni eski hex kalitning boshidan olingan qism
+    (migratsiya shuni SQL ichida CONVERT bilan hisoblaydi).
+    """
+    if BALANCE_KEY_MODE != "binary":
+        return [make_balance_id(warehouse_id, p, b, d) for p, b, d in keys]
+
+    _sha = hashlib.sha256
+    n = BALANCE_KEY_BYTES
+    prefix = str(warehouse_id or "") + "|"
+    out = []
+    append = out.append
+    for product_id, batch_number, balance_date in keys:
+        if isinstance(balance_date, datetime):
+            date_str = balance_date.date().isoformat()
+        elif hasattr(balance_date, "isoformat"):
+            date_str = balance_date.isoformat()
+        else:
+            date_str = str(balance_date or "")
+        s = f"{prefix}{product_id or ''}|{batch_number or ''}|{date_str}"
+        append(_sha(s.encode("utf-8")).digest()[:n])
+    return out
+
+
+def _hash_text(v) -> str:
+    if v is None:
+        return "\x00"
+    if isinstance(v, float):
+        return f"{v:.4f}"  # DECIMAL(18,4) aniqligida — saqlanmaydigan farqlar hash'ni o'zgartirmaydi
+    if hasattr(v, "isoformat"):
+        return v.isoformat()
+    return str(v)
+
+
+def make_row_hash(values) -> bytes:
+    """Fact qatori kontenti (balance_id'siz ustunlar) → ROW_HASH_BYTES baytli blake2b digest."""
+    s = "\x1f".join(_hash_text(v) for v in values)
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=ROW_HASH_BYTES).digest()
+
+
 # ====== AUTO DTYPE INFERENCE (add-only) ======
 
 def _round_nvarchar_len(n: int) -> int:
@@ -187,103 +270,145 @@ def _round_nvarchar_len(n: int) -> int:
     return -1  # NVARCHAR(MAX)
 
 
-def _is_all_none(values):
-    return all(v is None or (isinstance(v, str) and _clean_str(v) == "") for v in values)
-
-
-def _looks_int(s):
-    try:
-        return safe_int(s) is not None
-    except Exception:
-        return False
-
-
-def _looks_float(s):
-    try:
-        return to_float(s) is not None
-    except Exception:
-        return False
-
-
-def _looks_date(s):
-    try:
-        return to_date(s) is not None
-    except Exception:
-        return False
-
-
-def _has_fraction(values):
-    """Agar sonlarda kasr qismi uchrasa True."""
-    for v in values:
-        f = to_float(v)
-        if f is not None and abs(f - int(f)) > 1e-12:
-            return True
-    return False
+class ColumnProfile:
+    """
+    Bitta ustun uchun bir o'tishli (single-pass) statistika: null soni, butun/kasr/sana belgilari,
+    butun qiymatlar diapazoni va matn uzunligi. Har bir qiymat ko'pi bilan bir marta parse qilinadi;
+    biror gipoteza (sana / son) rad etilgach, u uchun parse to'xtatiladi.
+    """
+    __slots__ = ("count", "nulls", "all_date", "all_numeric", "has_fraction", "float_not_int",
+                 "float_count", "max_abs", "overflow", "max_len")
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.all_date = True
+        self.all_numeric = True
+        self.has_fraction = False
+        self.float_not_int = False
+        self.float_count = 0
+        self.max_abs = 0
+        self.overflow = False
+        self.max_len = 0
+
+    def update(self, v):
+        self.count += 1
+        if v is None:
+            self.nulls += 1
+            return
+        s = _clean_str(str(v))
+        if s == "" and isinstance(v, str):
+            self.nulls += 1
+            return
+        if len(s) > self.max_len:
+            self.max_len = len(s)
+
+        if self.all_date and to_date(v) is None:
+            self.all_date = False
+
+        if self.all_numeric:
+            is_int = safe_int(v) is not None
+            f = to_float(v)
+            if not is_int and f is None:
+                self.all_numeric = False
+                return
+            if f is not None:
+                self.float_count += 1
+                if not is_int:
+                    self.float_not_int = True
+                try:
+                    whole = int(f)
+                except (OverflowError, ValueError):
+                    self.overflow = True
+                    return
+                if abs(f - whole) > 1e-12:
+                    self.has_fraction = True
+                if abs(whole) > self.max_abs:
+                    self.max_abs = abs(whole)
+
+    @property
+    def non_null(self) -> int:
+        return self.count - self.nulls
+
+    def sql_type(self) -> str:
+        """
+        Statistikaga qarab oqilona SQL tipini qaytaradi:
+          - Hammasi bo‘sh/None → NVARCHAR(100)
+          - Barchasi sana → DATE
+          - Barchasi raqam: kasr bo‘lsa DECIMAL(18,4); aks holda INT/BIGINT/DECIMAL(38,0)
+          - Boshqa holat → NVARCHAR(rounded) COLLATE {COLLATION}
+        """
+        if self.non_null == 0:
+            return f"NVARCHAR(100) COLLATE {COLLATION}"
+        if self.all_date:
+            return "DATE"
+        if self.all_numeric:
+            if self.has_fraction or self.float_not_int or self.overflow or self.float_count == 0:
+                return "DECIMAL(18,4)"
+            if self.max_abs <= 2_147_483_647:
+                return "INT"
+            if self.max_abs <= 9_223_372_036_854_775_807:
+                return "BIGINT"
+            return "DECIMAL(38,0)"
+        rounded = _round_nvarchar_len(self.max_len)
+        if rounded == -1:
+            return f"NVARCHAR(MAX) COLLATE {COLLATION}"
+        return f"NVARCHAR({rounded}) COLLATE {COLLATION}"
 
 
-def infer_sql_type_for_column(values) -> str:
+class SchemaProfiler:
     """
-    Ustun qiymatlariga qarab oqilona SQL tipini qaytaradi:
-      - Hammasi bo‘sh/None → NVARCHAR(100)
-      - Barchasi sana → DATE
-      - Barchasi raqam: kasr bo‘lsa DECIMAL(18,4); aks holda INT/BIGINT/DECIMAL(38,0)
-      - Boshqa holat → NVARCHAR(rounded) COLLATE {COLLATION}
+    Qatorlar oqimi bo'yicha har bir ustunga ColumnProfile yuritadi. Qatorlarni xotirada saqlamaydi,
+    shuning uchun generator yoki batch'lar ketma-ketligi ustidan ham ishlaydi.
+    sample_every=N — har N-qatorning faqat bittasi profil qilinadi (keng/katta eksportlar uchun).
     """
-    vals = list(values)
 
-    if _is_all_none(vals):
-        return f"NVARCHAR(100) COLLATE {COLLATION}"
+    def __init__(self, column_names, sample_every: int = 1):
+        self.column_names = list(column_names)
+        self.profiles = [ColumnProfile() for _ in self.column_names]
+        self.sample_every = max(1, int(sample_every))
+        self.rows_seen = 0
+
+    def update_rows(self, rows):
+        step = self.sample_every
+        profiles = self.profiles
+        for r in rows:
+            self.rows_seen += 1
+            if step > 1 and (self.rows_seen - 1) % step:
+                continue
+            for p, val in zip(profiles, r):
+                p.update(val)
+        return self
+
+    def update_batches(self, batches):
+        for batch in batches:
+            self.update_rows(batch)
+        return self
 
-    # Date?
-    non_null = [v for v in vals if v is not None and not (isinstance(v, str) and _clean_str(v) == "")]
-    if non_null and all(_looks_date(v) for v in non_null):
-        return "DATE"
+    def schema(self) -> dict:
+        return {col: p.sql_type() for col, p in zip(self.column_names, self.profiles)}
 
-    # Numeric?
-    if non_null and all(_looks_int(v) or _looks_float(v) for v in non_null):
-        if _has_fraction(non_null) or any(_looks_float(v) and not _looks_int(v) for v in non_null):
-            return "DECIMAL(18,4)"
-        try:
-            max_abs = max(abs(int(to_float(v))) for v in non_null if to_float(v) is not None)
-            if max_abs <= 2_147_483_647:
-                return "INT"
-            if max_abs <= 9_223_372_036_854_775_807:
-                return "BIGINT"
-            return "DECIMAL(38,0)"
-        except Exception:
-            return "DECIMAL(18,4)"
 
-    # Text — maksimal uzunlikka qarab
-    max_len = 0
-    for v in non_null:
-        s = _clean_str(str(v))
-        if len(s) > max_len:
-            max_len = len(s)
-    rounded = _round_nvarchar_len(max_len)
-    if rounded == -1:
-        return f"NVARCHAR(MAX) COLLATE {COLLATION}"
-    return f"NVARCHAR({rounded}) COLLATE {COLLATION}"
+def infer_sql_type_for_column(values) -> str:
+    """Ustun qiymatlari uchun SQL tipi (ColumnProfile orqali, bitta o'tishda)."""
+    p = ColumnProfile()
+    for v in values:
+        p.update(v)
+    return p.sql_type()
 
 
-def infer_sql_schema_from_rows(rows, column_names):
+def infer_sql_schema_from_rows(rows, column_names, sample_every: int = 1):
     """
-    rows: list[tuple] — masalan #TmpFact/#TmpGroup/#TmpCond ga insert qilinadigan tuplar
+    rows: list[tuple] yoki istalgan iterator — masalan #TmpFact/#TmpGroup/#TmpCond ga insert qilinadigan tuplar
     column_names: list[str] — ustun nomlari tartibda
     Natija: dict {col_name: sql_type_str}
     """
-    if not rows:
-        # Hech narsa bo‘lmasa, default NVARCHAR(100) qaytaramiz
-        return {c: f"NVARCHAR(100) COLLATE {COLLATION}" for c in column_names}
+    return SchemaProfiler(column_names, sample_every).update_rows(rows).schema()
 
-    col_buckets = {i: [] for i in range(len(column_names))}
-    for r in rows:
-        for i, val in enumerate(r):
-            col_buckets[i].append(val)
 
-    schema = {}
-    for i, col in enumerate(column_names):
-        schema[col] = infer_sql_type_for_column(col_buckets[i])
-    return schema
+def infer_sql_schema_from_batches(batches, column_names, sample_every: int = 1):
+    """Batch'lar generatori (masalan oynama-oyna yuklangan qatorlar) bo'yicha sxema — bitta o'tishda."""
+    return SchemaProfiler(column_names, sample_every).update_batches(batches).schema()
 
 
 def generate_create_table_from_rows(table_name: str, rows, column_names):
@@ -298,12 +423,15 @@ def generate_create_table_from_rows(table_name: str, rows, column_names):
 # ====== DB Objects ======
 def ensure_tables(cursor):
     """3 ta jadvalni yaratadi (agar bo'lmasa). PK/FK/indekslarni ham borligini tekshiradi."""
+    if FACT_LAYOUT == "partitioned":
+        ensure_partition_function(cursor, today_samarkand_date())
+        cursor.execute(f"IF OBJECT_ID('{FACT_TABLE}', 'U') IS NULL\nBEGIN\n{partitioned_fact_ddl(FACT_TABLE)}\nEND")
     # FactBalance
     cursor.execute(f"""
 IF OBJECT_ID('{FACT_TABLE}', 'U') IS NULL
 BEGIN
     CREATE TABLE {FACT_TABLE} (
-        balance_id      CHAR(64)     NOT NULL PRIMARY KEY,
+        balance_id      {BALANCE_ID_SQL}     NOT NULL PRIMARY KEY,
         inventory_kind  VARCHAR(50)   NULL,
         balance_date    DATE          NULL,
         warehouse_id    INT           NULL,
@@ -319,15 +447,21 @@ BEGIN
         measure_code    NVARCHAR(50)  COLLATE {COLLATION} NULL,
         input_price     DECIMAL(18,4) NULL,
         filial_id       INT           NULL,
-        filial_code     NVARCHAR(100) COLLATE {COLLATION} NULL
+        filial_code     NVARCHAR(100) COLLATE {COLLATION} NULL,
+        row_hash        {ROW_HASH_SQL}    NULL
     );
 END
+""")
+    # eski jadvallar: row_hash NULL bo'lib qo'shiladi — birinchi MERGE'da bir marta to'ldiriladi
+    cursor.execute(f"""
+IF COL_LENGTH('{FACT_TABLE}', 'row_hash') IS NULL
+    ALTER TABLE {FACT_TABLE} ADD row_hash {ROW_HASH_SQL} NULL;
 """)
 
     cursor.execute(f"""
 IF NOT EXISTS (
     SELECT 1 FROM sys.indexes WHERE name = 'IX_FactBalance_Product' AND object_id = OBJECT_ID('{FACT_TABLE}')
-)
+) AND '{FACT_LAYOUT}' = 'rowstore'
     CREATE INDEX IX_FactBalance_Product
       ON {FACT_TABLE}(product_id, warehouse_id, batch_number, balance_date);
 """)
@@ -337,12 +471,10 @@ IF NOT EXISTS (
 IF OBJECT_ID('{GROUP_TABLE}', 'U') IS NULL
 BEGIN
     CREATE TABLE {GROUP_TABLE} (
-        balance_id  CHAR(64)      NOT NULL,
+        balance_id  {BALANCE_ID_SQL}      NOT NULL,
         group_code  NVARCHAR(100) COLLATE {COLLATION} NOT NULL,
         type_code   NVARCHAR(200) COLLATE {COLLATION} NULL,
-        CONSTRAINT PK_BalanceGroup PRIMARY KEY (balance_id, group_code),
-        CONSTRAINT FK_BalanceGroup_FactBalance
-            FOREIGN KEY (balance_id) REFERENCES {FACT_TABLE}(balance_id)
+        CONSTRAINT PK_BalanceGroup PRIMARY KEY (balance_id, group_code){_fk_clause("FK_BalanceGroup_FactBalance")}
     );
 END
 """)
@@ -358,11 +490,9 @@ IF NOT EXISTS (
 IF OBJECT_ID('{CONDITION_TABLE}', 'U') IS NULL
 BEGIN
     CREATE TABLE {CONDITION_TABLE} (
-        balance_id        CHAR(64)      NOT NULL,
+        balance_id        {BALANCE_ID_SQL}      NOT NULL,
         product_condition NVARCHAR(50)  COLLATE {COLLATION} NOT NULL,
-        CONSTRAINT PK_BalanceCondition PRIMARY KEY (balance_id, product_condition),
-        CONSTRAINT FK_BalanceCondition_FactBalance
-            FOREIGN KEY (balance_id) REFERENCES {FACT_TABLE}(balance_id)
+        CONSTRAINT PK_BalanceCondition PRIMARY KEY (balance_id, product_condition){_fk_clause("FK_BalanceCondition_FactBalance")}
     );
 END
 """)
@@ -372,6 +502,380 @@ IF NOT EXISTS (
 )
     CREATE INDEX IX_BalanceCondition_Cond ON {CONDITION_TABLE}(product_condition);
 """)
+    if BALANCE_STORAGE == "ranges":
+        ensure_range_tables(cursor)
+
+
+# ====== RANGE (SCD2) STORAGE ======
+RANGE_CONTENT_COLUMNS = (
+    "inventory_kind, warehouse_id, warehouse_code, product_code, product_barcode, product_id, card_code, "
+    "expiry_date, serial_number, batch_number, quantity, measure_code, input_price, filial_id, filial_code"
+)
+# seriya = (ombor, mahsulot, partiya); kalit faqat SQL ichida hisoblanadi
+def _series_id_sql(alias: str = "") -> str:
+    return (f"CONVERT({BALANCE_ID_SQL}, HASHBYTES('SHA2_256', "
+            f"CONCAT({alias}warehouse_id, N'|', {alias}product_id, N'|', {alias}batch_number)))")
+
+
+def ensure_range_tables(cursor):
+    """FactBalanceRange + seriya bo'yicha Group/Condition jadvallari va as-of funksiyasi."""
+    cursor.execute(f"""
+IF OBJECT_ID('{RANGE_TABLE}', 'U') IS NULL
+BEGIN
+    CREATE TABLE {RANGE_TABLE} (
+        series_id       {BALANCE_ID_SQL}     NOT NULL,
+        valid_from      DATE          NOT NULL,
+        valid_to        DATE          NOT NULL,
+        inventory_kind  VARCHAR(50)   NULL,
+        warehouse_id    INT           NULL,
+        warehouse_code  NVARCHAR(200) COLLATE {COLLATION} NULL,
+        product_code    NVARCHAR(100) COLLATE {COLLATION} NULL,
+        product_barcode NVARCHAR(100) COLLATE {COLLATION} NULL,
+        product_id      NVARCHAR(50)  COLLATE {COLLATION} NULL,
+        card_code       NVARCHAR(100) COLLATE {COLLATION} NULL,
+        expiry_date     DATE          NULL,
+        serial_number   NVARCHAR(100) COLLATE {COLLATION} NULL,
+        batch_number    NVARCHAR(100) COLLATE {COLLATION} NULL,
+        quantity        DECIMAL(18,4) NULL,
+        measure_code    NVARCHAR(50)  COLLATE {COLLATION} NULL,
+        input_price     DECIMAL(18,4) NULL,
+        filial_id       INT           NULL,
+        filial_code     NVARCHAR(100) COLLATE {COLLATION} NULL,
+        row_hash        {ROW_HASH_SQL}    NULL,
+        CONSTRAINT PK_FactBalanceRange PRIMARY KEY (series_id, valid_from)
+    );
+    CREATE INDEX IX_FactBalanceRange_Valid ON {RANGE_TABLE}(valid_to, valid_from) INCLUDE (warehouse_id, product_id);
+END
+""")
+    cursor.execute(f"""
+IF OBJECT_ID('{RANGE_GROUP_TABLE}', 'U') IS NULL
+    CREATE TABLE {RANGE_GROUP_TABLE} (
+        series_id   {BALANCE_ID_SQL}      NOT NULL,
+        group_code  NVARCHAR(100) COLLATE {COLLATION} NOT NULL,
+        type_code   NVARCHAR(200) COLLATE {COLLATION} NULL,
+        CONSTRAINT PK_BalanceRangeGroup PRIMARY KEY (series_id, group_code)
+    );
+IF OBJECT_ID('{RANGE_CONDITION_TABLE}', 'U') IS NULL
+    CREATE TABLE {RANGE_CONDITION_TABLE} (
+        series_id         {BALANCE_ID_SQL}      NOT NULL,
+        product_condition NVARCHAR(50)  COLLATE {COLLATION} NOT NULL,
+        CONSTRAINT PK_BalanceRangeCondition PRIMARY KEY (series_id, product_condition)
+    );
+""")
+    # CREATE FUNCTION alohida batch bo'lishi shart
+    cursor.execute(f"""
+CREATE OR ALTER FUNCTION {RANGE_ASOF_FUNCTION} (@as_of DATE)
+RETURNS TABLE
+AS RETURN
+    SELECT series_id, @as_of AS balance_date, valid_from, valid_to, {RANGE_CONTENT_COLUMNS}
+    FROM {RANGE_TABLE}
+    WHERE valid_from <= @as_of AND valid_to >= @as_of;
+""")
+
+
+def merge_ranges(cursor) -> dict:
+    """
+    #TmpFact kunlik snapshot'larini FactBalanceRange'ga qo'shadi.
+    Har seriya uchun flush'dagi [d0, d1] oralig'iga tegadigan (yoki qo'shni) eski oraliqlar bo'laklarga
+    ajratiladi: chap/o'ng qismlar o'zgarmaydi, ichki kunlardan yangi snapshot kelmaganlari saqlanadi
+    (daily rejimdagi MERGE kabi — hech narsa o'chirilmaydi), kelganlari yangisi bilan almashadi.
+    So'ng ketma-ket va bir xil row_hash'li bo'laklar gaps-and-islands bilan bitta oraliqqa yig'iladi.
+    Qaytadi: kunlar bo'yicha {"inserted", "updated", "unchanged"} (daily rejim bilan bir xil ma'noda).
+    """
+    cursor.execute(f"""
+SET NOCOUNT ON;
+IF OBJECT_ID('tempdb..#RangeNew') IS NOT NULL DROP TABLE #RangeNew;
+SELECT {_series_id_sql()} AS series_id, balance_date AS valid_from, balance_date AS valid_to,
+       {RANGE_CONTENT_COLUMNS}, row_hash
+INTO #RangeNew
+FROM #TmpFact WHERE balance_date IS NOT NULL;
+
+IF OBJECT_ID('tempdb..#RangeSpan') IS NOT NULL DROP TABLE #RangeSpan;
+SELECT series_id, MIN(valid_from) AS d0, MAX(valid_to) AS d1
+INTO #RangeSpan FROM #RangeNew GROUP BY series_id;
+
+IF OBJECT_ID('tempdb..#RangeOld') IS NOT NULL DROP TABLE #RangeOld;
+SELECT R.*, S.d0, S.d1
+INTO #RangeOld
+FROM {RANGE_TABLE} R
+JOIN #RangeSpan S ON S.series_id = R.series_id
+WHERE R.valid_to >= DATEADD(DAY, -1, S.d0) AND R.valid_from <= DATEADD(DAY, 1, S.d1);
+
+-- kunlar bo'yicha statistika (eski oraliq shu kunni qoplaganmi va kontent bir xilmi)
+DECLARE @ins INT, @upd INT, @same INT;
+SELECT @ins  = SUM(CASE WHEN O.series_id IS NULL THEN 1 ELSE 0 END),
+       @upd  = SUM(CASE WHEN O.series_id IS NOT NULL AND (O.row_hash IS NULL OR O.row_hash <> N.row_hash) THEN 1 ELSE 0 END),
+       @same = SUM(CASE WHEN O.row_hash = N.row_hash THEN 1 ELSE 0 END)
+FROM #RangeNew N
+LEFT JOIN #RangeOld O ON O.series_id = N.series_id AND N.valid_from BETWEEN O.valid_from AND O.valid_to;
+
+-- eski oraliqlarning ichki qismi uchun kunlar jadvali
+DECLARE @span INT = ISNULL((SELECT MAX(DATEDIFF(DAY, d0, d1)) + 1 FROM #RangeSpan), 0);
+IF OBJECT_ID('tempdb..#Tally') IS NOT NULL DROP TABLE #Tally;
+SELECT TOP (@span) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) - 1 AS n
+INTO #Tally FROM sys.all_objects a CROSS JOIN sys.all_objects b;
+
+IF OBJECT_ID('tempdb..#RangePieces') IS NOT NULL DROP TABLE #RangePieces;
+SELECT series_id, valid_from, valid_to, {RANGE_CONTENT_COLUMNS}, row_hash INTO #RangePieces FROM #RangeNew
+UNION ALL  -- chap qism
+SELECT series_id, valid_from, CASE WHEN valid_to < d0 THEN valid_to ELSE DATEADD(DAY, -1, d0) END,
+       {RANGE_CONTENT_COLUMNS}, row_hash
+FROM #RangeOld WHERE valid_from < d0
+UNION ALL  -- o'ng qism
+SELECT series_id, CASE WHEN valid_from > d1 THEN valid_from ELSE DATEADD(DAY, 1, d1) END, valid_to,
+       {RANGE_CONTENT_COLUMNS}, row_hash
+FROM #RangeOld WHERE valid_to > d1
+UNION ALL  -- ichki kunlar: yangi snapshot kelmaganlari eski kontent bilan qoladi
+SELECT O.series_id, X.d, X.d, {", ".join("O." + c.strip() for c in RANGE_CONTENT_COLUMNS.split(","))}, O.row_hash
+FROM #RangeOld O
+JOIN #Tally T ON T.n <= DATEDIFF(DAY,
+        CASE WHEN O.valid_from > O.d0 THEN O.valid_from ELSE O.d0 END,
+        CASE WHEN O.valid_to < O.d1 THEN O.valid_to ELSE O.d1 END)
+CROSS APPLY (SELECT DATEADD(DAY, T.n, CASE WHEN O.valid_from > O.d0 THEN O.valid_from ELSE O.d0 END) AS d) X
+WHERE NOT EXISTS (SELECT 1 FROM #RangeNew N WHERE N.series_id = O.series_id AND N.valid_from = X.d);
+
+DECLARE @old INT = (SELECT COUNT(*) FROM #RangeOld);
+DELETE R FROM {RANGE_TABLE} R
+JOIN #RangeOld O ON O.series_id = R.series_id AND O.valid_from = R.valid_from;
+
+WITH p AS (
+    SELECT *,
+           CASE WHEN LAG(valid_to) OVER (PARTITION BY series_id ORDER BY valid_from) = DATEADD(DAY, -1, valid_from)
+                 AND LAG(row_hash) OVER (PARTITION BY series_id ORDER BY valid_from) = row_hash
+                THEN 0 ELSE 1 END AS is_start
+    FROM #RangePieces
+), g AS (
+    SELECT *, SUM(is_start) OVER (PARTITION BY series_id ORDER BY valid_from ROWS UNBOUNDED PRECEDING) AS island
+    FROM p
+)
+INSERT INTO {RANGE_TABLE} (series_id, valid_from, valid_to, {RANGE_CONTENT_COLUMNS}, row_hash)
+SELECT series_id, MIN(valid_from), MAX(valid_to),
+       {", ".join(f"MIN({c.strip()})" for c in RANGE_CONTENT_COLUMNS.split(","))}, MIN(row_hash)
+FROM g
+GROUP BY series_id, island;
+DECLARE @new INT = @@ROWCOUNT;
+
+SELECT ISNULL(@ins, 0), ISNULL(@upd, 0), ISNULL(@same, 0), @old, @new;
+DROP TABLE #RangeNew; DROP TABLE #RangeSpan; DROP TABLE #RangeOld; DROP TABLE #Tally; DROP TABLE #RangePieces;
+""")
+    ins, upd, same, old, new = cursor.fetchone()
+    print(f"📏 Ranges | {old} eski oraliq → {new} | kunlar +{ins} ~{upd} ={same}")
+    return {"inserted": ins, "updated": upd, "unchanged": same}
+
+
+def merge_range_group_condition(cursor):
+    """#TmpGroup / #TmpCond → seriya bo'yicha Group/Condition (balance_id #TmpFact orqali seriyaga bog'lanadi)."""
+    cursor.execute(f"""
+MERGE {RANGE_GROUP_TABLE} AS T
+USING (
+    SELECT DISTINCT {_series_id_sql("F.")} AS series_id,
+           ISNULL(G.group_code, N'__NULL__') AS group_code,
+           MAX(G.type_code) OVER (PARTITION BY F.warehouse_id, F.product_id, F.batch_number, G.group_code) AS type_code
+    FROM #TmpGroup G JOIN #TmpFact F ON F.balance_id = G.balance_id
+) AS S
+ON (T.series_id = S.series_id AND T.group_code = S.group_code)
+WHEN MATCHED AND ISNULL(T.type_code, N'') <> ISNULL(S.type_code, N'') THEN UPDATE SET
+    type_code = S.type_code
+WHEN NOT MATCHED THEN
+    INSERT (series_id, group_code, type_code)
+    VALUES (S.series_id, S.group_code, S.type_code);
+""")
+    cursor.execute(f"""
+MERGE {RANGE_CONDITION_TABLE} AS T
+USING (
+    SELECT DISTINCT {_series_id_sql("F.")} AS series_id,
+           C.product_condition
+    FROM #TmpCond C JOIN #TmpFact F ON F.balance_id = C.balance_id
+) AS S
+ON (T.series_id = S.series_id AND T.product_condition = S.product_condition)
+WHEN NOT MATCHED THEN
+    INSERT (series_id, product_condition)
+    VALUES (S.series_id, S.product_condition);
+""")
+
+
+def _fk_clause(name: str) -> str:
+    """rowstore'da Group/Condition → FactBalance FK; partitioned'da FK yo'q (PK balance_date'ni ham o'z ichiga oladi)."""
+    if FACT_LAYOUT != "rowstore":
+        return ""
+    return f""",
+        CONSTRAINT {name}
+            FOREIGN KEY (balance_id) REFERENCES {FACT_TABLE}(balance_id)"""
+
+
+# ====== PARTITIONED LAYOUT ======
+def _month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def ensure_partition_function(cursor, until: date):
+    """
+    Oylik RANGE RIGHT partition funksiyasi/sxemasi: PARTITION_START dan until + PARTITION_MONTHS_AHEAD gacha
+    har oy boshi chegara. Bor bo'lsa, faqat yetishmayotgan keyingi oylar SPLIT qilinadi.
+    """
+    last = _add_months(_month_start(until), PARTITION_MONTHS_AHEAD)
+    wanted = []
+    d = _month_start(PARTITION_START)
+    while d <= last:
+        wanted.append(d)
+        d = _add_months(d, 1)
+
+    cursor.execute("""
+SELECT CAST(rv.value AS date)
+FROM sys.partition_range_values rv
+JOIN sys.partition_functions pf ON pf.function_id = rv.function_id
+WHERE pf.name = ?
+""", PARTITION_FUNCTION)
+    existing = {r[0] for r in cursor.fetchall()}
+    if not existing:
+        cursor.execute("SELECT 1 FROM sys.partition_functions WHERE name = ?", PARTITION_FUNCTION)
+        if cursor.fetchone() is None:
+            values = ", ".join(f"'{d.isoformat()}'" for d in wanted)
+            cursor.execute(f"CREATE PARTITION FUNCTION {PARTITION_FUNCTION} (DATE) AS RANGE RIGHT FOR VALUES ({values});")
+            cursor.execute(f"CREATE PARTITION SCHEME {PARTITION_SCHEME} AS PARTITION {PARTITION_FUNCTION} "
+                           f"ALL TO ([{PARTITION_FILEGROUP}]);")
+            return
+    top = max(existing) if existing else None
+    for d in wanted:
+        if top is None or d > top:
+            cursor.execute(f"ALTER PARTITION SCHEME {PARTITION_SCHEME} NEXT USED [{PARTITION_FILEGROUP}];")
+            cursor.execute(f"ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() SPLIT RANGE ('{d.isoformat()}');")
+
+
+def partitioned_fact_ddl(table: str) -> str:
+    """
+    Partition'langan Fact jadvali DDL'i. FactBalance va uning SWITCH staging jadvali shu bir funksiyadan
+    yaratiladi — SWITCH uchun ustunlar, indekslar va siqish bir xil bo'lishi shart.
+    """
+    short = table.split(".")[-1]
+    ps = f"{PARTITION_SCHEME}(balance_date)"
+    ddl = f"""
+    CREATE TABLE {table} (
+        balance_id      {BALANCE_ID_SQL}     NOT NULL,
+        inventory_kind  VARCHAR(50)   NULL,
+        balance_date    DATE          NOT NULL,
+        warehouse_id    INT           NULL,
+        warehouse_code  NVARCHAR(200) COLLATE {COLLATION} NULL,
+        product_code    NVARCHAR(100) COLLATE {COLLATION} NULL,
+        product_barcode NVARCHAR(100) COLLATE {COLLATION} NULL,
+        product_id      NVARCHAR(50)  COLLATE {COLLATION} NULL,
+        card_code       NVARCHAR(100) COLLATE {COLLATION} NULL,
+        expiry_date     DATE          NULL,
+        serial_number   NVARCHAR(100) COLLATE {COLLATION} NULL,
+        batch_number    NVARCHAR(100) COLLATE {COLLATION} NULL,
+        quantity        DECIMAL(18,4) NULL,
+        measure_code    NVARCHAR(50)  COLLATE {COLLATION} NULL,
+        input_price     DECIMAL(18,4) NULL,
+        filial_id       INT           NULL,
+        filial_code     NVARCHAR(100) COLLATE {COLLATION} NULL,
+        row_hash        {ROW_HASH_SQL}    NULL
+    ) ON {ps};"""
+    if FACT_COMPRESSION == "columnstore":
+        ddl += f"""
+    CREATE CLUSTERED COLUMNSTORE INDEX CCI_{short} ON {table} ON {ps};
+    ALTER TABLE {table} ADD CONSTRAINT PK_{short} PRIMARY KEY NONCLUSTERED (balance_id, balance_date) ON {ps};"""
+    else:
+        ddl += f"""
+    ALTER TABLE {table} ADD CONSTRAINT PK_{short} PRIMARY KEY CLUSTERED (balance_date, balance_id)
+        WITH (DATA_COMPRESSION = PAGE) ON {ps};
+    CREATE INDEX IX_{short}_Product ON {table}(product_id, warehouse_id, batch_number, balance_date)
+        WITH (DATA_COMPRESSION = PAGE) ON {ps};"""
+    return ddl
+
+
+def fact_is_partitioned(cursor) -> bool:
+    cursor.execute("""
+SELECT 1 FROM sys.indexes i
+JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+WHERE i.object_id = OBJECT_ID(?) AND i.index_id IN (0, 1)
+""", FACT_TABLE)
+    return cursor.fetchone() is not None
+
+
+def migrate_fact_to_partitioned(cursor):
+    """
+    FACT_LAYOUT="partitioned" bo'lsa va FactBalance hali oddiy (rowstore) bo'lsa: FK'lar olib tashlanadi,
+    eski jadval nomi o'zgartiriladi, partition'langan jadval yaratilib, ma'lumot ko'chiriladi.
+    balance_date NULL bo'lgan qatorlar ko'chirilmaydi (partition kaliti).
+    """
+    if FACT_LAYOUT != "partitioned" or fact_is_partitioned(cursor):
+        return
+    old = f"{FACT_TABLE}_rowstore"
+    print(f"🔁 {FACT_TABLE} → partitioned ({FACT_COMPRESSION}) migratsiyasi...")
+    cursor.execute(f"""
+IF OBJECT_ID('FK_BalanceGroup_FactBalance', 'F') IS NOT NULL
+    ALTER TABLE {GROUP_TABLE} DROP CONSTRAINT FK_BalanceGroup_FactBalance;
+IF OBJECT_ID('FK_BalanceCondition_FactBalance', 'F') IS NOT NULL
+    ALTER TABLE {CONDITION_TABLE} DROP CONSTRAINT FK_BalanceCondition_FactBalance;
+DECLARE @pk sysname = (
+    SELECT name FROM sys.key_constraints WHERE parent_object_id = OBJECT_ID('{FACT_TABLE}') AND type = 'PK'
+);
+IF @pk IS NOT NULL EXEC('ALTER TABLE {FACT_TABLE} DROP CONSTRAINT ' + @pk);
+EXEC sp_rename '{FACT_TABLE}', '{old.split(".")[-1]}';
+""")
+    cursor.execute(partitioned_fact_ddl(FACT_TABLE))
+    cursor.execute(f"""
+INSERT INTO {FACT_TABLE} WITH (TABLOCK) ({FACT_COLUMNS})
+SELECT {FACT_COLUMNS} FROM {old} WHERE balance_date IS NOT NULL;
+""")
+    print(f"✅ {cursor.rowcount} qator ko'chirildi")
+    cursor.execute(f"DROP TABLE {old};")
+
+
+def migrate_balance_id_to_binary(cursor):
+    """
+    Eski CHAR(64) hex balance_id'ni BINARY(16) ga o'tkazadi (agar kerak bo'lsa).
+    Yangi kalit = hex qiymatning birinchi 32 belgisi baytlarga aylantirilgani, shuning uchun
+    qayta hisoblash shart emas. PK/FK'lar olib tashlanib, qayta yaratiladi.
+    """
+    if BALANCE_KEY_MODE != "binary":
+        return
+    cursor.execute("""
+SELECT DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS
+WHERE TABLE_SCHEMA = PARSENAME(?, 2) AND TABLE_NAME = PARSENAME(?, 1) AND COLUMN_NAME = 'balance_id'
+""", FACT_TABLE, FACT_TABLE)
+    row = cursor.fetchone()
+    if not row or row[0].lower() != "char":
+        return
+    if fact_is_partitioned(cursor):
+        raise RuntimeError("balance_id migratsiyasi partitioned jadvalda qo'llab-quvvatlanmaydi — "
+                           "avval rowstore'da BINARY'ga o'tkazing, keyin FACT_LAYOUT='partitioned' qiling.")
+
+    print("🔁 balance_id CHAR(64) → BINARY(16) migratsiyasi...")
+    hex_len = BALANCE_KEY_BYTES * 2
+    cursor.execute(f"""
+ALTER TABLE {GROUP_TABLE} DROP CONSTRAINT FK_BalanceGroup_FactBalance;
+ALTER TABLE {CONDITION_TABLE} DROP CONSTRAINT FK_BalanceCondition_FactBalance;
+ALTER TABLE {GROUP_TABLE} DROP CONSTRAINT PK_BalanceGroup;
+ALTER TABLE {CONDITION_TABLE} DROP CONSTRAINT PK_BalanceCondition;
+DECLARE @pk sysname = (
+    SELECT name FROM sys.key_constraints WHERE parent_object_id = OBJECT_ID('{FACT_TABLE}') AND type = 'PK'
+);
+IF @pk IS NOT NULL EXEC('ALTER TABLE {FACT_TABLE} DROP CONSTRAINT ' + @pk);
+""")
+    for table in (FACT_TABLE, GROUP_TABLE, CONDITION_TABLE):
+        # ADD va UPDATE alohida batch'da bo'lishi shart (ustun kompilyatsiya vaqtida ko'rinishi uchun)
+        cursor.execute(f"ALTER TABLE {table} ADD balance_key {BALANCE_ID_SQL} NULL;")
+        cursor.execute(f"UPDATE {table} SET balance_key = CONVERT({BALANCE_ID_SQL}, LEFT(balance_id, {hex_len}), 2);")
+        cursor.execute(f"ALTER TABLE {table} DROP COLUMN balance_id;")
+        cursor.execute(f"EXEC sp_rename '{table}.balance_key', 'balance_id', 'COLUMN';")
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN balance_id {BALANCE_ID_SQL} NOT NULL;")
+
+    cursor.execute(f"""
+ALTER TABLE {FACT_TABLE} ADD CONSTRAINT PK_FactBalance PRIMARY KEY (balance_id);
+ALTER TABLE {GROUP_TABLE} ADD CONSTRAINT PK_BalanceGroup PRIMARY KEY (balance_id, group_code);
+ALTER TABLE {CONDITION_TABLE} ADD CONSTRAINT PK_BalanceCondition PRIMARY KEY (balance_id, product_condition);
+ALTER TABLE {GROUP_TABLE} ADD CONSTRAINT FK_BalanceGroup_FactBalance
+    FOREIGN KEY (balance_id) REFERENCES {FACT_TABLE}(balance_id);
+ALTER TABLE {CONDITION_TABLE} ADD CONSTRAINT FK_BalanceCondition_FactBalance
+    FOREIGN KEY (balance_id) REFERENCES {FACT_TABLE}(balance_id);
+""")
+    print("✅ balance_id migratsiyasi tugadi")
 
 
 def ensure_loadstate_table(cursor):
@@ -395,62 +899,227 @@ def make_scope_key(filial_id, warehouse_id, condition=None) -> str:
     return f"filial={filial_id}|warehouse={warehouse_id}"
 
 
-def get_scope_state(cursor, scope_key: str):
-    cursor.execute("SELECT last_balance_date FROM dbo.LoadState_Balance WHERE scope_key = ?", scope_key)
-    row = cursor.fetchone()
-    return row[0] if row else None
-
+class LoadStateManager:
+    """
+    LoadState_Balance bilan ishlash: barcha scope watermark'lari bitta SELECT bilan xotiraga o'qiladi,
+    yangilanishlar xotirada yig'iladi va flush() da bitta set-based MERGE bilan yoziladi.
+    flush() chaqiruvchi shu scope ma'lumotlarining MERGE'i bilan bitta tranzaksiyada (commit'dan oldin)
+    chaqiradi — watermark yuklanmagan qatorlardan oldinga o'tolmaydi, jadval qulfi esa faqat commit oldidan olinadi.
+    """
 
-def upsert_scope_state(cursor, scope_key: str, last_balance_date, rowcount: int):
-    cursor.execute("""
-    MERGE dbo.LoadState_Balance AS T
-    USING (SELECT ? AS scope_key) AS S
-       ON T.scope_key = S.scope_key
-    WHEN MATCHED THEN UPDATE SET
-        last_balance_date = CASE WHEN (? IS NULL OR ? > ISNULL(T.last_balance_date, '1900-01-01')) THEN ? ELSE T.last_balance_date END,
-        last_run_utc      = SYSUTCDATETIME(),
-        last_rowcount     = ?
-    WHEN NOT MATCHED THEN
-       INSERT (scope_key, last_balance_date, last_run_utc, last_rowcount)
-       VALUES (S.scope_key, ?, SYSUTCDATETIME(), ?);
-    """, scope_key, last_balance_date, last_balance_date, last_balance_date, rowcount,
-                   last_balance_date, rowcount)
+    def __init__(self):
+        self._states = {}  # scope_key → last_balance_date
+        self._pending = {}  # scope_key → (last_balance_date, rowcount)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def preload(self, cursor):
+        cursor.execute("SELECT scope_key, last_balance_date FROM dbo.LoadState_Balance")
+        self._states = {k: d for k, d in cursor.fetchall()}
+        return self
+
+    def get(self, scope_key: str):
+        return self._states.get(scope_key)
+
+    def stage(self, scope_key: str, last_balance_date, rowcount: int):
+        """Yangilanishni navbatga qo'yadi (bir scope ikki marta kelsa: sana — maksimal, rowcount — yig'indi)."""
+        old = self._pending.get(scope_key)
+        if old:
+            d0, n0 = old
+            if d0 and (last_balance_date is None or d0 > last_balance_date):
+                last_balance_date = d0
+            rowcount += n0
+        self._pending[scope_key] = (last_balance_date, rowcount)
+
+    def flush(self, cursor) -> int:
+        """Navbatdagi yangilanishlarni bitta MERGE bilan yozadi (commit chaqiruvchida). Qaytadi: scope'lar soni."""
+        if not self._pending:
+            return 0
+        rows = [(k, d, n) for k, (d, n) in self._pending.items()]
+        cursor.execute("""
+IF OBJECT_ID('tempdb..#LoadStateStage') IS NOT NULL DROP TABLE #LoadStateStage;
+CREATE TABLE #LoadStateStage (
+    scope_key         nvarchar(200) NOT NULL PRIMARY KEY,
+    last_balance_date date          NULL,
+    last_rowcount     int           NULL
+);
+""")
+        cursor.fast_executemany = True
+        cursor.executemany("INSERT INTO #LoadStateStage VALUES (?, ?, ?)", rows)
+        cursor.execute("""
+MERGE dbo.LoadState_Balance AS T
+USING #LoadStateStage AS S
+   ON T.scope_key = S.scope_key
+WHEN MATCHED THEN UPDATE SET
+    last_balance_date = CASE WHEN (S.last_balance_date IS NULL
+                                   OR S.last_balance_date > ISNULL(T.last_balance_date, '1900-01-01'))
+                             THEN S.last_balance_date ELSE T.last_balance_date END,
+    last_run_utc      = SYSUTCDATETIME(),
+    last_rowcount     = S.last_rowcount
+WHEN NOT MATCHED THEN
+   INSERT (scope_key, last_balance_date, last_run_utc, last_rowcount)
+   VALUES (S.scope_key, S.last_balance_date, SYSUTCDATETIME(), S.last_rowcount);
+DROP TABLE #LoadStateStage;
+""")
+        for k, d, _ in rows:
+            old = self._states.get(k)
+            self._states[k] = d if (d is None or old is None or d > old) else old
+        self._pending.clear()
+        return len(rows)
 
 
 # ====== API → ROWS (INCREMENTAL, with product_condition) ======
-def fetch_balance_chunks(cursor, filial_warehouse_list, product_conditions, user_begin_date: datetime,
-                         user_end_date: datetime):
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def _host_limit(url: str) -> int:
+    return HOST_MAX_CONCURRENCY.get(urlsplit(url).hostname or "", DEFAULT_HOST_CONCURRENCY)
+
+
+def _host_semaphore(url: str) -> threading.BoundedSemaphore:
+    """Bitta host'ga bir vaqtda ketadigan so'rovlar sonini cheklaydi."""
+    host = urlsplit(url).hostname or ""
+    with _host_semaphores_lock:
+        sem = _host_semaphores.get(host)
+        if sem is None:
+            sem = threading.BoundedSemaphore(_host_limit(url))
+            _host_semaphores[host] = sem
+    return sem
+
+
+def _timed_batches(items, size: int = ITEM_BATCH):
+    """Item oqimini size'lik ro'yxatlarga bo'ladi; parse vaqti decode'ga yoziladi (iste'molchi kutgan vaqt emas)."""
+    it = iter(items)
+    while True:
+        with timer("decode"):
+            batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def fetch_balance_window(filial_id, filial_code, warehouse_code, cond, start: datetime, finish: datetime):
+    """
+    Bitta (scope, oyna) uchun balance$export so'rovi. Generator: ITEM_BATCH'lik balance partiyalari.
+    Oyna butunicha ro'yxatga yig'ilmaydi; host semaphore'i va javob javob oxirigacha o'qilguncha
+    (yoki generator yopilguncha) ushlab turiladi.
+    """
+    params = {"filial_id": filial_id}
+    payload = {
+        "warehouse_codes": [{"warehouse_code": warehouse_code}],
+        "filial_code": filial_code,
+        "begin_date": start.strftime(DATE_FORMAT),
+        "end_date": finish.strftime(DATE_FORMAT),
+        # API specific: include product_conditions filter if supported by API
+        "product_conditions": [cond]
+    }
+    request = {"params": params, "payload": payload}
+    window = (start.strftime("%Y-%m-%d"), finish.strftime("%Y-%m-%d"))
+    if REPLAY:
+        yield from _timed_batches(iter_json_items(get_archive(required=True).chunks_for(URL, request), "balance"))
+        return
+    archive = get_archive()
+    with _host_semaphore(URL):
+        # smartup_session: har thread o'z keep-alive sessiyasini oladi (basic auth bilan)
+        with timer("http_wait"):
+            resp = get_session().post(
+                URL,
+                params=params,
+                auth=(USERNAME, PASSWORD),
+                headers={"Content-Type": "application/json; charset=utf-8"},
+                data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                timeout=120,
+                stream=STREAM_JSON,
+            )
+        with resp:
+            resp.encoding = "utf-8"
+            resp.raise_for_status()
+            if STREAM_JSON:
+                # bo'laklarni kutish http_wait'ga, parse (va arxivga siqish) decode'ga yoziladi
+                yield from _timed_batches(iter_archived_items(
+                    metered_chunks(resp.iter_content(chunk_size=CHUNK_SIZE)), "balance", archive, URL, request, window))
+                return
+            with timer("http_wait"):
+                body = resp.content
+            METRICS.inc("bytes_received_total", len(body))
+            if archive is not None:
+                archive.put(URL, request, body, window)
+            with timer("decode"):
+                data = resp.json()
+    yield from _timed_batches(data.get("balance", []))
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code in RETRY_STATUS
+    # tarmoq/timeout xatolari va uzilib qolgan oqim (JSON oxirigacha kelmagan)
+    return isinstance(e, (requests.RequestException, ValueError))
+
+
+def fetch_window_with_retry(filial_id, filial_code, warehouse_code, cond, start: datetime, finish: datetime):
     """
-    Har bir (filial_id, warehouse_id, condition) scope bo‘yicha LoadState’ni o‘qiydi:
+    fetch_balance_window + FETCH_RETRIES ta qayta urinish (eksponensial backoff, jitter bilan). Generator.
+    Oqim o'rtasida uzilsa oyna boshidan qayta o'qiladi — allaqachon berilgan item'lar yana keladi,
+    bufer ularni balance_id bo'yicha tashlaydi (pipelined rejimda flush bo'lganlarini MERGE).
+    Oynaning to'liq vaqti (retry va backoff bilan) window_seconds gistogrammasiga yoziladi.
+    """
+    t0 = time.perf_counter()
+    labels = {"filial": filial_code, "warehouse": warehouse_code, "cond": cond}
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            yield from fetch_balance_window(filial_id, filial_code, warehouse_code, cond, start, finish)
+            METRICS.observe("window_seconds", time.perf_counter() - t0, **labels)
+            return
+        except Exception as e:
+            if attempt >= FETCH_RETRIES or not _is_retryable(e):
+                METRICS.inc("errors_total", **labels)
+                raise
+            METRICS.inc("retries_total", **labels)
+            delay = min(FETCH_BACKOFF_MAX, FETCH_BACKOFF_BASE * (2 ** attempt)) * (0.5 + random.random() / 2)
+            print(f"🔁 Qayta urinish {attempt + 1}/{FETCH_RETRIES} | {filial_code}/{warehouse_code}/{cond} | "
+                  f"{start.strftime(DATE_FORMAT)} - {finish.strftime(DATE_FORMAT)} | {e} | {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _make_scope(entry, cond, windows) -> dict:
+    filial_id = entry.get("filial_id")
+    warehouse_id = entry.get("warehouse_id")
+    return {
+        "scope_key": make_scope_key(filial_id, warehouse_id, cond),
+        "filial_id": filial_id,
+        "filial_code": entry.get("filial_code"),
+        "warehouse_id": warehouse_id,
+        "warehouse_code": entry.get("warehouse_code"),
+        "filial_id_int": safe_int(filial_id),
+        "warehouse_id_int": safe_int(warehouse_id),
+        "cond": cond,
+        "windows": windows,
+    }
+
+
+def plan_balance_scopes(state: LoadStateManager, filial_warehouse_list, product_conditions, user_begin_date: datetime,
+                        user_end_date: datetime):
+    """
+    Har bir (filial_id, warehouse_id, condition) scope bo‘yicha LoadState’ni (oldindan yuklangan) o‘qiydi:
       effective_begin = max(user_begin_date, (state_date - buffer))
       effective_end   = user_end_date
-    Qaytadi: fact_rows, group_rows, condition_rows
+    Qaytadi: scope dict'lar ro'yxati (qat'iy tartibda), har birida 30 kunlik oynalar.
     """
-    session = requests.Session()
-    fact_rows = []  # tuples like in original code
-    group_rows = []
-    condition_rows = []  # (balance_id, product_condition)
-
-    seen_balance_ids = set()
-    seen_group_pairs = set()
-    seen_cond_pairs = set()
-
-    total_items = 0
-
+    scopes = []
     for entry in filial_warehouse_list:
         filial_id = entry.get("filial_id")
-        filial_code = entry.get("filial_code")
         warehouse_id = entry.get("warehouse_id")
-        warehouse_code = entry.get("warehouse_code")
 
         for cond in product_conditions:
             # cond can be "T" or "B" or "F"
-            scope_key = make_scope_key(filial_id, warehouse_id, cond)
-            state_last = get_scope_state(cursor, scope_key)  # DATE or None
+            scope_key = make_scope_key(filial_id, warehouse_id, cond)  # _make_scope bilan bir xil
+            state_last = state.get(scope_key)  # DATE or None
 
             effective_begin = user_begin_date
             if state_last:
-                eff = state_last - timedelta(days=INCREMENTAL_BUFFER_DAYS)
+                eff = datetime.combine(state_last, datetime.min.time()) - timedelta(days=INCREMENTAL_BUFFER_DAYS)
                 if eff > effective_begin:
                     effective_begin = eff
 
@@ -459,150 +1128,557 @@ def fetch_balance_chunks(cursor, filial_warehouse_list, product_conditions, user
                 print(f"↪️  Skip scope {scope_key}: effective_begin>{effective_end}")
                 continue
 
-            scope_max_balance_date = None
-            scope_added_f, scope_added_g, scope_added_c = 0, 0, 0
+            scopes.append(_make_scope(entry, cond, list(daterange(effective_begin, effective_end, step_days=30))))
+    return scopes
 
-            for start, finish in daterange(effective_begin, effective_end, step_days=30):
-                params = {"filial_id": filial_id}
-                payload = {
-                    "warehouse_codes": [{"warehouse_code": warehouse_code}],
-                    "filial_code": filial_code,
-                    "begin_date": start.strftime(DATE_FORMAT),
-                    "end_date": finish.strftime(DATE_FORMAT),
-                    # API specific: include product_conditions filter if supported by API
-                    "product_conditions": [cond]
-                }
 
-                try:
-                    resp = session.post(
-                        URL,
-                        params=params,
-                        auth=(USERNAME, PASSWORD),
-                        headers={"Content-Type": "application/json; charset=utf-8"},
-                        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-                        timeout=120,
-                    )
-                    resp.encoding = "utf-8"
-                    resp.raise_for_status()
-                    data = resp.json()
-                    balance = data.get("balance", [])
-                    total_items += len(balance)
-
-                    added_f, added_g, added_c = 0, 0, 0
-                    for item in balance:
-                        inv_kind = item.get("inventory_kind")
-                        bal_date = to_date(item.get("date"))
-                        prod_code = item.get("product_code")
-                        prod_barcode = item.get("product_barcode")
-                        prod_id = item.get("product_id")
-                        card_code = item.get("card_code")
-                        expiry_date = to_date(item.get("expiry_date"))
-                        serial_num = item.get("serial_number")
-                        batch_num = item.get("batch_number")
-                        qty = to_float(item.get("quantity"))
-                        measure_code = item.get("measure_code")
-                        input_price = to_float(item.get("input_price"))
-
-                        balance_id = make_balance_id(warehouse_id, prod_id, batch_num, bal_date)
-
-                        # Fact rows (only once per balance_id)
-                        if balance_id not in seen_balance_ids:
-                            fact_rows.append((
-                                balance_id, inv_kind, bal_date,
-                                safe_int(warehouse_id),
-                                warehouse_code, prod_code, prod_barcode, prod_id, card_code, expiry_date,
-                                serial_num, batch_num,
-                                qty, measure_code, input_price,
-                                safe_int(filial_id), filial_code
-                            ))
-                            seen_balance_ids.add(balance_id)
-                            added_f += 1
-                            if bal_date and (scope_max_balance_date is None or bal_date > scope_max_balance_date):
-                                scope_max_balance_date = bal_date
-
-                        # Groups (may be multiple)
-                        groups = item.get("groups") or [{"group_code": None, "type_code": None}]
-                        for g in groups:
-                            gc = g.get("group_code")
-                            tc = g.get("type_code")
-                            key = (balance_id, gc)
-                            if key not in seen_group_pairs:
-                                group_rows.append((balance_id, gc, tc))
-                                seen_group_pairs.add(key)
-                                added_g += 1
-
-                        # Condition mapping (balance_id, cond)
-                        cond_key = (balance_id, cond)
-                        if cond_key not in seen_cond_pairs:
-                            condition_rows.append((balance_id, cond))
-                            seen_cond_pairs.add(cond_key)
-                            added_c += 1
-
-                    print(f"✅ {start.strftime(DATE_FORMAT)} - {finish.strftime(DATE_FORMAT)} | "
-                          f"{scope_key} | cond:{cond} | items:{len(balance)} → +F:{added_f}, +G:{added_g}, +C:{added_c}")
-
-                    scope_added_f += added_f
-                    scope_added_g += added_g
-                    scope_added_c += added_c
-
-                except Exception as e:
-                    print(
-                        f"⚠️ API xatosi | {scope_key} | cond:{cond} | {start.strftime(DATE_FORMAT)} - {finish.strftime(DATE_FORMAT)} | {e}")
-
-            # Update load state per (filial|warehouse|cond)
-            if scope_max_balance_date:
-                upsert_scope_state(cursor, scope_key, scope_max_balance_date, scope_added_f)
+def plan_replay_scopes(filial_warehouse_list, product_conditions, user_begin_date: datetime,
+                       user_end_date: datetime):
+    """
+    --replay: oynalar arxiv index'idan olinadi (LoadState'dan emas) — arxivdagi so'rov aynan shu
+    sanalar bilan takrorlanadi. Scope bo'yicha oynalar boshlanish sanasi tartibida.
+    """
+    by_key = {}
+    for e in get_archive(required=True).entries(URL, user_begin_date.strftime("%Y-%m-%d"),
+                                                user_end_date.strftime("%Y-%m-%d")):
+        payload = e["request"]["payload"]
+        key = (payload["filial_code"], payload["warehouse_codes"][0]["warehouse_code"],
+               payload["product_conditions"][0])
+        start = datetime.strptime(payload["begin_date"], DATE_FORMAT)
+        finish = datetime.strptime(payload["end_date"], DATE_FORMAT)
+        by_key.setdefault(key, set()).add((start, finish))
+
+    scopes = []
+    for entry in filial_warehouse_list:
+        for cond in product_conditions:
+            windows = by_key.get((entry.get("filial_code"), entry.get("warehouse_code"), cond))
+            if windows:
+                scopes.append(_make_scope(entry, cond, sorted(windows)))
+    print(f"📼 Replay: {len(scopes)} scope, {sum(len(s['windows']) for s in scopes)} oyna arxivdan")
+    return scopes
 
-    print(
-        f"Σ API items: {total_items} | fact_rows:{len(fact_rows)} | group_rows:{len(group_rows)} | condition_rows:{len(condition_rows)}")
-    return fact_rows, group_rows, condition_rows
 
+def plan_resume_scopes(journal: CheckpointJournal, state: LoadStateManager, tracker: "ScopeTracker",
+                       filial_warehouse_list, product_conditions):
+    """
+    --resume: jurnalning oxirgi run'idan faqat "done" bo'lmagan oynalar qayta rejalashtiriladi.
+    Qisman yuklangan scope'lar uchun tracker "done" oynalar max_date'i bilan to'ldiriladi (watermark to'g'ri
+    hisoblanishi uchun); to'liq yuklangan, lekin watermark'i yozilmay qolgan scope'lar state'ga navbatga qo'yiladi.
+    Qaytadi: scope'lar ro'yxati yoki None (jurnal bo'sh bo'lsa).
+    """
+    windows = journal.load_last_run()
+    if windows is None:
+        return None
+    by_scope = {}
+    for (scope_key, start, finish), w in sorted(windows.items(), key=lambda kv: (kv[0][1], kv[0][2])):
+        by_scope.setdefault(scope_key, []).append((start, finish, w))
 
-# ====== MAIN ======
-def main():
-    # 1) JSON ni UTF-8 da o‘qiymiz
-    with open(FILIAL_WAREHOUSE_JSON, "r", encoding="utf-8") as f:
-        filial_warehouse_list = json.load(f)
+    scopes = []
+    for entry in filial_warehouse_list:
+        for cond in product_conditions:
+            base = _make_scope(entry, cond, [])
+            planned = by_scope.get(base["scope_key"])
+            if not planned:
+                continue
+            todo = [(s, f) for s, f, w in planned if w["status"] != "done"]
+            done = [w for _, _, w in planned if w["status"] == "done"]
+            max_date = max((w["max_date"] for w in done if w["max_date"]), default=None)
+            rows = sum(w["rows"] for w in done)
+            if todo:
+                base["windows"] = todo
+                tracker.seed(base["scope_key"], max_date, rows)
+                scopes.append(base)
+            elif max_date:
+                state.stage(base["scope_key"], max_date, rows)
+    n_todo = sum(len(s["windows"]) for s in scopes)
+    print(f"⏯ Resume run {journal.run_id}: {len(scopes)} scope, {n_todo} oyna qayta yuklanadi")
+    return scopes
 
-    # read product conditions as simple list of strings: ["T","B","F"]
-    with open(PRODUCT_CONDITION_JSON, "r", encoding="utf-8") as f:
-        cond_json = json.load(f)
-    # cond_json expected like: [ {"product_conditions":["T"]}, {"product_conditions":["B"]} ... ]
-    product_conditions = []
-    for entry in cond_json:
-        pcs = entry.get("product_conditions") or []
-        for p in pcs:
-            if p and p not in product_conditions:
-                product_conditions.append(p)
 
-    # 2) Sana oynasi: 01.01.2025 → bugun (Asia/Samarkand)
-    begin_date = datetime.strptime(BEGIN_DATE_STR, DATE_FORMAT)
-    end_date = datetime.strptime(today_samarkand_date().strftime(DATE_FORMAT), DATE_FORMAT)
+_WINDOW_END = object()
 
-    # 3) SQL ga ulanib, jadvallarni tekshiramiz
-    conn = connect_sql()
-    cursor = conn.cursor()
-    print("✅ SQL Serverga ulandik")
 
-    ensure_tables(cursor)
-    ensure_loadstate_table(cursor)
-    conn.commit()
+class WindowStream:
+    """
+    Bitta oynaning balance partiyalari (iterable). Xato iste'molchiga otilmaydi: iteratsiya to'xtaydi va
+    error'ga yoziladi — iste'molchi tsikldan keyin error'ni tekshiradi; items — berilgan item'lar soni.
+    """
 
-    # 4) API dan ma’lumotlarni yig‘amiz (INCREMENTAL, per-scope per-condition)
-    fact_rows, group_rows, condition_rows = fetch_balance_chunks(cursor, filial_warehouse_list, product_conditions,
-                                                                 begin_date, end_date)
-    if not fact_rows and not group_rows and not condition_rows:
-        print("ℹ️ Yangi yozuvlar topilmadi.")
-        cursor.close()
-        conn.close()
-        return
+    def __init__(self, batches):
+        self._batches = batches
+        self.items = 0
+        self.error = None
 
-    # 5) Temp jadvallarni yaratish (shu joyni original koddagi temp strukturasiga mos qildim)
-    def create_temp_tables():
-        cursor.execute(f"""
+    def __iter__(self):
+        try:
+            for batch in self._batches:
+                self.items += len(batch)
+                yield batch
+        except Exception as e:
+            self.error = e
+
+    def drain(self):
+        """Iste'molchi o'qimagan qoldiq (worker navbatda bloklanib qolmasligi uchun)."""
+        for _ in self:
+            pass
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _stream_window(q: queue.Queue, stop: threading.Event, scope, start, finish):
+    """Worker: oyna partiyalarini navbatga qo'yadi (navbat to'lsa — javobni o'qishni to'xtatib kutadi)."""
+    batches = fetch_window_with_retry(scope["filial_id"], scope["filial_code"], scope["warehouse_code"],
+                                      scope["cond"], start, finish)
+    try:
+        for batch in batches:
+            if not _put(q, batch, stop):
+                return
+        _put(q, _WINDOW_END, stop)
+    except Exception as e:
+        _put(q, e, stop)
+    finally:
+        batches.close()  # to'xtatilganda javob va host semaphore'i darhol bo'shaydi
+
+
+def _read_queue(q: queue.Queue):
+    while True:
+        item = q.get()
+        if item is _WINDOW_END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def iter_balance_windows(scopes):
+    """
+    Scope/oynalarni FETCH_WORKERS ta thread'da parallel yuklaydi (host bo'yicha HOST_MAX_CONCURRENCY chegarasi).
+    Natijalar qat'iy (scope, oyna) tartibida qaytadi. Har oyna oqim sifatida beriladi: worker javobni o'qib
+    partiyalarni oynaning kichik navbatiga qo'yadi, navbat to'lsa iste'molchi yetib kelguncha kutadi —
+    xotirada ko'pi bilan PREFETCH_WINDOWS × WINDOW_QUEUE_BATCHES × ITEM_BATCH item turadi (oyna hajmidan qat'i nazar).
+    Pool host chegarasidan katta emas: navbatda kutayotgan oldingi oynalar semaphore'ni band qilib,
+    iste'molchi o'qiyotgan oynani to'sib qo'ya olmaydi (pool vazifalarni tartib bilan oladi).
+    Qaytadi: (scope, start, finish, WindowStream, is_last_window_of_scope)
+    """
+    tasks = [(scope, start, finish, wi == len(scope["windows"]) - 1)
+             for scope in scopes for wi, (start, finish) in enumerate(scope["windows"])]
+    workers = max(1, min(FETCH_WORKERS, _host_limit(URL)))
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        it = iter(tasks)
+
+        def _submit_next():
+            task = next(it, None)
+            if task is not None:
+                scope, start, finish, _ = task
+                q = queue.Queue(maxsize=WINDOW_QUEUE_BATCHES)
+                pool.submit(_stream_window, q, stop, scope, start, finish)
+                pending.append((task, q))
+
+        for _ in range(max(PREFETCH_WINDOWS, workers)):
+            _submit_next()
+        try:
+            while pending:
+                (scope, start, finish, is_last), q = pending.popleft()
+                _submit_next()
+                stream = WindowStream(_read_queue(q))
+                yield scope, start, finish, stream, is_last
+                stream.drain()
+        finally:
+            stop.set()  # iste'molchi to'xtasa (xato/close) worker'lar navbatni kutib qolmaydi
+
+
+def _window_columns(scope, balance):
+    """Sana/son ustunlari partiya bo'yicha bir yo'la o'giriladi (balance_coerce), kalitlar to'plam bo'lib hisoblanadi."""
+    with timer("coerce"):
+        bal_dates = to_date_column([item.get("date") for item in balance])
+        expiry_dates = to_date_column([item.get("expiry_date") for item in balance])
+        quantities = to_float_column([item.get("quantity") for item in balance])
+        input_prices = to_float_column([item.get("input_price") for item in balance])
+    balance_ids = make_balance_ids(
+        scope["warehouse_id"],
+        [(item.get("product_id"), item.get("batch_number"), d) for item, d in zip(balance, bal_dates)])
+    return bal_dates, expiry_dates, quantities, input_prices, balance_ids
+
+
+def _fact_content(scope, item, bal_date, expiry_date, qty, input_price) -> tuple:
+    """Fact qatorining balance_id va row_hash'siz ustunlari (#TmpFact tartibida)."""
+    return (
+        item.get("inventory_kind"), bal_date,
+        scope["warehouse_id_int"],
+        scope["warehouse_code"], item.get("product_code"), item.get("product_barcode"),
+        item.get("product_id"), item.get("card_code"), expiry_date,
+        item.get("serial_number"), item.get("batch_number"),
+        qty, item.get("measure_code"), input_price,
+        scope["filial_id_int"], scope["filial_code"]
+    )
+
+
+def _content_hash(content) -> bytes:
+    # hash'ga sana kirmaydi: sana balance_id'da bor, ranges rejimida esa qo'shni kunlarni solishtiradi
+    return make_row_hash(content[:1] + content[2:])
+
+
+class BalanceRowBuffer:
+    """
+    API item'laridan Fact/Group/Condition qatorlarini yig'adi va bufer ichida dedupe qiladi.
+    Pipelined rejimda har flush'dan keyin yangisi olinadi; bufferlar orasidagi takrorlarni MERGE hal qiladi.
+    """
+
+    def __init__(self):
+        self.fact_rows = []  # tuples like in original code
+        self.group_rows = []
+        self.condition_rows = []  # (balance_id, product_condition)
+        self.seen_balance_ids = set()
+        self.seen_group_pairs = set()
+        self.seen_cond_pairs = set()
+
+    def __len__(self):
+        return len(self.fact_rows) + len(self.group_rows) + len(self.condition_rows)
+
+    def add_window(self, scope, balance):
+        """Bitta oyna natijasini qo'shadi. Qaytadi: (added_f, added_g, added_c, max_balance_date)."""
+        cond = scope["cond"]
+        added_f, added_g, added_c = 0, 0, 0
+        max_date = None
+
+        bal_dates, expiry_dates, quantities, input_prices, balance_ids = _window_columns(scope, balance)
+        for item, bal_date, expiry_date, qty, input_price, balance_id in zip(
+                balance, bal_dates, expiry_dates, quantities, input_prices, balance_ids):
+            # Fact rows (only once per balance_id)
+            if balance_id not in self.seen_balance_ids:
+                content = _fact_content(scope, item, bal_date, expiry_date, qty, input_price)
+                self.fact_rows.append((balance_id, *content, _content_hash(content)))
+                self.seen_balance_ids.add(balance_id)
+                added_f += 1
+            # watermark: boshqa condition/buferda ko'rilgan qatorlar ham scope sanasini oldinga suradi
+            if bal_date and (max_date is None or bal_date > max_date):
+                max_date = bal_date
+
+            # Groups (may be multiple)
+            groups = item.get("groups") or [{"group_code": None, "type_code": None}]
+            for g in groups:
+                gc = g.get("group_code")
+                key = (balance_id, gc)
+                if key not in self.seen_group_pairs:
+                    self.group_rows.append((balance_id, gc, g.get("type_code")))
+                    self.seen_group_pairs.add(key)
+                    added_g += 1
+
+            # Condition mapping (balance_id, cond)
+            cond_key = (balance_id, cond)
+            if cond_key not in self.seen_cond_pairs:
+                self.condition_rows.append((balance_id, cond))
+                self.seen_cond_pairs.add(cond_key)
+                added_c += 1
+
+        return added_f, added_g, added_c, max_date
+
+
+class _RowView:
+    """Columnar bufer qatorlarini tuple ko'rinishida beradi (len + qayta iteratsiya; ro'yxat yaratilmaydi)."""
+
+    def __init__(self, count, rows):
+        self._count = count
+        self._rows = rows
+
+    def __len__(self):
+        return self._count()
+
+    def __iter__(self):
+        return self._rows()
+
+
+class ColumnarRowBuffer:
+    """
+    BalanceRowBuffer bilan bir xil interfeys va bir xil qatorlar, lekin ixcham xotirada (balance_columns):
+    matn ustunlari umumiy ValueDict kodlari (int32), sanalar ordinal (int32), sonlar array('d'), balance_id
+    FixedBytes'da. Scope'dan keladigan ustunlar (warehouse_id/code, filial_id/code) qatorda bitta scope kodi.
+    Group/Condition qatorlari balance_id o'rniga fact tartib raqamini saqlaydi: (raqam, kod) bitta int64.
+    row_hash saqlanmaydi — staging'da tiklangan kontentdan hisoblanadi (qiymati o'sha).
+    Dedupe — KeyIndex (set'dagi bytes/tuple obyektlari o'rniga).
+    Qatorlar faqat staging'ga yozishda (fact_rows / group_rows / condition_rows iteratsiyasi) tiklanadi.
+    """
+    _STR = (0, 4, 5, 6, 7, 9, 10, 12)  # _fact_content indekslari
+    _DATE = (1, 8)
+    _FLOAT = (11, 13)
+    _SCOPE = (2, 3, 14, 15)  # warehouse_id_int, warehouse_code, filial_id_int, filial_code
+
+    def __init__(self):
+        self._hex = BALANCE_KEY_MODE != "binary"
+        width = 64 if self._hex else BALANCE_KEY_BYTES
+        self.values = ValueDict()
+        self.scopes = ValueDict()  # _SCOPE ustunlari tuple'i → kod
+        self.f_id = FixedBytes(width)
+        self.f_cols = {j: array("i") for j in self._STR + self._DATE}
+        self.f_cols.update({j: array("d") for j in self._FLOAT})
+        self.f_scope = array("i")
+        self.g_key, self.g_type = array("q"), array("i")  # g_key: (fact raqami << 32) | group_code kodi
+        self.c_key = array("q")  # (fact raqami << 32) | cond kodi
+        self.fact_index = KeyIndex(width, with_ids=True)
+        self.group_index = KeyIndex(np.int64)
+        self.cond_index = KeyIndex(np.int64)
+        self.fact_rows = _RowView(lambda: len(self.f_id), self._iter_fact)
+        self.group_rows = _RowView(lambda: len(self.g_key), self._iter_group)
+        self.condition_rows = _RowView(lambda: len(self.c_key), self._iter_cond)
+
+    def __len__(self):
+        return len(self.f_id) + len(self.g_key) + len(self.c_key)
+
+    def _key(self, balance_id) -> bytes:
+        return balance_id.encode("ascii") if self._hex else balance_id
+
+    def _out_key(self, b: bytes):
+        return b.decode("ascii") if self._hex else b
+
+    def _append_fact(self, key, content, scope_code):
+        code = self.values.code
+        cols = self.f_cols
+        self.f_id.append(key)
+        self.f_scope.append(scope_code)
+        for j in self._STR:
+            cols[j].append(code(content[j]))
+        for j in self._DATE:
+            cols[j].append(content[j].toordinal() if content[j] is not None else 0)
+        for j in self._FLOAT:
+            cols[j].append(float("nan") if content[j] is None else content[j])
+
+    def add_window(self, scope, balance):
+        """Bitta oyna natijasini qo'shadi. Qaytadi: (added_f, added_g, added_c, max_balance_date)."""
+        bal_dates, expiry_dates, quantities, input_prices, balance_ids = _window_columns(scope, balance)
+        keys = [self._key(b) for b in balance_ids]
+        max_date = max((d for d in bal_dates if d), default=None)
+        code = self.values.code
+
+        is_new, fact_ids = self.fact_index.add(self.fact_index.keys(keys))
+        scope_code = None
+        for i in np.flatnonzero(is_new).tolist():
+            content = _fact_content(scope, balance[i], bal_dates[i], expiry_dates[i], quantities[i], input_prices[i])
+            if scope_code is None:
+                scope_code = self.scopes.code(tuple(content[j] for j in self._SCOPE))
+            self._append_fact(keys[i], content, scope_code)
+
+        g_keys, g_types = [], []
+        for item, f in zip(balance, fact_ids.tolist()):
+            for g in item.get("groups") or [{"group_code": None, "type_code": None}]:
+                g_keys.append((f << 32) | (code(g.get("group_code")) & 0xFFFFFFFF))
+                g_types.append(g.get("type_code"))
+        g_new = self.group_index.add(np.array(g_keys, dtype=np.int64))
+        for i in np.flatnonzero(g_new).tolist():
+            self.g_key.append(g_keys[i])
+            self.g_type.append(code(g_types[i]))
+
+        c_keys = (fact_ids << 32) | (code(scope["cond"]) & 0xFFFFFFFF)
+        c_new = self.cond_index.add(c_keys)
+        self.c_key.extend(c_keys[c_new].tolist())
+
+        return int(is_new.sum()), int(g_new.sum()), int(c_new.sum()), max_date
+
+    @staticmethod
+    def _split(k: int):
+        """int64 kalit → (fact raqami, int32 kod)."""
+        c = k & 0xFFFFFFFF
+        return k >> 32, c - (1 << 32) if c & 0x80000000 else c
+
+    def _iter_fact(self):
+        value = self.values.value
+        c = self.f_cols
+        fromordinal = date.fromordinal
+        for i in range(len(self.f_id)):
+            s = {j: value(c[j][i]) for j in self._STR}
+            d1, d8 = c[1][i], c[8][i]
+            q, p = c[11][i], c[13][i]
+            wid, wcode, fid, fcode = self.scopes.value(self.f_scope[i])
+            content = (
+                s[0], fromordinal(d1) if d1 else None, wid,
+                wcode, s[4], s[5], s[6], s[7], fromordinal(d8) if d8 else None,
+                s[9], s[10], None if q != q else q, s[12], None if p != p else p,
+                fid, fcode,
+            )
+            yield (self._out_key(self.f_id[i]), *content, _content_hash(content))
+
+    def _iter_group(self):
+        value = self.values.value
+        for k, t in zip(self.g_key, self.g_type):
+            f, gc = self._split(k)
+            yield self._out_key(self.f_id[f]), value(gc), value(t)
+
+    def _iter_cond(self):
+        value = self.values.value
+        for k in self.c_key:
+            f, cc = self._split(k)
+            yield self._out_key(self.f_id[f]), value(cc)
+
+
+def new_row_buffer():
+    """ROW_BUFFER bayrog'iga qarab bufer."""
+    return ColumnarRowBuffer() if ROW_BUFFER == "columnar" else BalanceRowBuffer()
+
+
+def check_row_buffer_parity(n_items: int = 3000, seed: int = 1) -> int:
+    """
+    Tasodifiy (takrorli) oynalarni ikkala buferga berib, qatorlar va qaytgan sonlarni solishtiradi.
+    Qaytadi: farqlar soni.   python -c "import balance_main as b; b.check_row_buffer_parity()"
+    """
+    import random
+
+    rnd = random.Random(seed)
+    scope = {"cond": "T", "warehouse_id": "7", "warehouse_id_int": 7, "warehouse_code": "W7",
+             "filial_id_int": None, "filial_code": "F1"}
+    products = [f"p{i}" for i in range(200)]
+    tuples, columnar = BalanceRowBuffer(), ColumnarRowBuffer()
+    mismatches = 0
+    for w in range(n_items // 300 + 1):
+        balance = []
+        for _ in range(300):
+            balance.append({
+                "date": rnd.choice(["01.02.2025", "2025-02-02", "03.02.2025", None, "bad"]),
+                "product_id": rnd.choice(products), "batch_number": rnd.choice([None, "b1", "b2"]),
+                "product_code": rnd.choice([None, "c1", 15, 15.0]), "inventory_kind": "G",
+                "quantity": rnd.choice(["1.5", "1 200,50", None, 3, "x"]), "input_price": rnd.choice(["10", None]),
+                "expiry_date": rnd.choice([None, "31.12.2026"]), "measure_code": "pc",
+                "groups": rnd.choice([None, [], [{"group_code": "g1", "type_code": "t"}, {"group_code": None}]]),
+            })
+        sc = dict(scope, cond=rnd.choice(["T", "B"]))
+        a, b = tuples.add_window(sc, balance), columnar.add_window(sc, balance)
+        if a != b:
+            mismatches += 1
+            print(f"❌ add_window #{w}: {a} != {b}")
+    for name in ("fact_rows", "group_rows", "condition_rows"):
+        exp, got = list(getattr(tuples, name)), list(getattr(columnar, name))
+        if exp != got or [list(map(type, r)) for r in exp] != [list(map(type, r)) for r in got]:
+            mismatches += 1
+            print(f"❌ {name}: {len(exp)} != {len(got)} yoki qiymatlar farq qiladi")
+    print("✅ Bufer pariteti: farq yo'q" if not mismatches else f"❌ Bufer pariteti: {mismatches} ta farq")
+    return mismatches
+
+
+def iter_scope_events(scopes, journal: CheckpointJournal = None):
+    """
+    iter_balance_windows natijalarini scope bo'yicha hodisalarga aylantiradi:
+      ("window", scope, (start, finish, stream))  — oyna oqimi (WindowStream)
+      ("scope_done", scope, failed)               — scope'ning oxirgi oynasidan keyin
+    Iste'molchi stream'ni o'qib bo'lgach stream.error'ni tekshiradi; xato bo'lgan oynalar shu yerda
+    chop etiladi va scope "failed" deb belgilanadi.
+    """
+    failed = set()
+    for scope, start, finish, stream, is_last in iter_balance_windows(scopes):
+        key = scope["scope_key"]
+        yield "window", scope, (start, finish, stream)
+        stream.drain()
+        if stream.error is not None:
+            failed.add(key)
+            print(f"⚠️ API xatosi | {key} | cond:{scope['cond']} | "
+                  f"{start.strftime(DATE_FORMAT)} - {finish.strftime(DATE_FORMAT)} | {stream.error}")
+            if journal is not None:
+                journal.mark_failed(key, start, finish, stream.error)
+        if is_last:
+            yield "scope_done", scope, key in failed
+            failed.discard(key)
+
+
+def add_batch(buf, scope, batch, added=None) -> tuple:
+    """buf.add_window bitta partiya uchun; added — oynaning shu paytgacha yig'ilgan (f, g, c, max_date) natijasi."""
+    with timer("dedupe"):  # kalit/row_hash + bufer dedupe (coerce alohida hisoblanadi)
+        f, g, c, d = buf.add_window(scope, batch)
+    if added is None:
+        return f, g, c, d
+    return added[0] + f, added[1] + g, added[2] + c, max((x for x in (added[3], d) if x), default=None)
+
+
+class ScopeTracker:
+    """Scope bo'yicha max(balance_date) va qo'shilgan fact qatorlar sonini yuritadi."""
+
+    def __init__(self):
+        self._states = {}
+        self.total_items = 0
+
+    def seed(self, scope_key, max_date, added_f: int = 0):
+        """Resume: scope'ning oldingi run'da yuklangan oynalari natijasi."""
+        self._states[scope_key] = {"max_date": max_date, "added_f": added_f}
+
+    def record(self, scope, start, finish, items: int, added):
+        added_f, added_g, added_c, max_date = added
+        st = self._states.setdefault(scope["scope_key"], {"max_date": None, "added_f": 0})
+        st["added_f"] += added_f
+        if max_date and (st["max_date"] is None or max_date > st["max_date"]):
+            st["max_date"] = max_date
+        self.total_items += items
+        METRICS.inc("items_total", items)
+        print(f"✅ {start.strftime(DATE_FORMAT)} - {finish.strftime(DATE_FORMAT)} | "
+              f"{scope['scope_key']} | cond:{scope['cond']} | items:{items} → +F:{added_f}, +G:{added_g}, +C:{added_c}")
+
+    def finish(self, scope, failed):
+        """Scope tugadi. Qaytadi: (max_date, added_f) yoki None (state yangilanmasligi kerak bo'lsa)."""
+        st = self._states.pop(scope["scope_key"], None)
+        if failed:
+            print(f"⏸ LoadState yangilanmadi: {scope['scope_key']} (xato bo'lgan oynalar bor)")
+            return None
+        if not st or not st["max_date"]:
+            return None
+        return st["max_date"], st["added_f"]
+
+
+def fetch_balance_chunks(scopes, state: LoadStateManager, tracker: "ScopeTracker" = None,
+                         journal: CheckpointJournal = None):
+    """
+    Barcha scope/oynalarni parallel yuklab, bitta buferga yig'adi (accumulate-then-merge rejimi).
+    Natijalar scope va oyna tartibida birlashtiriladi, shuning uchun dedupe natijasi ketma-ket
+    yuklash bilan bir xil. LoadState faqat scope'ning barcha oynalari muvaffaqiyatli bo'lsa yangilanadi
+    (state'ga navbatga qo'yiladi — chaqiruvchi MERGE'dan keyin state.flush() qiladi).
+    Qaytadi: fact_rows, group_rows, condition_rows, loaded_windows (commit'dan keyin journal.mark_done uchun)
+    """
+    buf = new_row_buffer()
+    tracker = tracker or ScopeTracker()
+    loaded = []
+
+    for kind, scope, payload in iter_scope_events(scopes, journal):
+        if kind == "window":
+            start, finish, stream = payload
+            added = (0, 0, 0, None)
+            for batch in stream:
+                added = add_batch(buf, scope, batch, added)
+            if stream.error is None:
+                tracker.record(scope, start, finish, stream.items, added)
+                loaded.append((scope["scope_key"], start, finish, added[3], stream.items))
+            continue
+        done = tracker.finish(scope, payload)
+        if done:
+            state.stage(scope["scope_key"], *done)
+
+    print(
+        f"Σ API items: {tracker.total_items} | fact_rows:{len(buf.fact_rows)} | group_rows:{len(buf.group_rows)} | condition_rows:{len(buf.condition_rows)}")
+    return buf.fact_rows, buf.group_rows, buf.condition_rows, loaded
+
+
+# ====== STAGING (#TmpFact / #TmpGroup / #TmpCond) ======
+FACT_COLUMNS = (
+    "balance_id, inventory_kind, balance_date, warehouse_id, warehouse_code, product_code, product_barcode, "
+    "product_id, card_code, expiry_date, serial_number, batch_number, quantity, measure_code, input_price, "
+    "filial_id, filial_code, row_hash"
+)
+STAGING_TABLES = (
+    ("#TmpFact", 18),
+    ("#TmpGroup", 3),
+    ("#TmpCond", 2),
+)
+
+
+def create_temp_tables(cursor):
+    """Temp jadvallarni (qayta) yaratadi — strukturasi FactBalance/BalanceGroup/BalanceCondition ga mos."""
+    cursor.execute(f"""
 IF OBJECT_ID('tempdb..#TmpFact') IS NOT NULL DROP TABLE #TmpFact;
 CREATE TABLE #TmpFact (
-    balance_id      CHAR(64)     NOT NULL,
+    balance_id      {BALANCE_ID_SQL}     NOT NULL PRIMARY KEY,
     inventory_kind  VARCHAR(50)  NULL,
     balance_date    DATE         NULL,
     warehouse_id    INT          NULL,
@@ -618,64 +1694,148 @@ CREATE TABLE #TmpFact (
     measure_code    NVARCHAR(50)  COLLATE {COLLATION} NULL,
     input_price     DECIMAL(18,4) NULL,
     filial_id       INT           NULL,
-    filial_code     NVARCHAR(100) COLLATE {COLLATION} NULL
+    filial_code     NVARCHAR(100) COLLATE {COLLATION} NULL,
+    row_hash        {ROW_HASH_SQL}    NULL
 );
 IF OBJECT_ID('tempdb..#TmpGroup') IS NOT NULL DROP TABLE #TmpGroup;
 CREATE TABLE #TmpGroup (
-    balance_id  CHAR(64)      NOT NULL,
+    balance_id  {BALANCE_ID_SQL}      NOT NULL,
     group_code  NVARCHAR(100) COLLATE {COLLATION} NULL,
     type_code   NVARCHAR(200) COLLATE {COLLATION} NULL
 );
 IF OBJECT_ID('tempdb..#TmpCond') IS NOT NULL DROP TABLE #TmpCond;
 CREATE TABLE #TmpCond (
-    balance_id        CHAR(64)     NOT NULL,
+    balance_id        {BALANCE_ID_SQL}     NOT NULL,
     product_condition NVARCHAR(50) COLLATE {COLLATION} NOT NULL
 );
 """)
 
-    create_temp_tables()
 
-    # 6) Bulk insert (Unicode safe) — xatoda fallback + temp jadvallarni qayta yaratish
+def _row_chunks(rows):
+    """Ro'yxat bo'lsa o'zi; columnar _RowView bo'lsa STAGING_CHUNK_ROWS li ro'yxat bo'laklari."""
+    if isinstance(rows, list):
+        yield rows
+        return
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, STAGING_CHUNK_ROWS))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_staging_executemany(cursor, fact_rows, group_rows, condition_rows):
+    """Parametrli INSERT (fast_executemany). Xatoda temp jadvallar qayta yaratilib, oddiy rejimda takrorlanadi."""
+    def _insert_all():
+        for (table, ncols), rows in zip(STAGING_TABLES, (fact_rows, group_rows, condition_rows)):
+            if rows:
+                for chunk in _row_chunks(rows):
+                    cursor.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * ncols)})", chunk)
+
     try:
         cursor.fast_executemany = True
-        if fact_rows:
-            cursor.executemany("""
-                INSERT INTO #TmpFact VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-            """, fact_rows)
-        if group_rows:
-            cursor.executemany("""
-                INSERT INTO #TmpGroup VALUES (?,?,?)
-            """, group_rows)
-        if condition_rows:
-            cursor.executemany("""
-                INSERT INTO #TmpCond VALUES (?,?)
-            """, condition_rows)
+        _insert_all()
     except pyodbc.Error as e:
         print(f"⚠️ fast_executemany muammo: {e}. Fallback bilan davom etamiz.")
-        create_temp_tables()
+        create_temp_tables(cursor)
         cursor.fast_executemany = False
-        if fact_rows:
-            cursor.executemany("""
-                INSERT INTO #TmpFact VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-            """, fact_rows)
-        if group_rows:
-            cursor.executemany("""
-                INSERT INTO #TmpGroup VALUES (?,?,?)
-            """, group_rows)
-        if condition_rows:
-            cursor.executemany("""
-                INSERT INTO #TmpCond VALUES (?,?)
-            """, condition_rows)
-
-    # 7) MERGE: Fact upsert (PRIMARY KEY = balance_id)
+        _insert_all()
+
+
+def _bulk_value(v):
+    """Python qiymati → BULK INSERT (CSV) matni. None → bo'sh maydon (KEEPNULLS bilan NULL)."""
+    if v is None:
+        return None
+    if isinstance(v, (bytes, bytearray)):
+        return v.hex()  # BINARY ustunlar belgili rejimda hex ko'rinishida o'qiladi
+    if isinstance(v, float):
+        return format(Decimal(repr(v)), "f")  # 1e-05 kabi ilmiy yozuvsiz
+    if hasattr(v, "isoformat"):
+        return v.isoformat()
+    return v
+
+
+def _write_bulk_file(path, rows) -> int:
+    n = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, lineterminator="\n")
+        for r in rows:
+            w.writerow([_bulk_value(v) for v in r])
+            n += 1
+    return n
+
+
+def bulk_insert_staging(cursor, fact_rows, group_rows, condition_rows):
+    """
+    SQL Server bulk-load yo'li: qatorlar CSV faylga oqim bilan yoziladi va BULK INSERT bilan
+    temp jadvalga yuklanadi (BULK_BATCH_SIZE, BULK_TABLOCK). Fayl SQL Server ko'ra oladigan
+    BULK_DIR papkasida bo'lishi kerak (SQL_SERVER=localhost bo'lsa lokal temp papka yetarli).
+    Eslatma: CSV'da bo'sh satr va NULL farqlanmaydi — ikkalasi ham NULL bo'lib yuklanadi.
+    """
+    os.makedirs(BULK_DIR, exist_ok=True)
+    options = [
+        "FORMAT = 'CSV'", "CODEPAGE = '65001'", "FIELDQUOTE = '\"'",
+        "FIELDTERMINATOR = ','", "ROWTERMINATOR = '0x0a'", "KEEPNULLS",
+        f"BATCHSIZE = {int(BULK_BATCH_SIZE)}",
+    ]
+    if BULK_TABLOCK:
+        options.append("TABLOCK")
+
+    for (table, _), rows in zip(STAGING_TABLES, (fact_rows, group_rows, condition_rows)):
+        if not rows:
+            continue
+        path = os.path.join(BULK_DIR, f"balance_{table.strip('#')}_{os.getpid()}_{threading.get_ident()}.csv")
+        try:
+            n = _write_bulk_file(path, rows)
+            sql_path = path.replace("'", "''")
+            cursor.execute(f"BULK INSERT {table} FROM '{sql_path}' WITH ({', '.join(options)});")
+            print(f"📦 BULK INSERT {table}: {n} qator")
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def load_staging(cursor, fact_rows, group_rows, condition_rows):
+    """STAGING_WRITER bayrog'iga qarab staging yozuvchisini tanlaydi."""
+    if STAGING_WRITER == "bulk":
+        try:
+            bulk_insert_staging(cursor, fact_rows, group_rows, condition_rows)
+            return
+        except (pyodbc.Error, OSError) as e:
+            print(f"⚠️ BULK INSERT muammo: {e}. executemany bilan davom etamiz.")
+            create_temp_tables(cursor)
+    insert_staging_executemany(cursor, fact_rows, group_rows, condition_rows)
+
+
+def merge_staging(cursor) -> dict:
+    """
+    #Tmp* jadvallardan FactBalance / BalanceGroup / BalanceCondition ga MERGE (upsert).
+    Partitioned layout'da Fact MERGE o'rniga tegilgan oylar partition SWITCH bilan almashtiriladi,
+    ranges rejimida esa FactBalanceRange oraliqlari yangilanadi.
+    Qaytadi: Fact bo'yicha {"inserted", "updated", "unchanged"} sonlari.
+    """
+    if BALANCE_STORAGE == "ranges":
+        counts = merge_ranges(cursor)
+        merge_range_group_condition(cursor)
+        return counts
+    if FACT_LAYOUT == "partitioned":
+        counts = switch_fact_partitions(cursor)
+    else:
+        counts = merge_fact(cursor)
+    merge_group_condition(cursor)
+    return counts
+
+
+def merge_fact(cursor) -> dict:
+    # 7) MERGE: Fact upsert (PRIMARY KEY = balance_id). #TmpFact'da balance_id takrorlanmaydi
+    # (BalanceRowBuffer dedupe qiladi), faqat row_hash'i o'zgargan qatorlar yangilanadi.
     cursor.execute(f"""
+SET NOCOUNT ON;
+DECLARE @actions TABLE (act NVARCHAR(10));
 MERGE {FACT_TABLE} AS T
-USING (
-    SELECT DISTINCT *
-    FROM #TmpFact
-) AS S
+USING #TmpFact AS S
 ON (T.balance_id = S.balance_id)
-WHEN MATCHED THEN UPDATE SET
+WHEN MATCHED AND (T.row_hash IS NULL OR T.row_hash <> S.row_hash) THEN UPDATE SET
     inventory_kind  = S.inventory_kind,
     balance_date    = S.balance_date,
     warehouse_id    = S.warehouse_id,
@@ -691,18 +1851,92 @@ WHEN MATCHED THEN UPDATE SET
     measure_code    = S.measure_code,
     input_price     = S.input_price,
     filial_id       = S.filial_id,
-    filial_code     = S.filial_code
+    filial_code     = S.filial_code,
+    row_hash        = S.row_hash
 WHEN NOT MATCHED THEN
     INSERT (balance_id, inventory_kind, balance_date, warehouse_id, warehouse_code,
             product_code, product_barcode, product_id, card_code, expiry_date,
             serial_number, batch_number, quantity, measure_code, input_price,
-            filial_id, filial_code)
+            filial_id, filial_code, row_hash)
     VALUES (S.balance_id, S.inventory_kind, S.balance_date, S.warehouse_id, S.warehouse_code,
             S.product_code, S.product_barcode, S.product_id, S.card_code, S.expiry_date,
             S.serial_number, S.batch_number, S.quantity, S.measure_code, S.input_price,
-            S.filial_id, S.filial_code);
+            S.filial_id, S.filial_code, S.row_hash)
+OUTPUT $action INTO @actions;
+SELECT
+    (SELECT COUNT(*) FROM #TmpFact),
+    ISNULL(SUM(CASE WHEN act = 'INSERT' THEN 1 ELSE 0 END), 0),
+    ISNULL(SUM(CASE WHEN act = 'UPDATE' THEN 1 ELSE 0 END), 0)
+FROM @actions;
 """)
+    staged, inserted, updated = cursor.fetchone()
+    return {"inserted": inserted, "updated": updated, "unchanged": staged - inserted - updated}
 
+
+def switch_fact_partitions(cursor) -> dict:
+    """
+    #TmpFact tegadigan har bir oy uchun: oyning yangi holati (eski qatorlar − yangilanganlar + #TmpFact)
+    SWITCH staging jadvalida yig'iladi, FactBalance partition'i TRUNCATE qilinib, staging partition'i
+    SWITCH bilan ulanadi. Ish hajmi faqat tegilgan oylarga proporsional; yopilgan oylar columnstore'da
+    to'liq siqiladi. balance_id sanani o'z ichiga olgani uchun qator faqat o'z oyida bo'lishi mumkin.
+    """
+    switch_table = f"{FACT_TABLE}_Switch"
+    pf = PARTITION_FUNCTION
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    current_month = _month_start(today_samarkand_date())
+
+    cursor.execute("SELECT COUNT(*) FROM #TmpFact WHERE balance_date IS NULL")
+    skipped = cursor.fetchone()[0]
+    if skipped:
+        print(f"⚠️ balance_date NULL bo'lgan {skipped} qator partitioned Fact'ga yozilmaydi")
+
+    cursor.execute(f"""
+SELECT $PARTITION.{pf}(balance_date) AS pn, MIN(balance_date)
+FROM #TmpFact WHERE balance_date IS NOT NULL
+GROUP BY $PARTITION.{pf}(balance_date)
+ORDER BY pn
+""")
+    for pn, month_min in cursor.fetchall():
+        cursor.execute(f"""
+SELECT
+    SUM(CASE WHEN T.balance_id IS NULL THEN 1 ELSE 0 END),
+    SUM(CASE WHEN T.balance_id IS NOT NULL AND (T.row_hash IS NULL OR T.row_hash <> S.row_hash) THEN 1 ELSE 0 END),
+    SUM(CASE WHEN T.row_hash = S.row_hash THEN 1 ELSE 0 END)
+FROM #TmpFact S
+LEFT JOIN {FACT_TABLE} T
+  ON T.balance_id = S.balance_id AND T.balance_date = S.balance_date AND $PARTITION.{pf}(T.balance_date) = ?
+WHERE $PARTITION.{pf}(S.balance_date) = ? AND S.balance_date IS NOT NULL
+""", pn, pn)
+        ins, upd, same = cursor.fetchone()
+        counts["inserted"] += ins or 0
+        counts["updated"] += upd or 0
+        counts["unchanged"] += same or 0
+        if not ins and not upd:
+            continue  # oy o'zgarmagan — qayta yozish shart emas
+
+        cursor.execute(f"IF OBJECT_ID('{switch_table}', 'U') IS NOT NULL DROP TABLE {switch_table};")
+        cursor.execute(partitioned_fact_ddl(switch_table))
+        cursor.execute(f"""
+INSERT INTO {switch_table} WITH (TABLOCK) ({FACT_COLUMNS})
+SELECT {FACT_COLUMNS} FROM {FACT_TABLE} AS T
+WHERE $PARTITION.{pf}(T.balance_date) = ?
+  AND NOT EXISTS (SELECT 1 FROM #TmpFact S WHERE S.balance_id = T.balance_id)
+UNION ALL
+SELECT {FACT_COLUMNS} FROM #TmpFact
+WHERE $PARTITION.{pf}(balance_date) = ? AND balance_date IS NOT NULL;
+""", pn, pn)
+        if FACT_COMPRESSION == "columnstore" and _month_start(month_min) < current_month:
+            short = switch_table.split(".")[-1]
+            cursor.execute(f"ALTER INDEX CCI_{short} ON {switch_table} REORGANIZE "
+                           f"WITH (COMPRESS_ALL_ROW_GROUPS = ON);")
+        cursor.execute(f"TRUNCATE TABLE {FACT_TABLE} WITH (PARTITIONS ({int(pn)}));")
+        cursor.execute(f"ALTER TABLE {switch_table} SWITCH PARTITION {int(pn)} TO {FACT_TABLE} PARTITION {int(pn)};")
+        cursor.execute(f"DROP TABLE {switch_table};")
+        print(f"🔀 Partition {pn} ({_month_start(month_min):%Y-%m}) SWITCH | +{ins} ~{upd}")
+    return counts
+
+
+def merge_group_condition(cursor):
     # 8) MERGE: Group upsert (PRIMARY KEY = balance_id + group_code)
     cursor.execute(f"""
 MERGE {GROUP_TABLE} AS T
@@ -733,15 +1967,192 @@ WHEN NOT MATCHED THEN
     VALUES (S.balance_id, S.product_condition);
 """)
 
+
+def stage_and_merge(cursor, buf) -> dict:
+    """Bufferni temp jadvallarga yozib, MERGE qiladi (commit chaqiruvchida). Qaytadi: merge_staging sonlari."""
+    with timer("staging_insert"):
+        create_temp_tables(cursor)
+        load_staging(cursor, buf.fact_rows, buf.group_rows, buf.condition_rows)
+    _count_rows(buf.fact_rows, buf.group_rows, buf.condition_rows)
+    with timer("merge"):
+        counts = merge_staging(cursor)
+        cursor.execute("DROP TABLE #TmpFact; DROP TABLE #TmpGroup; DROP TABLE #TmpCond;")
+    return counts
+
+
+def _count_rows(fact_rows, group_rows, condition_rows):
+    for table, rows in zip((FACT_TABLE, GROUP_TABLE, CONDITION_TABLE), (fact_rows, group_rows, condition_rows)):
+        METRICS.inc("rows_total", len(rows), table=table)
+
+
+# ====== PIPELINED LOAD ======
+def run_pipelined(conn, cursor, scopes, state: LoadStateManager, tracker: "ScopeTracker" = None,
+                  journal: CheckpointJournal = None):
+    """
+    Yuklangan oynalar PIPELINE_BATCH_ROWS qatorga yetganda staging'ga yoziladi va MERGE + commit qilinadi.
+    Xotira va tranzaksiya hajmi tarix uzunligiga bog'liq emas; fetch thread'lari esa DB yozilayotganda
+    keyingi oynalarni yuklashda davom etadi. Scope'ning LoadState'i shu scope'ning oxirgi ma'lumotlari
+    MERGE qilingan tranzaksiyada yoziladi — state hech qachon yuklanmagan qatorlardan oldinga o'tmaydi.
+    Oynalar jurnalda "done" deb faqat commit'dan keyin belgilanadi.
+    """
+    tracker = tracker or ScopeTracker()
+    buf = new_row_buffer()
+    loaded = []  # joriy buferdagi oynalar: (scope_key, start, finish, max_date, items)
+    totals = {"fact": 0, "group": 0, "cond": 0, "flushes": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+
+    def flush(buf):
+        if not len(buf) and not len(state) and not loaded:
+            return buf
+        counts = stage_and_merge(cursor, buf) if len(buf) else {}
+        for k, v in counts.items():
+            totals[k] += v
+        with timer("merge"):
+            n_states = state.flush(cursor)
+        with timer("commit"):
+            conn.commit()
+        if journal is not None and loaded:
+            journal.mark_done(loaded)
+        loaded.clear()
+        totals["fact"] += len(buf.fact_rows)
+        totals["group"] += len(buf.group_rows)
+        totals["cond"] += len(buf.condition_rows)
+        totals["flushes"] += 1
+        print(f"💾 Flush #{totals['flushes']} | F:{len(buf.fact_rows)} G:{len(buf.group_rows)} "
+              f"C:{len(buf.condition_rows)} | state: {n_states} scope"
+              + (f" | +{counts['inserted']} ~{counts['updated']} ={counts['unchanged']}" if counts else ""))
+        return new_row_buffer()
+
+    for kind, scope, payload in iter_scope_events(scopes, journal):
+        if kind == "window":
+            start, finish, stream = payload
+            added = (0, 0, 0, None)
+            for batch in stream:
+                added = add_batch(buf, scope, batch, added)
+                if len(buf) >= PIPELINE_BATCH_ROWS:  # oyna o'rtasida ham; oyna "done" faqat oxirida yoziladi
+                    buf = flush(buf)
+            if stream.error is None:
+                tracker.record(scope, start, finish, stream.items, added)
+                loaded.append((scope["scope_key"], start, finish, added[3], stream.items))
+            continue
+        done = tracker.finish(scope, payload)
+        if done:
+            state.stage(scope["scope_key"], *done)  # keyingi flush'da shu scope ma'lumotlari bilan birga yoziladi
+    flush(buf)
+
+    print(f"Σ API items: {tracker.total_items} | Fact: {totals['fact']} | Group: {totals['group']} | "
+          f"Condition: {totals['cond']} | flush: {totals['flushes']}")
+    print(f"Σ Fact MERGE | inserted: {totals['inserted']} | updated: {totals['updated']} | "
+          f"unchanged: {totals['unchanged']}")
+
+
+# ====== MAIN ======
+def main(resume: bool = False, replay: bool = False):
+    global REPLAY
+    REPLAY = replay
+    # 1) JSON ni UTF-8 da o‘qiymiz
+    with open(FILIAL_WAREHOUSE_JSON, "r", encoding="utf-8") as f:
+        filial_warehouse_list = json.load(f)
+
+    # read product conditions as simple list of strings: ["T","B","F"]
+    with open(PRODUCT_CONDITION_JSON, "r", encoding="utf-8") as f:
+        cond_json = json.load(f)
+    # cond_json expected like: [ {"product_conditions":["T"]}, {"product_conditions":["B"]} ... ]
+    product_conditions = []
+    for entry in cond_json:
+        pcs = entry.get("product_conditions") or []
+        for p in pcs:
+            if p and p not in product_conditions:
+                product_conditions.append(p)
+
+    # 2) Sana oynasi: 01.01.2025 → bugun (Asia/Samarkand)
+    begin_date = datetime.strptime(BEGIN_DATE_STR, DATE_FORMAT)
+    end_date = datetime.strptime(today_samarkand_date().strftime(DATE_FORMAT), DATE_FORMAT)
+
+    # 3) SQL ga ulanib, jadvallarni tekshiramiz
+    conn = connect_sql()
+    cursor = conn.cursor()
+    print("✅ SQL Serverga ulandik")
+
+    ensure_tables(cursor)
+    migrate_balance_id_to_binary(cursor)
+    migrate_fact_to_partitioned(cursor)
+    ensure_loadstate_table(cursor)
+    conn.commit()
+
+    # Rejalashtirish: LoadState bir marta o'qiladi; --resume bo'lsa jurnaldagi tugallanmagan oynalar
+    state = LoadStateManager().preload(cursor)
+    conn.commit()
+    journal = CheckpointJournal(CHECKPOINT_FILE)
+    tracker = ScopeTracker()
+    if resume:
+        scopes = plan_resume_scopes(journal, state, tracker, filial_warehouse_list, product_conditions)
+        if scopes is None:
+            print("ℹ️ Checkpoint jurnali bo'sh — resume qilinadigan run yo'q.")
+            cursor.close()
+            conn.close()
+            return
+    elif replay:
+        scopes = plan_replay_scopes(filial_warehouse_list, product_conditions, begin_date, end_date)
+        journal.start_run(scopes)
+    else:
+        scopes = plan_balance_scopes(state, filial_warehouse_list, product_conditions, begin_date, end_date)
+        journal.start_run(scopes)
+
+    if PIPELINE_MODE:
+        # 5-10) Oqimli yuklash: batch'lab staging + MERGE + commit
+        run_pipelined(conn, cursor, scopes, state, tracker, journal)
+        cursor.close()
+        conn.close()
+        return
+
+    # 4) API dan ma’lumotlarni yig‘amiz (INCREMENTAL, per-scope per-condition)
+    fact_rows, group_rows, condition_rows, loaded = fetch_balance_chunks(scopes, state, tracker, journal)
+    if not fact_rows and not group_rows and not condition_rows:
+        print("ℹ️ Yangi yozuvlar topilmadi.")
+        state.flush(cursor)
+        conn.commit()
+        journal.mark_done(loaded)
+        cursor.close()
+        conn.close()
+        return
+
+    # 5) Temp jadvallar
+    # 6) Staging yuklash (STAGING_WRITER: "executemany" yoki "bulk")
+    with timer("staging_insert"):
+        create_temp_tables(cursor)
+        load_staging(cursor, fact_rows, group_rows, condition_rows)
+    _count_rows(fact_rows, group_rows, condition_rows)
+
+    # 7-9) MERGE: Fact / Group / Condition
+    with timer("merge"):
+        counts = merge_staging(cursor)
+        state.flush(cursor)  # watermark'lar ma'lumot bilan bitta tranzaksiyada
+
     # 10) Tozalash va commit
     cursor.execute("DROP TABLE #TmpFact; DROP TABLE #TmpGroup; DROP TABLE #TmpCond;")
-    conn.commit()
+    with timer("commit"):
+        conn.commit()
+    journal.mark_done(loaded)
     cursor.close()
     conn.close()
 
     print(
         f"💾 Yuklash yakunlandi | Fact yozuvlar: {len(fact_rows)} | Group yozuvlar: {len(group_rows)} | Condition yozuvlar: {len(condition_rows)}")
+    print(f"Σ Fact MERGE | inserted: {counts['inserted']} | updated: {counts['updated']} | "
+          f"unchanged: {counts['unchanged']}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="SmartUp balance$export → SQL Server")
+    parser.add_argument("--resume", action="store_true",
+                        help="oxirgi run'ning tugallanmagan (pending/failed) oynalarini qayta yuklash")
+    parser.add_argument("--replay", action="store_true",
+                        help="tarmoqsiz: javoblarni smartup_archive'dan o'qib, parse/yuklashni qayta bajarish")
+    args = parser.parse_args()
+    METRICS.start_run("balance")
+    try:
+        main(resume=args.resume, replay=args.replay)
+    except BaseException:
+        METRICS.finish_run(success=False)
+        raise
+    METRICS.finish_run()
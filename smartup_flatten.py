@@ -0,0 +1,549 @@
+# -*- coding: utf-8 -*-
+"""
+Ichma-ich $export javoblarini jadvallarga deklarativ yoyish (flatten) — bitta o'tishda.
+
+Har bir jadval bir marta tasvirlanadi: qaysi ota-jadval elementidagi qaysi ro'yxatdan olinadi, qaysi
+ustunlar (yoki "hammasi") va ajdodlardan qaysi kalitlar meros qilinadi. Flattener shu tavsifdan
+daraxt bo'ylab yuradigan funksiyalarni bir marta tuzadi va javob elementlarini (oqimdan ham) bir marta
+o'qib, barcha jadvallarning ustunlarini to'g'ridan-to'g'ri ustun buferlariga (ustun → list) yozadi:
+  - manba dict'lar o'zgartirilmaydi (product["order_id"] = ... kabi mutatsiya yo'q);
+  - qator-dict ro'yxatlari va har qator uchun pd.DataFrame / json_normalize tip aniqlash yo'q —
+    DataFrame oxirida ustunlardan bir marta quriladi;
+  - tavsifda dtypes berilgan ustunlar (son/sana) tipli massivda (array('q'/'d') + NULL maskasi) saqlanadi va
+    qo'shilayotganda o'giriladi — har qiymat uchun Python str obyekti ushlab turilmaydi.
+
+Qoidalar (eski json_normalize + DataFrame(list[dict]) natijasiga mos):
+  - fields=None — elementning barcha kalitlari, ichki dict'lar sep bilan yoyiladi (max_level gacha);
+  - ro'yxat/dict qiymatli ustunlar (masalan order_products.details) natijaga kirmaydi — ular alohida
+    jadval bo'ladi yoki SQLga baribir yozilmaydi (order_group._drop_nested_columns bilan bir xil);
+  - meros ustunlar elementning o'z kalitini bosib yozadi (eski mutatsiya kabi);
+  - ro'yxat elementi dict bo'lmasa (masalan ["S1", "S2"]), har bir e'lon qilingan ustun qiymati — elementning o'zi.
+
+    flat = Flattener(ORDER_TABLES)
+    flat.feed(iter_json_items(chunks, "order"))
+    frames = flat.frames()      # {"order_main": df, "order_products": df, "order_details": df}
+
+Paritetni tekshirish:  python smartup_flatten.py
+"""
+from array import array
+from datetime import datetime, timedelta
+
+
+class Table:
+    """
+    name     — natija jadvali nomi
+    parent   — ota-jadval nomi (None → javobning yuqori darajadagi elementlari)
+    path     — ota elementidagi ro'yxat kaliti yoki yo'li, masalan "order_products"
+    fields   — None (barcha kalitlar) yoki {ustun: kalit | yo'l} / [kalit, ...]
+    inherit  — {ustun: (ajdod_jadval, kalit | yo'l)}; yo'l = kalitlar/indekslar tuple'i, masalan ("visit_headers", 0, "visit_id")
+    sep, max_level — fields=None bo'lsa ichki dict'larni yoyish (json_normalize kabi)
+    emit     — False: jadval faqat ota sifatida ishlatiladi (qatorlari natijaga chiqmaydi)
+    ensure   — bo'lmasa ham natijada bo'lishi kerak ustunlar (None bilan)
+    ordinal  — ustun nomi: elementning ota ro'yxatidagi tartib raqami (1 dan), tabiiy kalit bo'lmagan qatorlar uchun
+    dtypes   — {ustun: "Int64" | "float64" | ("datetime", format, ...)}: tipli ustunlar; o'girib bo'lmagan
+               qiymat NULL bo'ladi (pd.to_numeric / to_datetime errors="coerce" kabi)
+    """
+
+    def __init__(self, name, parent=None, path=None, fields=None, inherit=None, sep="_", max_level=None,
+                 emit=True, ensure=(), ordinal=None, dtypes=None):
+        self.name = name
+        self.parent = parent
+        self.path = _as_path(path) if path is not None else None
+        if isinstance(fields, (list, tuple)):
+            fields = {f: f for f in fields}
+        self.fields = {k: _as_path(v) for k, v in fields.items()} if fields is not None else None
+        self.inherit = {k: (t, _as_path(p)) for k, (t, p) in (inherit or {}).items()}
+        self.sep = sep
+        self.max_level = max_level
+        self.emit = emit
+        self.ensure = tuple(ensure)
+        self.ordinal = ordinal
+        self.dtypes = dict(dtypes or {})
+        for dt in self.dtypes.values():
+            _TypedColumn(dt)  # noto'g'ri tavsif darhol xato beradi
+
+
+def _as_path(p) -> tuple:
+    return p if isinstance(p, tuple) else (p,)
+
+
+def _resolve(obj, path):
+    for p in path:
+        if isinstance(p, int):
+            obj = obj[p] if isinstance(obj, list) and -len(obj) <= p < len(obj) else None
+        else:
+            obj = obj.get(p) if isinstance(obj, dict) else None
+        if obj is None:
+            return None
+    return obj
+
+
+def _flat_items(d, sep, max_level, prefix=None, level=0):
+    """json_normalize'dagi nested_to_record kabi: ichki dict'lar "ota{sep}bola" kalitlariga yoyiladi."""
+    for k, v in d.items():
+        key = k if prefix is None else f"{prefix}{sep}{k}"
+        if isinstance(v, dict) and (max_level is None or level < max_level):
+            yield from _flat_items(v, sep, max_level, key, level + 1)
+        else:
+            yield key, v
+
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_int(v):
+    if v is None or isinstance(v, bool):
+        return None
+    if not isinstance(v, int):
+        try:
+            v = int(v)
+        except (TypeError, ValueError):
+            try:
+                f = float(v)
+            except (TypeError, ValueError):
+                return None
+            if not f.is_integer():
+                return None
+            v = int(f)
+    return v if _INT64_MIN <= v <= _INT64_MAX else None
+
+
+def _to_float(v):
+    if v is None or isinstance(v, bool):
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class _TypedColumn:
+    """
+    Tipli ustun: qiymat qo'shilayotganda o'giriladi. Int64 / datetime (epoch ns) — array('q'), float64 — array('d');
+    NULL'lar alohida bayt maskada. list kabi ishlatiladi: append, [i] = v, len.
+    """
+    __slots__ = ("kind", "formats", "data", "nulls")
+
+    def __init__(self, dtype):
+        kind, *formats = dtype if isinstance(dtype, tuple) else (dtype,)
+        if kind not in ("Int64", "float64", "datetime") or (kind == "datetime") != bool(formats):
+            raise ValueError(f"Flattener: noma'lum dtype {dtype!r}")
+        self.kind = kind
+        self.formats = tuple(formats)
+        self.data = array("d" if kind == "float64" else "q")
+        self.nulls = bytearray()
+
+    def __len__(self):
+        return len(self.data)
+
+    def _to_datetime(self, v):
+        if isinstance(v, datetime):
+            d = v
+        elif isinstance(v, str):
+            for fmt in self.formats:
+                try:
+                    d = datetime.strptime(v, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return None
+        else:
+            return None
+        return (d - _EPOCH) // _MICROSECOND * 1000
+
+    def _convert(self, v):
+        if self.kind == "Int64":
+            return _to_int(v)
+        if self.kind == "float64":
+            return _to_float(v)
+        return self._to_datetime(v)
+
+    def append(self, v):
+        x = self._convert(v)
+        self.data.append(0 if x is None else x)
+        self.nulls.append(x is None)
+
+    def fill_nulls(self, n: int):
+        self.data.extend([0] * n)
+        self.nulls.extend(b"\x01" * n)
+
+    def __setitem__(self, i, v):
+        x = self._convert(v)
+        self.data[i] = 0 if x is None else x
+        self.nulls[i] = x is None
+
+    def values(self):
+        """pandas massivi: Int64 (nullable), float64 (NULL → NaN), datetime64[ns] (NULL → NaT)."""
+        import numpy as np
+        import pandas as pd
+
+        mask = np.frombuffer(self.nulls, dtype=bool).copy()
+        if self.kind == "Int64":
+            return pd.arrays.IntegerArray(np.array(self.data, dtype=np.int64), mask)
+        if self.kind == "float64":
+            out = np.array(self.data, dtype=np.float64)
+            out[mask] = np.nan
+            return out
+        out = np.array(self.data, dtype=np.int64).view("datetime64[ns]")
+        out[mask] = np.datetime64("NaT")
+        return out
+
+
+class _Columns:
+    """Bitta jadvalning ustun buferlari: {ustun: list | _TypedColumn}, barcha ustunlar uzunligi = n."""
+    __slots__ = ("cols", "n", "nested", "ensure", "dtypes")
+
+    def __init__(self, names=(), ensure=(), dtypes=None):
+        self.dtypes = dtypes or {}
+        self.n = 0
+        self.cols = {c: self._new(c) for c in names}
+        self.nested = set()
+        self.ensure = ensure
+
+    def _new(self, k):
+        dt = self.dtypes.get(k)
+        if dt is None:
+            return [None] * self.n
+        col = _TypedColumn(dt)
+        col.fill_nulls(self.n)
+        return col
+
+    def _col(self, k):
+        col = self.cols.get(k)
+        if col is None:
+            col = self.cols[k] = self._new(k)
+        return col
+
+    def add_row(self, items, inherited):
+        """items: (ustun, qiymat) — elementning o'z qiymatlari; inherited: ajdodlardan (ustidan yoziladi)."""
+        n = self.n
+        filled = 0
+        nested = self.nested
+        for k, v in items:
+            if isinstance(v, (list, dict)):
+                nested.add(k)
+                continue
+            col = self._col(k)
+            if len(col) == n:
+                col.append(v)
+                filled += 1
+        for k, v in inherited:
+            col = self._col(k)
+            if len(col) == n:
+                col.append(v)
+                filled += 1
+            else:
+                col[n] = v
+        if filled < len(self.cols):
+            for col in self.cols.values():
+                if len(col) == n:
+                    col.append(None)
+        self.n = n + 1
+
+
+class Flattener:
+    """Table tavsiflari → bitta o'tishli ekstraktor. feed() bir necha marta chaqirilishi mumkin (oqim bo'laklari)."""
+
+    def __init__(self, tables):
+        self.tables = {t.name: t for t in tables}
+        roots = [t for t in tables if t.parent is None]
+        if len(roots) != 1:
+            raise ValueError(f"Flattener: bitta ildiz jadval kutiladi, {len(roots)} ta berildi")
+        for t in tables:
+            if t.parent is not None and (t.parent not in self.tables or t.path is None):
+                raise ValueError(f"Flattener: {t.name} uchun parent/path noto'g'ri")
+        self.buffers = {t.name: _Columns(t.fields or (), t.ensure, t.dtypes) for t in tables if t.emit}
+        self._ctx = {}
+        self._root = self._compile(roots[0])
+        self.items = 0
+
+    def _compile(self, t):
+        ctx = self._ctx
+        children = [(c.path, self._compile(c)) for c in self.tables.values() if c.parent == t.name]
+        emit = self._emitter(t) if t.emit else None
+        name = t.name
+
+        def node(elem, pos=None):
+            ctx[name] = elem
+            if emit is not None:
+                emit(elem, pos)
+            for path, child in children:
+                lst = _resolve(elem, path)
+                if isinstance(lst, list):
+                    for i, sub in enumerate(lst, 1):
+                        child(sub, i)
+        return node
+
+    def _emitter(self, t):
+        buf = self.buffers[t.name]
+        ctx = self._ctx
+        inherit = tuple((col, anc, path) for col, (anc, path) in t.inherit.items())
+        ordinal = t.ordinal
+
+        def _inherited(pos):
+            out = [(col, _resolve(ctx.get(anc), path)) for col, anc, path in inherit] if inherit else []
+            if ordinal:
+                out.append((ordinal, pos))
+            return out
+
+        if t.fields is None:
+            sep, max_level = t.sep, t.max_level
+
+            def emit(elem, pos):
+                if isinstance(elem, dict):
+                    buf.add_row(_flat_items(elem, sep, max_level), _inherited(pos))
+                else:
+                    buf.add_row((), _inherited(pos))
+            return emit
+
+        fields = tuple(t.fields.items())
+        simple = all(len(p) == 1 for _, p in fields)
+
+        def emit(elem, pos):
+            if not isinstance(elem, dict):
+                items = [(col, elem) for col, _ in fields]  # skalyar ro'yxat elementi
+            elif simple:
+                get = elem.get
+                items = [(col, get(p[0])) for col, p in fields]
+            else:
+                items = [(col, _resolve(elem, p)) for col, p in fields]
+            buf.add_row(items, _inherited(pos))
+        return emit
+
+    def feed(self, items) -> int:
+        """Yuqori darajadagi elementlarni (ro'yxat yoki iterator) bir marta o'qiydi. Qaytadi: elementlar soni."""
+        root = self._root
+        n = 0
+        for item in items:
+            root(item)
+            n += 1
+        self.items += n
+        return n
+
+    def rows(self, name) -> int:
+        return self.buffers[name].n
+
+    def columns(self, name) -> dict:
+        """
+        Jadval ustunlari {ustun: list | massiv} (ro'yxat/dict qiymatli ustunlarsiz, ensure ustunlari bilan);
+        dtypes'dagi ustunlar tipli massiv bo'lib qaytadi (_TypedColumn.values).
+        """
+        buf = self.buffers[name]
+        out = {c: v for c, v in buf.cols.items() if c not in buf.nested}
+        for c in buf.ensure:
+            if c not in out:
+                out[c] = buf._new(c)
+        return {c: v.values() if isinstance(v, _TypedColumn) else v for c, v in out.items()}
+
+    def frames(self, skip_empty: bool = False) -> dict:
+        """{jadval: DataFrame}. skip_empty=True bo'lsa qatorsiz jadvallar qaytarilmaydi."""
+        import pandas as pd
+
+        out = {}
+        for name, buf in self.buffers.items():
+            if skip_empty and not buf.n:
+                continue
+            out[name] = pd.DataFrame(self.columns(name))
+        return out
+
+
+# ====== Yuklovchilar tavsiflari ======
+ORDER_TABLES = (
+    Table("order_main", max_level=1),
+    Table("order_products", parent="order_main", path="order_products",
+          inherit={"order_id": ("order_main", "deal_id")}),
+    Table("order_details", parent="order_products", path="details",
+          inherit={"product_id": ("order_products", "product_id"), "order_id": ("order_main", "deal_id")}),
+)
+
+# new_return.upload_to_sql "*id*" ustunlarini Int64'ga, delivery/booked sanalarini parse_date bilan o'giradi —
+# ma'lum ustunlar shu yerda tipli bo'lib keladi (yuklovchi tipli ustunni qayta o'girmaydi)
+_RETURN_DATE = ("datetime", "%d.%m.%Y %H:%M:%S", "%d.%m.%Y")
+RETURN_TABLES = (
+    Table("anor_return", ensure=("deal_time", "delivery_date", "delivery_number", "booked_date"),
+          dtypes={"deal_id": "Int64", "room_id": "Int64", "person_id": "Int64", "return_reason_id": "Int64",
+                  "order_deal_id": "Int64", "delivery_date": _RETURN_DATE, "booked_date": _RETURN_DATE}),
+    Table("anor_returnproducts", parent="anor_return", path="return_products",
+          inherit={"order_id": ("anor_return", "deal_id")},
+          dtypes={"product_unit_id": "Int64", "order_id": "Int64"}),
+    Table("anor_details", parent="anor_returnproducts", path="details",
+          inherit={"product_id": ("anor_returnproducts", "product_unit_id"), "order_id": ("anor_return", "deal_id")},
+          dtypes={"product_id": "Int64", "order_id": "Int64"}),
+)
+
+# bola qatorlarning tabiiy kaliti yo'q — (visit_id, line_no) kalit bo'ladi (visit.VISIT_KEYS)
+_VISIT_ID = {"visit_id": ("visit", ("visit_headers", 0, "visit_id"))}
+VISIT_TABLES = (
+    Table("visit", emit=False),
+    Table("visit_headers", parent="visit", path="visit_headers"),
+    Table("visit_stocks", parent="visit", path="stocks", inherit=_VISIT_ID, ordinal="line_no"),
+    Table("visit_merchandisings", parent="visit", path="merchandisings", inherit=_VISIT_ID, ordinal="line_no"),
+    Table("visit_quizzes", parent="visit", path="quizzes", inherit=_VISIT_ID, ordinal="line_no"),
+    Table("visit_comments", parent="visit", path="comments", inherit=_VISIT_ID, ordinal="line_no"),
+)
+
+_INVENTORY_KEY = {"product_id": ("inventory", "product_id"), "code": ("inventory", "code")}
+INVENTORY_TABLES = (
+    Table("inventory", sep="."),
+    Table("inventory_groups", parent="inventory", path="groups", inherit=_INVENTORY_KEY,
+          fields=["group_id", "group_code", "type_id"]),
+    Table("inventory_kinds", parent="inventory", path="inventory_kinds", inherit=_INVENTORY_KEY,
+          fields=["kind_code", "state"]),
+    Table("inventory_return", parent="inventory", path="return_conditions", inherit=_INVENTORY_KEY,
+          fields=["condition_code", "is_default"]),
+    Table("inventory_sectors", parent="inventory", path="sector_codes", inherit=_INVENTORY_KEY,
+          fields=["sector_code"]),
+)
+
+
+def flatten(tables, items, skip_empty: bool = False) -> dict:
+    flat = Flattener(tables)
+    flat.feed(items)
+    return flat.frames(skip_empty)
+
+
+# ====== Paritet (eski ko'p o'tishli kod bilan) ======
+def _legacy_frames(kind, data):
+    """Loader'larning oldingi fetch_and_flatten mantiqi (ma'lumot nusxasida, mutatsiya bilan)."""
+    import copy
+
+    import pandas as pd
+
+    data = copy.deepcopy(data)
+    if kind == "order":
+        products, details = [], []
+        for o in data:
+            for p in o.get("order_products", []):
+                p["order_id"] = o.get("deal_id")
+                products.append(p)
+        for p in products:
+            for d in p.get("details", []):
+                d["product_id"], d["order_id"] = p.get("product_id"), p.get("order_id")
+                details.append(d)
+        return {"order_main": pd.json_normalize(data, sep="_", max_level=1),
+                "order_products": pd.DataFrame(products), "order_details": pd.DataFrame(details)}
+    if kind == "return":
+        main = pd.json_normalize(data, sep="_")
+        for col in ["deal_time", "delivery_date", "delivery_number", "booked_date"]:
+            if col not in main.columns:
+                main[col] = None
+        products, details = [], []
+        for o in data:
+            for p in o.get("return_products", []):
+                p["order_id"] = o.get("deal_id")
+                products.append(p)
+        for p in products:
+            if isinstance(p.get("details"), list):
+                for d in p["details"]:
+                    d["product_id"], d["order_id"] = p.get("product_unit_id"), p.get("order_id")
+                    details.append(d)
+        return {"anor_return": main, "anor_returnproducts": pd.DataFrame(products),
+                "anor_details": pd.DataFrame(details)}
+    if kind == "visit":
+        out = {k: [] for k in ("visit_headers", "visit_stocks", "visit_merchandisings", "visit_quizzes",
+                                "visit_comments")}
+        for v in data:
+            vid = v.get("visit_headers", [{}])[0].get("visit_id")
+            out["visit_headers"].extend(v.get("visit_headers", []))
+            for src, dst in (("stocks", "visit_stocks"), ("merchandisings", "visit_merchandisings"),
+                             ("quizzes", "visit_quizzes"), ("comments", "visit_comments")):
+                for r in v.get(src, []):
+                    r["visit_id"] = vid
+                    out[dst].append(r)
+        return {k: pd.DataFrame(v) for k, v in out.items() if v}
+    # inventory
+    out = {"inventory": pd.json_normalize(data)}
+    for name, src, fields in (("inventory_groups", "groups", ["group_id", "group_code", "type_id"]),
+                              ("inventory_kinds", "inventory_kinds", ["kind_code", "state"]),
+                              ("inventory_return", "return_conditions", ["condition_code", "is_default"]),
+                              ("inventory_sectors", "sector_codes", ["sector_code"])):
+        rows = []
+        for item in data:
+            for e in item.get(src, []):
+                row = {"product_id": item.get("product_id"), "code": item.get("code")}
+                row.update({f: (e.get(f) if isinstance(e, dict) else e) for f in fields})
+                rows.append(row)
+        out[name] = pd.DataFrame(rows)
+    return out
+
+
+def _reference_cast(series, dtype):
+    """_TypedColumn bilan solishtirish uchun: xuddi shu o'girish pandas vositalari bilan."""
+    import pandas as pd
+
+    kind, *formats = dtype if isinstance(dtype, tuple) else (dtype,)
+    if kind == "Int64":
+        num = pd.to_numeric(series, errors="coerce")
+        return num.where(num % 1 == 0).astype("Int64")
+    if kind == "float64":
+        return pd.to_numeric(series, errors="coerce")
+    out = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+    for fmt in reversed(formats):  # birinchi mos format ustun turadi
+        parsed = pd.to_datetime(series, format=fmt, errors="coerce")
+        out = parsed.where(parsed.notna(), out)
+    return out
+
+
+def _same_frame(a, b) -> bool:
+    """Ro'yxat/dict ustunlarini tashlab, ustunlar tartibisiz solishtiradi (SQLga yoziladigan qism)."""
+    nested = [c for c in a.columns if a[c].map(lambda v: isinstance(v, (list, dict))).any()]
+    a = a.drop(columns=nested)
+    if a.empty and b.empty:
+        return True
+    if set(a.columns) != set(b.columns) or len(a) != len(b):
+        return False
+    a, b = a[sorted(a.columns)].astype(object), b[sorted(b.columns)].astype(object)
+    return a.where(a.notna(), None).values.tolist() == b.where(b.notna(), None).values.tolist()
+
+
+def _self_check() -> int:
+    """Repo ildizidagi namunalar (+ ularning ko'paytirilgan nusxalari) bo'yicha eski mantiq bilan solishtiradi."""
+    import json
+    import os
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    cases = (("order", "order.json", "order", ORDER_TABLES, False),
+             ("return", "return.json", "return", RETURN_TABLES, False),
+             ("return", "return1.json", "return", RETURN_TABLES, False),
+             ("visit", "visit.json", "visit", VISIT_TABLES, True),
+             ("inventory", "inventory.json", "inventory", INVENTORY_TABLES, False))
+    errors = 0
+    for kind, fname, key, tables, skip_empty in cases:
+        path = os.path.join(root, fname)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f).get(key, [])
+        data = data * 3  # bir necha element: ustun buferlari to'ldirilishini ham tekshiradi
+        if kind == "inventory" and data:
+            data[1] = dict(data[1], sector_codes=["S1", {"sector_code": "S2"}], extra={"a": {"b": 1}})
+        if kind == "return" and data:  # tipli ustunlar: noto'g'ri/bo'sh qiymatlar va ikkinchi sana formati
+            data[1] = dict(data[1], deal_id="x1", room_id="1.5", person_id=" 42 ", order_deal_id=7,
+                           delivery_date="31.12.2024", booked_date="2024-12-31",
+                           return_products=[dict(r) for r in data[1].get("return_products", [])])
+        exp = _legacy_frames(kind, data)
+        for t in tables:
+            for col, dt in t.dtypes.items():
+                if t.name in exp and col in exp[t.name].columns:
+                    exp[t.name][col] = _reference_cast(exp[t.name][col], dt)
+        got = flatten(tables, iter(data), skip_empty)
+        for t in tables:  # ordinal ustunlar eski kodda yo'q edi
+            if t.ordinal and t.name in got:
+                got[t.name] = got[t.name].drop(columns=[t.ordinal])
+        if set(exp) != set(got):
+            errors += 1
+            print(f"❌ {fname}: jadvallar {sorted(exp)} != {sorted(got)}")
+            continue
+        for name in exp:
+            if not _same_frame(exp[name], got[name]):
+                errors += 1
+                print(f"❌ {fname}: {name} farq qiladi")
+    return errors
+
+
+if __name__ == "__main__":
+    n = _self_check()
+    print("✅ smartup_flatten: eski mantiq bilan farq yo'q" if n == 0 else f"❌ smartup_flatten: {n} ta farq")
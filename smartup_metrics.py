@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Yuklovchilar uchun bosqich vaqtlari va hisoblagichlar (metrics).
+
+    from smartup_metrics import METRICS, metered_chunks, timer
+
+    METRICS.start_run("balance")
+    with timer("http_wait"):
+        resp = session.post(...)
+    with timer("decode"):
+        items = list(iter_json_items(metered_chunks(resp.iter_content(CHUNK_SIZE)), "balance"))
+    METRICS.inc("items", len(items))
+    METRICS.observe("window_seconds", dt, filial="F1", warehouse="65461", cond="T")
+    METRICS.finish_run()   # Prometheus textfile + JSON summary
+
+Bosqich vaqtlari eksklyuziv: ichma-ich timer'da ichkisining vaqti tashqisidan ayriladi (thread bo'yicha).
+Masalan "decode" ichida metered_chunks kutgan vaqt "http_wait" ga yoziladi, "decode" da esa faqat parse qoladi.
+Parallel thread'lar vaqtlari qo'shiladi — bosqichlar yig'indisi devor vaqtidan katta bo'lishi mumkin.
+
+Fayllar (METRICS_DIR, standart ~/.smartup/metrics):
+    smartup_<loader>.prom           node_exporter textfile collector uchun (har run'da almashtiriladi)
+    <loader>_run_summary.json       oxirgi run xulosasi (bosqichlar, hisoblagichlar, eng sekin oynalar)
+    <loader>_runs.jsonl             xulosalar tarixi (trend / alert uchun), oxirgi METRICS_HISTORY_RUNS ta run
+"""
+import bisect
+import heapq
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_DIR = os.environ.get("SMARTUP_METRICS_DIR",
+                             os.path.join(os.path.expanduser("~"), ".smartup", "metrics"))
+METRICS_ENABLED = os.environ.get("SMARTUP_METRICS", "1") not in ("0", "false", "no")
+METRICS_HISTORY_RUNS = int(os.environ.get("SMARTUP_METRICS_HISTORY_RUNS", "500"))  # 0 — cheksiz
+PREFIX = "smartup"
+WINDOW_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)  # soniya
+SLOWEST_WINDOWS = 20  # summary'da saqlanadigan eng sekin oynalar
+
+_HELP = {
+    "stage_seconds_total": "Bosqichda o'tgan vaqt (eksklyuziv, thread'lar bo'yicha yig'indi)",
+    "stage_calls_total": "Bosqich chaqiruvlari soni",
+    "bytes_received_total": "API'dan olingan javob baytlari",
+    "items_total": "API'dan olingan elementlar",
+    "rows_total": "SQL'ga yuborilgan qatorlar (jadval bo'yicha)",
+    "retries_total": "Qayta urinishlar (HTTP/tarmoq xatolari)",
+    "errors_total": "Barcha urinishlardan keyin xato bo'lgan oynalar",
+    "window_seconds": "Bitta (scope, oyna) so'rovining to'liq vaqti, retry'lar bilan",
+    "run_duration_seconds": "Run davomiyligi",
+    "run_success": "Oxirgi run muvaffaqiyatli tugadimi (1/0)",
+    "run_last_timestamp_seconds": "Oxirgi run tugagan vaqt (unix)",
+}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _fmt_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    esc = (lambda s: s.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.loader = None
+        self._reset()
+
+    def _reset(self):
+        self.started = time.time()
+        self.counters = {}  # (name, label_key) → float
+        self.histograms = {}  # (name, label_key) → _Histogram
+        self._latencies = []  # window_seconds qiymatlari (kvantillar uchun)
+        self._slowest = []  # min-heap: (seconds, labels)
+
+    # ---- yozish ----
+    def start_run(self, loader: str):
+        with self._lock:
+            self.loader = loader
+            self._reset()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = _Histogram(WINDOW_BUCKETS)
+            h.observe(seconds)
+            self._latencies.append(seconds)
+            item = (seconds, dict(labels))
+            if len(self._slowest) < SLOWEST_WINDOWS:
+                heapq.heappush(self._slowest, item)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Bosqich vaqti (eksklyuziv): ichki timer'lar vaqti shu bosqichdan ayriladi."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = [0.0]  # ichki timer'lar vaqti
+        stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            stack.pop()
+            if stack:
+                stack[-1][0] += dt
+            self.inc("stage_seconds_total", dt - frame[0], stage=stage, **labels)
+            self.inc("stage_calls_total", 1, stage=stage, **labels)
+
+    # ---- eksport ----
+    def _base_labels(self):
+        return (("loader", self.loader or "unknown"),)
+
+    def prometheus_text(self, success: bool, duration: float) -> str:
+        base = self._base_labels()
+        lines = []
+        seen = set()
+
+        def _head(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {PREFIX}_{name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        with self._lock:
+            for (name, lk), v in sorted(self.counters.items()):
+                _head(name, "counter")
+                lines.append(f"{PREFIX}_{name}{_fmt_labels(base + lk)} {v:g}")
+            for (name, lk), h in sorted(self.histograms.items()):
+                _head(name, "histogram")
+                acc = 0
+                for le, c in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    acc += c
+                    lines.append(f"{PREFIX}_{name}_bucket{_fmt_labels(base + lk + (('le', str(le)),))} {acc}")
+                lines.append(f"{PREFIX}_{name}_sum{_fmt_labels(base + lk)} {h.sum:g}")
+                lines.append(f"{PREFIX}_{name}_count{_fmt_labels(base + lk)} {h.count}")
+        for name, v in (("run_duration_seconds", duration), ("run_success", int(success)),
+                        ("run_last_timestamp_seconds", int(time.time()))):
+            _head(name, "gauge")
+            lines.append(f"{PREFIX}_{name}{_fmt_labels(base)} {v:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, success: bool, duration: float) -> dict:
+        with self._lock:
+            stages, counters = {}, {}
+            for (name, lk), v in self.counters.items():
+                labels = dict(lk)
+                if name in ("stage_seconds_total", "stage_calls_total"):
+                    st = stages.setdefault(labels.pop("stage"), {"seconds": 0.0, "calls": 0})
+                    st["seconds" if name == "stage_seconds_total" else "calls"] += v
+                else:
+                    counters[name] = counters.get(name, 0) + v
+            lat = sorted(self._latencies)
+            slowest = sorted(self._slowest, key=lambda x: -x[0])
+
+        def _q(p):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 3) if lat else None
+
+        return {
+            "loader": self.loader,
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "duration_seconds": round(duration, 3),
+            "success": success,
+            "stages": {k: {"seconds": round(v["seconds"], 3), "calls": int(v["calls"])}
+                       for k, v in sorted(stages.items(), key=lambda kv: -kv[1]["seconds"])},
+            "counters": counters,
+            "windows": {"count": len(lat), "p50": _q(0.5), "p95": _q(0.95), "max": _q(1.0),
+                        "slowest": [dict(labels, seconds=round(s, 3)) for s, labels in slowest]},
+        }
+
+    def finish_run(self, success: bool = True) -> dict:
+        """Prometheus textfile va JSON summary'ni yozadi (METRICS_ENABLED bo'lsa). Qaytadi: summary."""
+        duration = time.time() - self.started
+        summary = self.summary(success, duration)
+        if not METRICS_ENABLED:
+            return summary
+        loader = self.loader or "unknown"
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        prom = os.path.join(METRICS_DIR, f"{PREFIX}_{loader}.prom")
+        tmp = prom + ".tmp"  # textfile collector yarim yozilgan faylni o'qimasligi uchun
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(success, duration))
+        os.replace(tmp, prom)
+        path = os.path.join(METRICS_DIR, f"{loader}_run_summary.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        _append_history(os.path.join(METRICS_DIR, f"{loader}_runs.jsonl"), summary)
+        top = ", ".join(f"{k} {v['seconds']:.1f}s" for k, v in list(summary["stages"].items())[:5])
+        print(f"📊 Metrics: {top} → {METRICS_DIR}")
+        return summary
+
+
+def _append_history(path: str, summary: dict, keep: int = METRICS_HISTORY_RUNS):
+    """runs.jsonl'ga qo'shadi; keep dan oshsa eng eski satrlar tashlanadi (fayl almashtiriladi)."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+    if keep <= 0:
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    if len(lines) > keep:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(lines[-keep:])
+        os.replace(tmp, path)
+
+
+METRICS = Metrics()
+timer = METRICS.timer
+
+
+def metered_chunks(chunks, **labels):
+    """
+    response.iter_content o'rami: har bo'lakni kutish vaqti "http_wait" bosqichiga, baytlar
+    bytes_received_total'ga yoziladi. Tashqi timer (masalan "decode") ichida ishlatilsa, kutish undan ayriladi.
+    """
+    it = iter(chunks)
+    while True:
+        with METRICS.timer("http_wait", **labels):
+            chunk = next(it, None)
+        if chunk is None:
+            return
+        METRICS.inc("bytes_received_total", len(chunk), **labels)
+        yield chunk
@@ -1,20 +1,23 @@
+import argparse
+import os
+import sys
+import time
 from datetime import datetime, timedelta
 
 import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 
+# repo ildizidagi umumiy modullar (smartup_stream va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def get_cookies_from_browser(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-    input("🌐 Login qilib bo‘lgach Enter ni bosing...")
-    cookies = driver.get_cookies()
-    driver.quit()
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+from smartup_session import get_session  # noqa: E402
+from order_windows import EXPORT_LIMIT, OrderDensity, adaptive_fetch  # noqa: E402
+from smartup_archive import get_archive, iter_archived_items  # noqa: E402
+from smartup_flatten import ORDER_TABLES, Flattener  # noqa: E402
+from smartup_metrics import METRICS, metered_chunks, timer  # noqa: E402
+from smartup_stream import CHUNK_SIZE, iter_json_items  # noqa: E402
+
+STREAM_JSON = True  # order$export javobini oqim rejimida o'qish
+REPLAY = False  # --replay: javoblar smartup_archive'dan o'qiladi (tarmoqsiz)
 
 
 def auto_cast_dataframe(df: pd.DataFrame) -> pd.DataFrame:
@@ -54,60 +57,60 @@ def auto_cast_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def fetch_and_flatten(data_url, cookies, date_from, date_to):
+def fetch_and_flatten(data_url, session, date_from, date_to):
     try:
         print(f"⬇️ Yuklanmoqda: {date_from} → {date_to}")
-        response = requests.post(
-            data_url,
-            cookies=cookies,
-            json={
-                "begin_deal_date": datetime.strptime(date_from, "%Y-%m-%d").strftime("%d.%m.%Y"),
-                "end_deal_date": datetime.strptime(date_to, "%Y-%m-%d").strftime("%d.%m.%Y")
-            }
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        orders = data.get("order", [])
-        if not orders:
+        request = {
+            "begin_deal_date": datetime.strptime(date_from, "%Y-%m-%d").strftime("%d.%m.%Y"),
+            "end_deal_date": datetime.strptime(date_to, "%Y-%m-%d").strftime("%d.%m.%Y")
+        }
+        window = (date_from, date_to)
+        t0 = time.perf_counter()
+        if REPLAY:
+            items = iter_json_items(get_archive(required=True).chunks_for(data_url, request), "order")
+        else:
+            with timer("http_wait"):
+                response = session.post(data_url, json=request, stream=STREAM_JSON)
+            response.raise_for_status()
+            print("🔎 HTTP status:", response.status_code)
+            archive = get_archive()
+            if STREAM_JSON:
+                items = iter_archived_items(metered_chunks(response.iter_content(chunk_size=CHUNK_SIZE)), "order",
+                                            archive, data_url, request, window)
+            else:
+                with timer("http_wait"):
+                    body = response.content
+                METRICS.inc("bytes_received_total", len(body))
+                if archive is not None:
+                    archive.put(data_url, request, body, window)
+                items = response.json().get("order", [])
+
+        # order_main / order_products / order_details bitta o'tishda, to'g'ridan-to'g'ri ustun buferlariga
+        flat = Flattener(ORDER_TABLES)
+        with timer("decode"):  # oqimda bo'laklarni kutish bu yerdan ayrilib http_wait'ga yoziladi
+            n_orders = flat.feed(items)
+        METRICS.observe("window_seconds", time.perf_counter() - t0)
+        METRICS.inc("items_total", n_orders)
+
+        if not n_orders:
             print("⚠️ Bu oyda 'order' topilmadi")
             return None
 
-        print("🔎 HTTP status:", response.status_code)
-        print("📦 Размер JSON:", len(response.content))
-        data = response.json()
-        print("📊 Кол-во order:", len(data.get("order", [])))
-
-        # order_main
-        order_df = pd.json_normalize(orders, sep="_", max_level=1)
-
-        # order_products
-        order_products_list = []
-        for order in orders:
-            order_id = order.get("deal_id")
-            for product in order.get("order_products", []):
-                product["order_id"] = order_id
-                order_products_list.append(product)
-        order_products_df = pd.DataFrame(order_products_list)
-
-        # order_details
-        details_list = []
-        for product in order_products_list:
-            product_id = product.get("product_id")
-            order_id = product.get("order_id")
-            for detail in product.get("details", []):
-                detail["product_id"] = product_id
-                detail["order_id"] = order_id
-                details_list.append(detail)
-        details_df = pd.DataFrame(details_list)
+        print("📊 Кол-во order:", n_orders)
+
+        with timer("flatten"):
+            frames = flat.frames()
+        order_df, order_products_df, details_df = (
+            frames["order_main"], frames["order_products"], frames["order_details"])
 
         # Dublikatlarni olib tashlash
-        if "deal_id" in order_df.columns:
-            order_df = order_df.drop_duplicates(subset=["deal_id"])
-        if "order_id" in order_products_df.columns:
-            order_products_df = order_products_df.drop_duplicates(subset=["order_id", "product_id"])
-        if "order_id" in details_df.columns:
-            details_df = details_df.drop_duplicates(subset=["order_id", "product_id"])
+        with timer("dedupe"):
+            if "deal_id" in order_df.columns:
+                order_df = order_df.drop_duplicates(subset=["deal_id"])
+            if "order_id" in order_products_df.columns:
+                order_products_df = order_products_df.drop_duplicates(subset=["order_id", "product_id"])
+            if "order_id" in details_df.columns:
+                details_df = details_df.drop_duplicates(subset=["order_id", "product_id"])
 
         print(f"✅ {len(order_df)} order, {len(order_products_df)} product, {len(details_df)} detail")
 
@@ -117,89 +120,261 @@ def fetch_and_flatten(data_url, cookies, date_from, date_to):
             "order_details": details_df
         }
     except Exception as e:
+        # None = "order yo'q"; xato yutilmaydi — aks holda keyingi oynalar watermark'ni xato oynadan o'tkazib yuboradi
         print(f"❌ Xatolik: {e}")
-        return None
+        METRICS.inc("errors_total", stage="fetch")
+        raise
 
 
-def safe_fetch(data_url, cookies, date_from, date_to, limit=7900):
-    result = []
-    stack = [(date_from, date_to)]
-
-    while stack:
-        start, end = stack.pop()
-        data = fetch_and_flatten(data_url, cookies, start, end)
-        if not data:
-            continue
-
-        count = len(data["order_main"])
-        if count >= limit:  # достигнут лимит → делим период пополам
-            start_dt = datetime.strptime(start, "%Y-%m-%d")
-            end_dt = datetime.strptime(end, "%Y-%m-%d")
-            mid_dt = start_dt + (end_dt - start_dt) / 2
-            stack.append((mid_dt.strftime("%Y-%m-%d"), end))
-            stack.append((start, mid_dt.strftime("%Y-%m-%d")))
-        else:
-            result.append(data)
-
-    return result
+def safe_fetch(data_url, session, date_from, date_to, limit=EXPORT_LIMIT, density=None):
+    """
+    [date_from, date_to] ni o'rganilgan order zichligiga mos oynalarda yuklaydi (order_windows.adaptive_fetch).
+    Limitga yetilgan oynalar avval yuklangan qismini saqlab davom ettiriladi; ikkiga bo'lish faqat fallback.
+    """
+    return adaptive_fetch(fetch_and_flatten, data_url, session, date_from, date_to,
+                          density=density, limit=limit)
 
 
 from sqlalchemy import create_engine
-from sqlalchemy.types import Float, Integer, String, DateTime, Boolean
+from sqlalchemy.types import NVARCHAR, BigInteger, Boolean, DateTime, Float, String
 import urllib
 
-
-def upload_to_sql(df_dict):
+from smartup_sink import KEY_NVARCHAR  # noqa: E402
+
+# ====== UPSERT SETTINGS ======
+# Jadval → tabiiy kalit (MERGE shu ustunlar bo'yicha)
+TABLE_KEYS = {
+    "order_main": ["deal_id"],
+    "order_products": ["order_id", "product_id"],
+    "order_details": ["order_id", "product_id"],
+}
+LOADSTATE_TABLE = "dbo.LoadState_Order"
+BEGIN_DATE = datetime(2025, 1, 1)
+INCREMENTAL_BUFFER_DAYS = 7  # watermark'dan necha kun orqaga qayta yuklanadi
+WATERMARK_LOOKBACK_DAYS = 31  # eng yangi watermark'dan shuncha kun ortda qolgan filial (savdo to'xtagan) hisobga olinmaydi
+
+
+def get_engine():
+    params = urllib.parse.quote_plus(
+        "DRIVER={ODBC Driver 17 for SQL Server};"
+        "SERVER=localhost;"
+        "DATABASE=Epco;"
+        "Trusted_Connection=yes;"
+        "TrustServerCertificate=yes;"
+    )
+    return create_engine(f"mssql+pyodbc:///?odbc_connect={params}", fast_executemany=True)
+
+
+def ensure_loadstate_table(conn):
+    conn.exec_driver_sql(f"""
+IF OBJECT_ID('{LOADSTATE_TABLE}','U') IS NULL
+BEGIN
+  CREATE TABLE {LOADSTATE_TABLE}
+  (
+      filial_id      nvarchar(50) NOT NULL PRIMARY KEY,
+      last_deal_date date         NULL,
+      last_run_utc   datetime2    NULL,
+      last_rowcount  int          NULL
+  );
+END
+""")
+
+
+def _incremental_start(watermarks: dict) -> datetime:
+    """
+    {filial_id: last_deal_date} → boshlanish sanasi: faol filiallar watermark'larining eng kichigi -
+    INCREMENTAL_BUFFER_DAYS. Eng yangisidan WATERMARK_LOOKBACK_DAYS dan ko'p ortda qolgan filial oynani
+    cheksiz orqaga tortmasligi uchun tashlanadi; butun loader to'xtab qolgan bo'lsa hamma filial birga ortda
+    qoladi va hech narsa o'tkazib yuborilmaydi.
+    """
+    dates = {f: d for f, d in watermarks.items() if d is not None}
+    if not dates:
+        return BEGIN_DATE
+    cutoff = max(dates.values()) - timedelta(days=WATERMARK_LOOKBACK_DAYS)
+    stale = sorted(f for f, d in dates.items() if d < cutoff)
+    if stale:
+        print(f"⚠️ {len(stale)} ta filial watermark'i {WATERMARK_LOOKBACK_DAYS} kundan ko'p ortda, "
+              f"hisobga olinmadi: {', '.join(stale)}")
+    start = min(d for d in dates.values() if d >= cutoff)
+    start = datetime.combine(start, datetime.min.time()) - timedelta(days=INCREMENTAL_BUFFER_DAYS)
+    return max(BEGIN_DATE, start)
+
+
+def get_incremental_start(engine) -> datetime:
+    """
+    Yuklash boshlanadigan sana (_incremental_start). order$export filial bo'yicha emas, hammasini birga
+    qaytaradi — shuning uchun eng orqada qolgan faol filial hal qiladi.
+    """
+    with engine.begin() as conn:
+        ensure_loadstate_table(conn)
+        rows = conn.exec_driver_sql(f"SELECT filial_id, last_deal_date FROM {LOADSTATE_TABLE}").fetchall()
+    return _incremental_start({str(f): d for f, d in rows})
+
+
+def _filial_watermarks(order_df: pd.DataFrame) -> dict:
+    """order_main → {filial_id: (max deal date, order soni)} (deal_time: dd.mm.yyyy hh:mi:ss)."""
+    if order_df is None or order_df.empty or "filial_id" not in order_df.columns or "deal_time" not in order_df.columns:
+        return {}
+    dates = pd.to_datetime(order_df["deal_time"].astype(str).str.slice(0, 10), format="%d.%m.%Y", errors="coerce")
+    tmp = pd.DataFrame({"filial_id": order_df["filial_id"].astype(str), "d": dates}).dropna()
+    return {f: (g["d"].max().date(), len(g)) for f, g in tmp.groupby("filial_id")}
+
+
+def _sql_dtypes(df: pd.DataFrame, keys=()) -> dict:
+    """
+    Ustun tiplari DataFrame dtype'idan olinadi: auto_cast_dataframe butun sonlarni numpy int8/16/32/64 ga
+    aylantiradi (isinstance(v, int) ular uchun False). Kalitlar indekslanadi — (max) bo'lolmaydi.
+    """
+    dtype_mapping = {}
+    for col in df.columns:
+        s = df[col]
+        if col in keys:
+            dtype_mapping[col] = BigInteger() if pd.api.types.is_integer_dtype(s) else NVARCHAR(KEY_NVARCHAR)
+        elif pd.api.types.is_bool_dtype(s):
+            dtype_mapping[col] = Boolean()
+        elif pd.api.types.is_integer_dtype(s):
+            dtype_mapping[col] = BigInteger()
+        elif pd.api.types.is_float_dtype(s):
+            dtype_mapping[col] = Float()
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            dtype_mapping[col] = DateTime()
+        else:
+            dtype_mapping[col] = String()
+    return dtype_mapping
+
+
+def _key_column_fixes(table_name, df, keys) -> list:
+    """
+    Eski to_sql bilan yaratilgan jadvallarda kalitlar VARCHAR(max) (COL_LENGTH = -1) — indekslab bo'lmaydi.
+    Indeksdan oldin ular BIGINT (butun sonli kalit) yoki NVARCHAR(450) ga o'tkaziladi (smartup_sink kabi).
+    """
+    fixes = []
+    for k in keys:
+        col_type = "BIGINT" if pd.api.types.is_integer_dtype(df[k]) else f"NVARCHAR({KEY_NVARCHAR})"
+        fixes.append(f"""
+IF COL_LENGTH('{table_name}', '{k}') = -1
+    ALTER TABLE [{table_name}] ALTER COLUMN [{k}] {col_type} NULL;
+""")
+    return fixes
+
+
+def _drop_nested_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """list/dict qiymatli ustunlar (masalan order_products.details) alohida jadvalga ajratilgan — SQLga yozilmaydi."""
+    nested = [c for c in df.columns if df[c].map(lambda v: isinstance(v, (list, dict))).any()]
+    return df.drop(columns=nested) if nested else df
+
+
+def _ensure_target(conn, table_name, df, dtype_mapping, keys):
+    """Jadval bo'lmasa DataFrame tiplari bilan yaratadi, yangi ustunlarni qo'shadi, kalit indeksini ta'minlaydi."""
+    dialect = conn.engine.dialect
+    if not dialect.has_table(conn, table_name):
+        df.head(0).to_sql(table_name, con=conn, index=False, dtype=dtype_mapping)
+    existing = {r[0] for r in conn.exec_driver_sql(
+        "SELECT name FROM sys.columns WHERE object_id = OBJECT_ID(?)", (table_name,))}
+    for col in df.columns:
+        if col not in existing:
+            col_type = dtype_mapping[col].compile(dialect=dialect)
+            conn.exec_driver_sql(f"ALTER TABLE [{table_name}] ADD [{col}] {col_type} NULL")
+    for fix in _key_column_fixes(table_name, df, keys):
+        conn.exec_driver_sql(fix)
+    key_cols = ", ".join(f"[{k}]" for k in keys)
+    conn.exec_driver_sql(f"""
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table_name}_key' AND object_id = OBJECT_ID('{table_name}'))
+    CREATE INDEX [IX_{table_name}_key] ON [{table_name}]({key_cols});
+""")
+
+
+def _merge_table(conn, table_name, df, keys):
+    """DataFrame → #stage (fast_executemany) → MERGE ON kalitlar. Qaytadi: stage qatorlari soni."""
+    cols = list(df.columns)
+    col_list = ", ".join(f"[{c}]" for c in cols)
+    stage = f"#stage_{table_name}"
+    conn.exec_driver_sql(f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage}; "
+                         f"SELECT TOP 0 {col_list} INTO {stage} FROM [{table_name}];")
+
+    with timer("staging_insert"):
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        cursor = conn.connection.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany(f"INSERT INTO {stage} ({col_list}) VALUES ({', '.join('?' * len(cols))})", list(rows))
+    METRICS.inc("rows_total", len(df), table=table_name)
+
+    on = " AND ".join(f"T.[{k}] = S.[{k}]" for k in keys)
+    not_null = " AND ".join(f"[{k}] IS NOT NULL" for k in keys)
+    part = ", ".join(f"[{k}]" for k in keys)
+    updates = ",\n    ".join(f"[{c}] = S.[{c}]" for c in cols if c not in keys)
+    with timer("merge"):
+        conn.exec_driver_sql(f"""
+MERGE [{table_name}] AS T
+USING (
+    SELECT {col_list} FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY {part} ORDER BY (SELECT 0)) AS _rn
+        FROM {stage} WHERE {not_null}
+    ) x WHERE _rn = 1
+) AS S
+ON ({on})
+{f"WHEN MATCHED THEN UPDATE SET {updates}" if updates else ""}
+WHEN NOT MATCHED THEN
+    INSERT ({col_list}) VALUES ({", ".join(f"S.[{c}]" for c in cols)});
+DROP TABLE {stage};
+""")
+    return len(df)
+
+
+def upload_to_sql(df_dict, engine=None) -> bool:
+    """
+    order_main / order_products / order_details ni temp jadval orqali MERGE qiladi (kalitlar: TABLE_KEYS),
+    shuning uchun bir oyni qayta yuklash dublikat yaratmaydi. Filial watermark'lari shu tranzaksiyada yangilanadi.
+    Qaytadi: muvaffaqiyat (xatoda tranzaksiya, jumladan watermark, qaytariladi).
+    """
     try:
-        # Подключение к SQL Server
-        params = urllib.parse.quote_plus(
-            "DRIVER={ODBC Driver 17 for SQL Server};"
-            "SERVER=localhost;"
-            "DATABASE=Epco;"
-            "Trusted_Connection=yes;"
-            "TrustServerCertificate=yes;"
-        )
-        engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-
-        for table_name, df in df_dict.items():
-            if df is None or df.empty or df.columns.empty:
-                print(f"⏭ {table_name} bo‘sh – o‘tkazib yuborildi.")
-                continue
-
-            # Автоматическое приведение типов в DataFrame
-            df = auto_cast_dataframe(df)
-
-            print(f"📥 {table_name} ({len(df)} ta satr) yozilmoqda...")
-
-            # Определяем dtype для всех колонок
-            dtype_mapping = {}
-            for col in df.columns:
-                sample_value = df[col].dropna().iloc[0] if not df[col].dropna().empty else None
-                if sample_value is None:
-                    dtype_mapping[col] = String()
-                elif isinstance(sample_value, float):
-                    dtype_mapping[col] = Float()
-                elif isinstance(sample_value, int):
-                    dtype_mapping[col] = Integer()
-                elif isinstance(sample_value, bool):
-                    dtype_mapping[col] = Boolean()
-                elif hasattr(sample_value, "year"):  # datetime
-                    dtype_mapping[col] = DateTime()
-                else:
-                    dtype_mapping[col] = String()
-
-            # Создаём таблицу заново, полностью под DataFrame
-            df.to_sql(
-                table_name,
-                con=engine,
-                index=False,
-                if_exists="append",  # append
-                dtype=dtype_mapping
-            )
+        engine = engine or get_engine()
+        watermarks = _filial_watermarks(df_dict.get("order_main"))
+
+        with engine.connect() as conn:
+            tx = conn.begin()  # commit vaqti alohida o'lchanadi; xatoda ulanish yopilganda rollback
+            ensure_loadstate_table(conn)
+            for table_name, df in df_dict.items():
+                if df is None or df.empty or df.columns.empty:
+                    print(f"⏭ {table_name} bo‘sh – o‘tkazib yuborildi.")
+                    continue
+                keys = TABLE_KEYS[table_name]
+                if any(k not in df.columns for k in keys):
+                    print(f"⚠️ {table_name}: kalit ustunlari {keys} yo‘q – o‘tkazib yuborildi.")
+                    continue
+
+                # Автоматическое приведение типов в DataFrame
+                with timer("coerce"):
+                    df = auto_cast_dataframe(_drop_nested_columns(df))
+                    dtype_mapping = _sql_dtypes(df, keys)
+
+                print(f"📥 {table_name} ({len(df)} ta satr) MERGE qilinmoqda...")
+                _ensure_target(conn, table_name, df, dtype_mapping, keys)
+                _merge_table(conn, table_name, df, keys)
+
+            for filial_id, (last_date, n) in watermarks.items():
+                conn.exec_driver_sql(f"""
+MERGE {LOADSTATE_TABLE} AS T
+USING (SELECT ? AS filial_id, ? AS last_deal_date, ? AS last_rowcount) AS S
+   ON T.filial_id = S.filial_id
+WHEN MATCHED THEN UPDATE SET
+    last_deal_date = CASE WHEN T.last_deal_date IS NULL OR S.last_deal_date > T.last_deal_date
+                          THEN S.last_deal_date ELSE T.last_deal_date END,
+    last_run_utc   = SYSUTCDATETIME(),
+    last_rowcount  = S.last_rowcount
+WHEN NOT MATCHED THEN
+    INSERT (filial_id, last_deal_date, last_run_utc, last_rowcount)
+    VALUES (S.filial_id, S.last_deal_date, SYSUTCDATETIME(), S.last_rowcount);
+""", (filial_id, last_date, n))
+            with timer("commit"):
+                tx.commit()
 
         print("✅ SQL Serverga yozildi.")
+        return True
     except Exception as e:
         print(f"❌ SQL yozishda xatolik: {e}")
+        METRICS.inc("errors_total", stage="upload")
+        return False
 
 
 def month_ranges(start_date, end_date):
@@ -211,13 +386,156 @@ def month_ranges(start_date, end_date):
         current = next_month
 
 
-if __name__ == "__main__":
-    DATA_URL = "https://smartup.online/b/trade/txs/tdeal/order$export"
-    cookies = get_cookies_from_browser("https://smartup.online")
-    start_date = datetime(2025, 1, 1)
-    end_date = datetime.today()
+def replay_from_archive(data_url, engine, date_from=None, date_to=None) -> bool:
+    """
+    Arxivdagi order$export javoblarini (har so'rov kalitining oxirgisi, sana tartibida) qayta parse qilib
+    yuklaydi. Limitga yetgan va keyin bo'lingan oynalar ham arxivda — takrorlar MERGE kalitlari bilan yo'qoladi.
+    """
+    entries = get_archive(required=True).entries(data_url, date_from, date_to)
+    print(f"📼 Replay: {len(entries)} ta arxivlangan javob")
+    for entry in entries:
+        w = entry["window"]
+        try:
+            df_dict = fetch_and_flatten(data_url, None, w[0], w[1])
+        except Exception:
+            return False
+        if df_dict and not upload_to_sql(df_dict, engine):
+            return False
+    return True
+
+
+def load_incremental(data_url, engine, session, start_date=None, end_date=None, density=None) -> bool:
+    """
+    [watermark - buffer, bugun] oralig'ini oyma-oy yuklaydi. Birinchi xato oyna yoki yozishda to'xtaydi:
+    watermark faqat uzluksiz muvaffaqiyatli oynalar bo'yicha siljiydi, keyingi run xato oynani qayta yuklaydi.
+    """
+    start_date = start_date or get_incremental_start(engine)
+    end_date = end_date or datetime.today()
+    print(f"📅 Yuklash oralig'i: {start_date:%Y-%m-%d} → {end_date:%Y-%m-%d}")
+    density = density or OrderDensity()
     for date_from, date_to in month_ranges(start_date, end_date):
-        results = safe_fetch(DATA_URL, cookies, date_from, date_to)
+        try:
+            results = safe_fetch(data_url, session, date_from, date_to, density=density)
+        except Exception:
+            print(f"⛔ {date_from} → {date_to} yuklanmadi, to'xtatildi (keyingi run shu joydan davom etadi).")
+            return False
+        finally:
+            density.save()
         for df_dict in results:
-            if df_dict:
-                upload_to_sql(df_dict)
+            if df_dict and not upload_to_sql(df_dict, engine):
+                print(f"⛔ {date_from} → {date_to} yozilmadi, to'xtatildi.")
+                return False
+    return True
+
+
+def _self_check():
+    """
+    Tarmoq/SQL'siz: bitta oyna xato bersa run to'xtaydi, watermark undan o'tmaydi va keyingi run o'sha oynani
+    qayta yuklaydi. fetch/upload/watermark modul darajasida soxtalari bilan almashtiriladi.
+        python smartup_order/order_group.py --self-check
+    """
+    import tempfile
+
+    g = globals()
+    saved = {k: g[k] for k in ("fetch_and_flatten", "upload_to_sql", "get_incremental_start")}
+    state = {"watermark": None, "fail": {("2025-02-01", "2025-03-01")}, "fetched": []}
+
+    def fake_fetch(data_url, session, date_from, date_to):
+        state["fetched"].append((date_from, date_to))
+        if (date_from, date_to) in state["fail"]:
+            raise ConnectionError(f"{date_from}: timeout")
+        d = datetime.strptime(date_to, "%Y-%m-%d") - timedelta(days=1)
+        return {"order_main": pd.DataFrame({"deal_id": [date_from], "filial_id": ["1"],
+                                            "deal_time": [d.strftime("%d.%m.%Y 10:00:00")]})}
+
+    def fake_upload(df_dict, engine=None):
+        marks = _filial_watermarks(df_dict["order_main"])
+        last = max(d for d, _ in marks.values())
+        state["watermark"] = max(filter(None, (state["watermark"], last)))
+        return True
+
+    def fake_start(engine):
+        if state["watermark"] is None:
+            return BEGIN_DATE
+        return datetime.combine(state["watermark"], datetime.min.time()) - timedelta(days=INCREMENTAL_BUFFER_DAYS)
+
+    g.update(fetch_and_flatten=fake_fetch, upload_to_sql=fake_upload, get_incremental_start=fake_start)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            end = datetime(2025, 4, 1)
+            density = OrderDensity(os.path.join(tmp, "density.json"))
+            ok = load_incremental("fake://order", None, None, end_date=end, density=density)
+            assert not ok and state["fetched"][-1] == ("2025-02-01", "2025-03-01"), state["fetched"]
+            assert state["watermark"] < datetime(2025, 2, 1).date(), state["watermark"]  # mart yuklanmagan
+
+            state["fail"].clear()
+            state["fetched"].clear()
+            ok = load_incremental("fake://order", None, None, end_date=end, density=density)
+            assert ok and ("2025-02-01", "2025-03-01") in state["fetched"], state["fetched"]
+            assert state["watermark"] == datetime(2025, 3, 31).date(), state["watermark"]
+    finally:
+        g.update(saved)
+
+    # to'xtagan filial oynani orqaga tortmaydi; hamma filial ortda qolsa hech narsa tashlanmaydi
+    d = datetime(2025, 6, 30).date()
+    assert _incremental_start({"1": d, "2": d - timedelta(days=3), "9": datetime(2025, 2, 1).date()}) \
+        == datetime(2025, 6, 27) - timedelta(days=INCREMENTAL_BUFFER_DAYS)
+    assert _incremental_start({"1": d, "2": d - timedelta(days=WATERMARK_LOOKBACK_DAYS)}) \
+        == datetime(2025, 5, 30) - timedelta(days=INCREMENTAL_BUFFER_DAYS)
+    assert _incremental_start({"1": None}) == BEGIN_DATE
+    print("✅ order_group: xato oyna watermark'ni siljitmaydi va keyingi run'da qayta yuklanadi, "
+          "to'xtagan filial oynani orqaga tortmaydi.")
+
+
+def _ddl_self_check():
+    """
+    Haqiqiy DDL mssql dialektida kompilyatsiya qilinadi (upload_to_sql soxtasi buni ko'rmaydi): auto_cast'dan
+    o'tgan kalitlar BIGINT / NVARCHAR(450), eski (max) kalitlar indeksdan oldin shu tiplarga o'tkaziladi.
+    """
+    from sqlalchemy import Column, MetaData, Table
+    from sqlalchemy.dialects import mssql
+    from sqlalchemy.schema import CreateTable
+
+    dialect = mssql.dialect()
+    frames = {
+        "order_main": pd.DataFrame({"deal_id": ["126866949", "3000000001"], "filial_id": ["1", "2"],
+                                    "deal_time": ["01.02.2025 10:00:00", None], "total": ["1.5", "2.25"]}),
+        "order_products": pd.DataFrame({"order_id": ["7", "8"], "product_id": ["A-1", "B-2"],
+                                        "is_bonus": ["true", "false"]}),
+    }
+    for table_name, df in frames.items():
+        keys = TABLE_KEYS[table_name]
+        df = auto_cast_dataframe(df)
+        mapping = _sql_dtypes(df, keys)
+        table = Table(table_name, MetaData(), *(Column(c, t) for c, t in mapping.items()))
+        ddl = str(CreateTable(table).compile(dialect=dialect))
+        for k in keys:
+            line = next(ln for ln in ddl.splitlines() if ln.strip().startswith(k + " "))
+            assert "(max)" not in line, ddl
+            expected = "BIGINT" if pd.api.types.is_integer_dtype(df[k]) else f"NVARCHAR({KEY_NVARCHAR})"
+            assert expected in line and expected in "".join(_key_column_fixes(table_name, df, [k])), (line, expected)
+    print("✅ order_group: kalit ustunlari mssql DDL'da BIGINT/NVARCHAR(450), (max) emas.")
+
+
+if __name__ == "__main__":
+    DATA_URL = "https://smartup.online/b/trade/txs/tdeal/order$export"
+    parser = argparse.ArgumentParser(description="SmartUp order$export → SQL Server")
+    parser.add_argument("--replay", action="store_true", help="tarmoqsiz: arxivdagi javoblarni qayta yuklash")
+    parser.add_argument("--from", dest="date_from", help="replay oralig'i boshi (yyyy-mm-dd)")
+    parser.add_argument("--to", dest="date_to", help="replay oralig'i oxiri (yyyy-mm-dd)")
+    parser.add_argument("--self-check", action="store_true", help="tarmoqsiz: xato oyna/watermark va DDL tekshiruvi")
+    args = parser.parse_args()
+    if args.self_check:
+        _self_check()
+        _ddl_self_check()
+        sys.exit(0)
+    engine = get_engine()
+    METRICS.start_run("order")
+    if args.replay:
+        REPLAY = True
+        METRICS.finish_run(success=replay_from_archive(DATA_URL, engine, args.date_from, args.date_to))
+        sys.exit(0)
+
+    ok = load_incremental(DATA_URL, engine, get_session())
+    METRICS.finish_run(success=ok)
+    sys.exit(0 if ok else 1)
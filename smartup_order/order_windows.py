@@ -0,0 +1,185 @@
+"""
+order$export uchun adaptiv sana oynalari.
+
+order$export bitta so'rovda ko'pi bilan EXPORT_LIMIT ta order qaytaradi. Avval butun oy yuklanib,
+limitga yetsa tashlab yuborilib, oraliq ikkiga bo'linardi — og'ir oylar 2–4 marta yuklanardi.
+
+Bu yerda endpoint (kalit, standart: data_url) bo'yicha kunlik order zichligi oldingi yuklashlardan
+o'rganiladi va diskka (DENSITY_FILE, ~/.smartup ostida) saqlanadi. order$export filial parametrini olmaydi — barcha filiallar
+bitta javobda keladi, shuning uchun zichlik ham bitta, umumiy. Oyna uzunligi shunday tanlanadiki,
+kutilgan order soni limitning TARGET_FILL qismidan oshmasin. Limitga baribir yetilsa:
+  - "kesish" kuni aniqlanadi: javob deal_time bo'yicha tartiblangan bo'lsa oxirgi qatorning kuni, aks holda
+    javob dumidagi (TAIL_FRACTION) qatorlarning eng kichik kuni — server tabiiy tartibda (yaratilish bo'yicha)
+    qaytaradi, limitdan keyingi qatorlar shu kundan oldin bo'lmaydi deb olinadi;
+  - kesish kunidan oldingi qatorlar saqlab qolinadi, yuklash kesish kunidan davom etadi (yuklangan qism
+    qayta yuklanmaydi);
+  - kesish kuni oyna boshiga teng bo'lsa (oldinga siljib bo'lmaydi) oraliq ikkiga bo'linadi.
+"""
+import json
+import math
+import os
+from collections import deque
+from datetime import datetime, timedelta
+
+DENSITY_FILE = os.environ.get("SMARTUP_ORDER_DENSITY",
+                              os.path.join(os.path.expanduser("~"), ".smartup", "order_density.json"))
+EXPORT_LIMIT = 7900
+TARGET_FILL = 0.8  # limitning qancha qismini mo'ljallaymiz
+TAIL_FRACTION = 0.05  # tartiblanmagan javobda kesish kuni shu dum ulushidagi eng kichik sana
+MIN_WINDOW_DAYS = 1
+MAX_WINDOW_DAYS = 31
+EWMA_ALPHA = 0.3
+
+_FMT = "%Y-%m-%d"
+
+
+class OrderDensity:
+    """Kalit (endpoint) bo'yicha kunlik order zichligi (orders/day), EWMA bilan yangilanadi va JSON faylda saqlanadi."""
+
+    def __init__(self, path: str = DENSITY_FILE):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def rate(self, key):
+        entry = self.data.get(key)
+        return entry["orders_per_day"] if entry else None
+
+    def observe(self, key, days: int, count: int, capped: bool = False):
+        """Bitta oyna natijasini hisobga oladi. capped=True bo'lsa haqiqiy zichlik kamida count/days."""
+        days = max(1, days)
+        observed = count / days
+        old = self.rate(key)
+        if capped:
+            new = max(old or 0.0, observed * 1.25)
+        elif old is None:
+            new = observed
+        else:
+            new = EWMA_ALPHA * observed + (1 - EWMA_ALPHA) * old
+        self.data[key] = {"orders_per_day": new, "updated": datetime.now().isoformat(timespec="seconds")}
+
+    def window_days(self, key, limit: int = EXPORT_LIMIT) -> int:
+        rate = self.rate(key)
+        if not rate:
+            return MAX_WINDOW_DAYS
+        return max(MIN_WINDOW_DAYS, min(MAX_WINDOW_DAYS, math.floor(TARGET_FILL * limit / rate)))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+def _days(start: str, end: str) -> int:
+    return (datetime.strptime(end, _FMT) - datetime.strptime(start, _FMT)).days + 1
+
+
+def _shift(day: str, n: int) -> str:
+    return (datetime.strptime(day, _FMT) + timedelta(days=n)).strftime(_FMT)
+
+
+def _deal_dates(order_df):
+    """order_main'dagi deal_time → yyyy-mm-dd (topilmasa None)."""
+    if "deal_time" not in order_df.columns:
+        return None
+    out = []
+    for v in order_df["deal_time"].tolist():
+        try:
+            out.append(datetime.strptime(str(v)[:10], "%d.%m.%Y").strftime(_FMT))
+        except ValueError:
+            return None
+    return out
+
+
+def _keep_before(data: dict, dates, day: str) -> dict:
+    """Faqat `day` dan oldingi deal'larni (va ularning product/detail'larini) qoldiradi."""
+    order_df = data["order_main"]
+    mask = [d < day for d in dates]
+    kept = order_df[mask]
+    ids = set(kept["deal_id"].tolist()) if "deal_id" in kept.columns else set()
+    out = {"order_main": kept}
+    for name in ("order_products", "order_details"):
+        df = data.get(name)
+        if df is not None and "order_id" in df.columns:
+            df = df[df["order_id"].isin(ids)]
+        out[name] = df
+    return out
+
+
+def _cut_day(dates, start: str, end: str):
+    """
+    Limitga yetgan javobda to'liq deb hisoblanadigan kunlar chegarasi: undan oldingi kunlar saqlanadi.
+    Tartiblangan javob — oxirgi qator kuni; tartiblanmagan — dumdagi TAIL_FRACTION qatorlarning eng kichik kuni.
+    Qaytadi: yyyy-mm-dd yoki None (saqlanadigan kun yo'q / sanalar o'qilmadi).
+    """
+    if not dates or not all(start <= d <= end for d in dates):
+        return None
+    if dates == sorted(dates):
+        cut = dates[-1]
+    else:
+        cut = min(dates[-max(1, int(len(dates) * TAIL_FRACTION)):])
+    return cut if cut > start else None
+
+
+def adaptive_fetch(fetch, data_url, session, date_from: str, date_to: str, key=None,
+                   density: OrderDensity = None, limit: int = EXPORT_LIMIT):
+    """
+    fetch(data_url, session, start, end) -> {"order_main": df, ...} | None  (order_group.fetch_and_flatten)
+    [date_from, date_to] oralig'ini (ikkala chegara ham kiradi) zichlikka mos oynalarga bo'lib yuklaydi.
+    Qaytadi: natija dict'lari ro'yxati.
+    """
+    key = key or data_url
+    own_density = density is None
+    density = density or OrderDensity()
+    result = []
+
+    step = density.window_days(key, limit)
+    queue = deque()
+    cur = date_from
+    while cur <= date_to:
+        end = min(_shift(cur, step - 1), date_to)
+        queue.append((cur, end))
+        cur = _shift(end, 1)
+
+    while queue:
+        start, end = queue.popleft()
+        data = fetch(data_url, session, start, end)
+        days = _days(start, end)
+        if not data:
+            continue
+
+        count = len(data["order_main"])
+        if count < limit:
+            density.observe(key, days, count)
+            result.append(data)
+            continue
+
+        density.observe(key, days, count, capped=True)
+        if days <= 1:
+            print(f"⚠️ {start}: bir kunda {count} ta order (limit {limit}) — bo'lib bo'lmaydi, shu holicha olinadi")
+            result.append(data)
+            continue
+
+        dates = _deal_dates(data["order_main"])
+        cut = _cut_day(dates, start, end)
+        if cut is not None:
+            # kesish kunidan oldingi kunlar to'liq — saqlanadi, qayta yuklanmaydi
+            result.append(_keep_before(data, dates, cut))
+            print(f"✂️ Limit: {start} → {end} | {cut} gacha saqlandi, qolgani davom ettiriladi")
+            queue.appendleft((cut, end))
+            continue
+
+        # Fallback: ikkiga bo'lish (kesish kuni oyna boshida — saqlanadigan to'liq kun yo'q)
+        mid = _shift(start, days // 2 - 1)
+        print(f"✂️ Limit: {start} → {end} | ikkiga bo'linadi ({mid})")
+        queue.appendleft((_shift(mid, 1), end))
+        queue.appendleft((start, mid))
+
+    if own_density:
+        density.save()
+    return result
@@ -1,24 +1,16 @@
+import os
+import sys
 import urllib
 from datetime import datetime, timedelta
 
 import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from sqlalchemy import create_engine
 from sqlalchemy.types import Float, Integer, String, DateTime, Boolean
 
+# repo ildizidagi umumiy modullar (smartup_session va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# 🔹 Cookies olish
-def get_cookies_from_browser(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-    input("🌐 Login qilib bo‘lgach Enter ni bosing...")
-    cookies = driver.get_cookies()
-    driver.quit()
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+from smartup_session import get_session  # noqa: E402
 
 
 # 🔹 DataFrame typelarni avtomatik o‘zgartirish
@@ -62,12 +54,11 @@ def auto_cast_dataframe(df: pd.DataFrame) -> pd.DataFrame:
 
 
 # 🔹 JSON flatten qilish
-def fetch_and_flatten(data_url, cookies, date_from, date_to):
+def fetch_and_flatten(data_url, session, date_from, date_to):
     try:
         print(f"⬇️ Yuklanmoqda: {date_from} → {date_to}")
-        response = requests.post(
+        response = session.post(
             data_url,
-            cookies=cookies,
             json={
                 "begin_deal_date": datetime.strptime(date_from, "%Y-%m-%d").strftime("%d.%m.%Y"),
                 "end_deal_date": datetime.strptime(date_to, "%Y-%m-%d").strftime("%d.%m.%Y")
@@ -125,13 +116,13 @@ def fetch_and_flatten(data_url, cookies, date_from, date_to):
 
 
 # 🔹 Limit bo‘yicha bo‘lish
-def safe_fetch(data_url, cookies, date_from, date_to, limit=7900):
+def safe_fetch(data_url, session, date_from, date_to, limit=7900):
     result = []
     stack = [(date_from, date_to)]
 
     while stack:
         start, end = stack.pop()
-        data = fetch_and_flatten(data_url, cookies, start, end)
+        data = fetch_and_flatten(data_url, session, start, end)
         if not data:
             continue
 
@@ -220,7 +211,7 @@ def month_ranges(start_date, end_date):
 # 🔹 Main
 if __name__ == "__main__":
     DATA_URL = "https://smartup.online/b/trade/txs/tdeal/order$export"
-    cookies = get_cookies_from_browser("https://smartup.online")
+    session = get_session()
 
     # 🔹 Start doim 2025-01-01
     start_date = datetime(2025, 1, 1)
@@ -229,7 +220,7 @@ if __name__ == "__main__":
     end_date = datetime.today()
 
     for date_from, date_to in month_ranges(start_date, end_date):
-        results = safe_fetch(DATA_URL, cookies, date_from, date_to)
+        results = safe_fetch(DATA_URL, session, date_from, date_to)
         for df_dict in results:
             if df_dict:
                 upload_to_sql(df_dict)
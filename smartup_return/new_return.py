@@ -1,68 +1,39 @@
 import json
+import os
+import sys
+
 import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from sqlalchemy import create_engine, NVARCHAR, DateTime, Integer
 import urllib
 from datetime import datetime
 
+# repo ildizidagi umumiy modullar (smartup_stream va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartup_flatten import RETURN_TABLES, flatten  # noqa: E402
+from smartup_session import get_session  # noqa: E402
+from smartup_stream import iter_response_items  # noqa: E402
 
-def get_cookies_from_browser(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-    input("🌐 Зайдите на сайт и нажмите Enter после авторизации...")
-    cookies = driver.get_cookies()
-    driver.quit()
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+STREAM_JSON = True  # return$export javobini oqim rejimida o'qish
 
 
 def fetch_and_flatten(data_url):
-    cookies = get_cookies_from_browser("https://smartup.online")
     print("⬇️ Загружаем данные...")
-    response = requests.get(data_url, cookies=cookies)
+    response = get_session().get(data_url, stream=STREAM_JSON)
     response.raise_for_status()
-    data = response.json()
-
-    if isinstance(data, dict) and "return" in data:
-        data = data["return"]
-
-    order_df = pd.json_normalize(data, sep="_")
-
-    # Гарантируем наличие ключевых колонок
-    for col in ["deal_time", "delivery_date", "delivery_number", "booked_date"]:
-        if col not in order_df.columns:
-            order_df[col] = None
-
-    # Таблица товаров
-    order_products_list = []
-    for order in data:
-        order_id = order.get("deal_id")
-        for product in order.get("return_products", []):
-            product["order_id"] = order_id
-            order_products_list.append(product)
-    order_products_df = pd.DataFrame(order_products_list)
-
-    # Таблица деталей
-    details_list = []
-    for product in order_products_list:
-        product_id = product.get("product_unit_id")
-        order_id = product.get("order_id")
-        if isinstance(product.get("details"), list):
-            for detail in product.get("details", []):
-                detail["product_id"] = product_id
-                detail["order_id"] = order_id
-                details_list.append(detail)
-    details_df = pd.DataFrame(details_list)
-
-    print(f"✅ Получено: {len(order_df)} возвратов, {len(order_products_df)} товаров, {len(details_df)} деталей")
-    return {
-        "anor_return": order_df,
-        "anor_returnproducts": order_products_df,
-        "anor_details": details_df
-    }
+    if STREAM_JSON:
+        data = iter_response_items(response, "return")
+    else:
+        data = response.json()
+        if isinstance(data, dict) and "return" in data:
+            data = data["return"]
+
+    # anor_return (deal_time va h.k. kafolatlangan) / anor_returnproducts / anor_details — bitta o'tishda
+    frames = flatten(RETURN_TABLES, data)
+
+    print(f"✅ Получено: {len(frames['anor_return'])} возвратов, {len(frames['anor_returnproducts'])} товаров, "
+          f"{len(frames['anor_details'])} деталей")
+    return frames
 
 
 def parse_date(val):
@@ -92,8 +63,10 @@ def upload_to_sql(df_dict):
         if df.empty or len(df.columns) == 0:
             continue
 
-        # Типизация колонок
+        # Типизация колонок (RETURN_TABLES.dtypes ustunlari allaqachon tipli)
         for col in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[col]) or isinstance(df[col].dtype, pd.Int64Dtype):
+                continue
             if "id" in col.lower():
                 df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
             elif "date" in col.lower() or "time" in col.lower():
@@ -1,28 +1,21 @@
+import os
+import sys
 import json
 import urllib
 
 import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from sqlalchemy import create_engine, NVARCHAR, DateTime, Integer
 
+# repo ildizidagi umumiy modullar (smartup_session va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def get_cookies_from_browser(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-    input("🌐 Зайдите на сайт и нажмите Enter после авторизации...")
-    cookies = driver.get_cookies()
-    driver.quit()
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+from smartup_session import get_session  # noqa: E402
 
 
 def fetch_and_flatten(data_url):
-    cookies = get_cookies_from_browser("https://smartup.online")
+    session = get_session()
     print("⬇️ Загружаем данные...")
-    response = requests.get(data_url, cookies=cookies)
+    response = session.get(data_url)
     response.raise_for_status()
     data = response.json()
 
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+SmartUp uchun umumiy autentifikatsiya va HTTP sessiyalar.
+
+Har bir loader Selenium orqali cookie olish o'rniga shu yerdan tayyor sessiya oladi:
+
+    from smartup_session import get_session
+    session = get_session()
+    resp = session.get(url, timeout=120)
+
+Rejimlar:
+  - "basic"  (standart): balance_main kabi basic auth — brauzer umuman kerak emas.
+  - "cookie": cookie jar diskda (SESSION_CACHE) muddati bilan saqlanadi; muddati o'tsa yoki server 401
+              qaytarsa, bir marta qayta login qilinadi (brauzer orqali) va so'rov takrorlanadi.
+
+Sessiyalar thread bo'yicha alohida (requests.Session thread-safe emas), keep-alive ulanishlar
+HTTPAdapter pool'ida qayta ishlatiladi.
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = "https://smartup.online"
+USERNAME = os.environ.get("SMARTUP_USERNAME", "powerbi@epco")
+PASSWORD = os.environ.get("SMARTUP_PASSWORD", "said_2021")
+AUTH_MODE = os.environ.get("SMARTUP_AUTH_MODE", "basic")  # "basic" | "cookie"
+
+SESSION_CACHE = os.environ.get("SMARTUP_SESSION_CACHE",
+                               os.path.join(os.path.expanduser("~"), ".smartup", "session.json"))
+SESSION_TTL_SECONDS = 12 * 3600
+POOL_MAXSIZE = 16
+
+_RETRY_HEADER = "X-Smartup-Auth-Retry"
+
+
+def browser_login(url: str = BASE_URL) -> dict:
+    """Eski usul: Chrome ochiladi, foydalanuvchi login qiladi. Faqat cookie keshi yo'q/eskirgan bo'lsa chaqiriladi."""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    chrome_options.add_argument("--start-maximized")
+    driver = webdriver.Chrome(options=chrome_options)
+    try:
+        driver.get(url)
+        input("🌐 Login qilib bo‘lgach Enter ni bosing...")
+        return {c["name"]: c["value"] for c in driver.get_cookies()}
+    finally:
+        driver.quit()
+
+
+class SessionManager:
+    """Kredensiallarni bir marta oladi, diskka muddati bilan saqlaydi va pool'langan sessiyalar beradi."""
+
+    def __init__(self, mode: str = AUTH_MODE, username: str = USERNAME, password: str = PASSWORD,
+                 cache_path: str = SESSION_CACHE, ttl: int = SESSION_TTL_SECONDS, login=browser_login,
+                 pool_maxsize: int = POOL_MAXSIZE):
+        self.mode = mode
+        self.username = username
+        self.password = password
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.login = login
+        self.pool_maxsize = pool_maxsize
+        self._cookies = None
+        self._expires_at = 0.0
+        self._generation = 0  # har refresh'da oshadi — eskirgan sessiyalar cookie'larini yangilaydi
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # ---- cookie kesh ----
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("expires_at", 0) <= time.time():
+            return None
+        return data
+
+    def _save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp = self.cache_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"cookies": self._cookies, "expires_at": self._expires_at}, f)
+        os.replace(tmp, self.cache_path)
+
+    def cookies(self) -> dict:
+        """Amaldagi cookie'lar (kerak bo'lsa keshdan yoki login orqali)."""
+        with self._lock:
+            if self._cookies is None or self._expires_at <= time.time():
+                cached = self._load_cache()
+                if cached:
+                    self._cookies, self._expires_at = cached["cookies"], cached["expires_at"]
+                else:
+                    self._refresh_locked()
+            return dict(self._cookies)
+
+    def _refresh_locked(self):
+        print("🔐 SmartUp: yangi sessiya olinmoqda...")
+        self._cookies = self.login()
+        self._expires_at = time.time() + self.ttl
+        self._generation += 1
+        self._save_cache()
+
+    def invalidate(self, generation: int):
+        """401 kelganda chaqiriladi. Boshqa thread allaqachon yangilagan bo'lsa qayta login qilinmaydi."""
+        with self._lock:
+            if generation == self._generation:
+                self._refresh_locked()
+
+    # ---- sessiyalar ----
+    def _new_session(self) -> requests.Session:
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        if self.mode == "basic":
+            s.auth = (self.username, self.password)
+        s.hooks["response"].append(self._on_response)
+        return s
+
+    def session(self) -> requests.Session:
+        """Shu thread uchun keep-alive sessiya (cookie rejimida cookie'lar yangilangan holda)."""
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = self._new_session()
+            self._local.session = s
+            self._local.generation = -1
+        if self.mode == "cookie":
+            cookies = self.cookies()
+            if self._local.generation != self._generation:
+                s.cookies.clear()
+                s.cookies.update(cookies)
+                self._local.generation = self._generation
+        return s
+
+    def _on_response(self, r, *args, **kwargs):
+        """401 → bir marta qayta login va so'rovni takrorlash (faqat cookie rejimida)."""
+        if r.status_code != 401 or self.mode != "cookie" or r.request.headers.get(_RETRY_HEADER):
+            return r
+        self.invalidate(getattr(self._local, "generation", self._generation))
+        session = self.session()
+        req = r.request.copy()
+        req.headers[_RETRY_HEADER] = "1"
+        req.headers.pop("Cookie", None)
+        req.prepare_cookies(session.cookies)
+        r.close()
+        return session.send(req, **kwargs)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_manager() -> SessionManager:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = SessionManager()
+        return _default
+
+
+def get_session() -> requests.Session:
+    """Umumiy SessionManager'dan shu thread uchun tayyor sessiya."""
+    return get_manager().session()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Ma'lumotnoma (reference) jadvallari uchun kalitli inkremental yozish: stage → hash solishtirish → MERGE.
+
+    from smartup_sink import upsert_keyed
+    stats = upsert_keyed(df, "natural_person", ["person_id"], engine)
+    # {"staged": 5120, "inserted": 3, "updated": 1, "unchanged": 5116}
+
+Eski usul (SELECT * → concat → drop_duplicates → to_sql(if_exists="replace")) har run'da butun jadvalni
+o'qib, qayta yozardi va shu vaqt davomida jadval yo'q edi. Bu yerda:
+  - har qatorning kontent hash'i (kalitsiz ustunlar, blake2b) Python'da hisoblanadi va row_hash ustunida saqlanadi;
+  - partiya #stage ga fast_executemany bilan yoziladi;
+  - MERGE faqat yangi kalitlarni qo'shadi va row_hash'i o'zgarganlarni yangilaydi — bitta tranzaksiyada,
+    jadval doim o'qiladigan holatda qoladi.
+Javobda yo'q kalitlar o'chirilmaydi (eski usul ham yozuvlarni faqat to'plagan).
+Eski jadvallarda row_hash NULL bo'lib qo'shiladi — birinchi run'da mos qatorlar bir marta yangilanadi.
+"""
+import hashlib
+import json
+
+import pandas as pd
+from sqlalchemy.types import NVARCHAR, BigInteger, Boolean, DateTime, Float
+
+from smartup_metrics import METRICS, timer
+
+ROW_HASH_BYTES = 16
+ROW_HASH_SQL = f"BINARY({ROW_HASH_BYTES})"
+KEY_NVARCHAR = 450  # indeks kaliti chegarasi (900 bayt)
+
+
+def _hash_text(v) -> str:
+    if v is None:
+        return "\x00"
+    if isinstance(v, float):
+        return repr(v)
+    if hasattr(v, "isoformat"):
+        return v.isoformat()
+    return str(v)
+
+
+def make_row_hash(values) -> bytes:
+    s = "\x1f".join(_hash_text(v) for v in values)
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=ROW_HASH_BYTES).digest()
+
+
+def _encode_nested(df: pd.DataFrame) -> pd.DataFrame:
+    """list/dict qiymatli ustunlar (groups, rooms, order_products ...) JSON matn sifatida saqlanadi."""
+    nested = [c for c in df.columns if df[c].map(lambda v: isinstance(v, (list, dict))).any()]
+    if not nested:
+        return df
+    df = df.copy()
+    for c in nested:
+        df[c] = df[c].map(lambda v: json.dumps(v, ensure_ascii=False) if isinstance(v, (list, dict)) else v)
+    return df
+
+
+def _sql_dtypes(df: pd.DataFrame, keys) -> dict:
+    dtype_mapping = {}
+    for col in df.columns:
+        s = df[col]
+        if col in keys:
+            dtype_mapping[col] = BigInteger() if pd.api.types.is_integer_dtype(s) else NVARCHAR(KEY_NVARCHAR)
+        elif pd.api.types.is_bool_dtype(s):
+            dtype_mapping[col] = Boolean()
+        elif pd.api.types.is_integer_dtype(s):
+            dtype_mapping[col] = BigInteger()
+        elif pd.api.types.is_float_dtype(s):
+            dtype_mapping[col] = Float()
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            dtype_mapping[col] = DateTime()
+        else:
+            dtype_mapping[col] = NVARCHAR()  # NVARCHAR(max)
+    return dtype_mapping
+
+
+def _ensure_target(conn, table_name, df, dtype_mapping, keys):
+    """Jadval bo'lmasa yaratadi, yangi ustunlar va row_hash'ni qo'shadi, kalit indeksini ta'minlaydi."""
+    dialect = conn.engine.dialect
+    if not dialect.has_table(conn, table_name):
+        print(f"🆕 {table_name} jadvali yo‘q, yangisini yaratamiz...")
+        df.head(0).to_sql(table_name, con=conn, index=False, dtype=dtype_mapping)
+    existing = {r[0] for r in conn.exec_driver_sql(
+        "SELECT name FROM sys.columns WHERE object_id = OBJECT_ID(?)", (table_name,))}
+    for col in df.columns:
+        if col not in existing:
+            col_type = dtype_mapping[col].compile(dialect=dialect)
+            conn.exec_driver_sql(f"ALTER TABLE [{table_name}] ADD [{col}] {col_type} NULL")
+    if "row_hash" not in existing:
+        conn.exec_driver_sql(f"ALTER TABLE [{table_name}] ADD row_hash {ROW_HASH_SQL} NULL")
+    for k in keys:
+        # to_sql(if_exists="replace") bilan yaratilgan eski jadvallarda matn ustunlari (max) — indekslab bo'lmaydi
+        conn.exec_driver_sql(f"""
+IF COL_LENGTH('{table_name}', '{k}') = -1
+    ALTER TABLE [{table_name}] ALTER COLUMN [{k}] NVARCHAR({KEY_NVARCHAR}) NULL;
+""")
+    key_cols = ", ".join(f"[{k}]" for k in keys)
+    conn.exec_driver_sql(f"""
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table_name}_key' AND object_id = OBJECT_ID('{table_name}'))
+    CREATE INDEX [IX_{table_name}_key] ON [{table_name}]({key_cols}) INCLUDE (row_hash);
+""")
+
+
+def _merge_changed(conn, table_name, df, keys) -> dict:
+    """DataFrame (+ row_hash) → #stage → MERGE: yangi kalitlar INSERT, row_hash farq qilsa UPDATE."""
+    cols = list(df.columns)
+    content = [c for c in cols if c not in keys]
+    with timer("coerce"):
+        values = df.astype(object).where(df.notna(), None)
+        hashes = [make_row_hash(row) for row in values[content].itertuples(index=False, name=None)]
+        rows = [row + (h,) for row, h in zip(values.itertuples(index=False, name=None), hashes)]
+
+    all_cols = cols + ["row_hash"]
+    col_list = ", ".join(f"[{c}]" for c in all_cols)
+    stage = f"#stage_{table_name}"
+    conn.exec_driver_sql(f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage}; "
+                         f"SELECT TOP 0 {col_list} INTO {stage} FROM [{table_name}];")
+    with timer("staging_insert"):
+        cursor = conn.connection.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany(f"INSERT INTO {stage} ({col_list}) VALUES ({', '.join('?' * len(all_cols))})", rows)
+
+    on = " AND ".join(f"T.[{k}] = S.[{k}]" for k in keys)
+    not_null = " AND ".join(f"[{k}] IS NOT NULL" for k in keys)
+    part = ", ".join(f"[{k}]" for k in keys)
+    updates = ",\n    ".join(f"[{c}] = S.[{c}]" for c in content + ["row_hash"])
+    with timer("merge"):
+        row = conn.exec_driver_sql(f"""
+SET NOCOUNT ON;
+DECLARE @actions TABLE (a nvarchar(10));
+MERGE [{table_name}] AS T
+USING (
+    SELECT {col_list} FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY {part} ORDER BY (SELECT 0)) AS _rn
+        FROM {stage} WHERE {not_null}
+    ) x WHERE _rn = 1
+) AS S
+ON ({on})
+WHEN MATCHED AND (T.row_hash IS NULL OR T.row_hash <> S.row_hash) THEN UPDATE SET
+    {updates}
+WHEN NOT MATCHED THEN
+    INSERT ({col_list}) VALUES ({", ".join(f"S.[{c}]" for c in all_cols)})
+OUTPUT $action INTO @actions;
+DROP TABLE {stage};
+SELECT SUM(CASE WHEN a = 'INSERT' THEN 1 ELSE 0 END), SUM(CASE WHEN a = 'UPDATE' THEN 1 ELSE 0 END) FROM @actions;
+""").fetchone()
+    inserted, updated = (int(row[0] or 0), int(row[1] or 0)) if row else (0, 0)
+    METRICS.inc("rows_total", inserted + updated, table=table_name)
+    return {"staged": len(rows), "inserted": inserted, "updated": updated}
+
+
+def upsert_keyed(df: pd.DataFrame, table_name: str, keys, engine) -> dict:
+    """
+    df'ni table_name'ga keys (natural key) bo'yicha inkremental yozadi, bitta tranzaksiyada.
+    Qaytadi: {"staged", "inserted", "updated", "unchanged"}.
+    """
+    keys = list(keys)
+    missing = [k for k in keys if k not in df.columns]
+    if missing:
+        raise ValueError(f"❌ {table_name}: kalit ustunlari yo‘q: {missing}")
+    with timer("dedupe"):
+        df = _encode_nested(df).dropna(subset=keys).drop_duplicates(subset=keys, keep="last")
+    if df.empty:
+        return {"staged": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+    dtype_mapping = _sql_dtypes(df, keys)
+
+    with engine.connect() as conn:
+        tx = conn.begin()
+        _ensure_target(conn, table_name, df, dtype_mapping, keys)
+        stats = _merge_changed(conn, table_name, df, keys)
+        with timer("commit"):
+            tx.commit()
+    stats["unchanged"] = stats["staged"] - stats["inserted"] - stats["updated"]
+    return stats
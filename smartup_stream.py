@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+SmartUp $export javoblarini oqim (streaming) rejimida o'qish.
+
+Javob tanasi butunlay xotiraga olinmaydi: yuqori darajadagi obyektdan kerakli
+massiv (masalan "balance", "order", "visit", "inventory", "return") topiladi va
+uning elementlari birma-bir qaytariladi. Xotirada bir vaqtda faqat bitta element
+va o'qilayotgan bufer turadi.
+
+    resp = session.post(url, ..., stream=True)
+    for item in iter_response_items(resp, "balance"):
+        ...
+"""
+import codecs
+import json
+
+CHUNK_SIZE = 1 << 16  # 64 KiB
+
+_WS = " \t\r\n"
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Bayt bo'laklaridan matn buferini to'ldirib boradi (UTF-8 chegaralari xavfsiz)."""
+
+    def __init__(self, chunks, encoding="utf-8-sig"):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Buferga yana bir bo'lak qo'shadi. Oqim tugagan bo'lsa False."""
+        if self.eof:
+            return False
+        if self.pos:
+            # o'qib bo'lingan qismni tashlab yuboramiz
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            text = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                self.buf += text
+                return True
+        self.buf += self._decoder.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Bo'shliqlarni tashlab, keyingi belgini qaytaradi (oqim tugasa "")."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, ch: str):
+        got = self.peek()
+        if got != ch:
+            raise ValueError(f"JSON oqimida '{ch}' kutilgan edi, '{got or 'EOF'}' keldi (pos={self.pos})")
+        self.pos += 1
+
+    def value(self):
+        """Keyingi to'liq JSON qiymatini o'qiydi (kerak bo'lsa buferni to'ldirib)."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+                # son/literal bufer oxirida tugasa, u hali to'liq bo'lmasligi mumkin
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_json_items(chunks, key: str, encoding="utf-8-sig"):
+    """
+    chunks: bayt (yoki matn) bo'laklari iteratori — masalan resp.iter_content(...) yoki fayl bo'laklari.
+    key: yuqori darajadagi massiv nomi ("balance", "order", ...).
+    Massiv elementlarini birma-bir qaytaradi. Kalit topilmasa yoki null bo'lsa hech narsa qaytarmaydi.
+    """
+    r = _Reader(chunks, encoding)
+    r.expect("{")
+    if r.peek() == "}":
+        return
+    while True:
+        name = r.value()
+        r.expect(":")
+        if name == key and r.peek() == "[":
+            r.pos += 1
+            if r.peek() == "]":
+                r.pos += 1
+            else:
+                while True:
+                    yield r.value()
+                    sep = r.peek()
+                    r.pos += 1
+                    if sep == "]":
+                        break
+                    if sep != ",":
+                        raise ValueError(f"JSON massivida ',' yoki ']' kutilgan edi, '{sep or 'EOF'}' keldi")
+        else:
+            r.value()  # boshqa kalitlar qiymatini o'tkazib yuboramiz
+        sep = r.peek()
+        r.pos += 1
+        if sep == "}":
+            return
+        if sep != ",":
+            raise ValueError(f"JSON obyektida ',' yoki '}}' kutilgan edi, '{sep or 'EOF'}' keldi")
+
+
+def iter_response_items(resp, key: str, chunk_size: int = CHUNK_SIZE):
+    """requests javobini (stream=True bilan olingan) oqim rejimida o'qiydi. JSON doim UTF-8."""
+    return iter_json_items(resp.iter_content(chunk_size=chunk_size), key)
+
+
+def iter_file_items(path: str, key: str, chunk_size: int = CHUNK_SIZE):
+    """Diskdagi katta JSON faylni ham xuddi shunday oqim rejimida o'qiydi."""
+    with open(path, "rb") as f:
+        yield from iter_json_items(iter(lambda: f.read(chunk_size), b""), key)
@@ -1,78 +1,106 @@
+import argparse
+import os
+import sys
+import time
 import urllib
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine
 from sqlalchemy.types import Integer, Float, String, DateTime, Boolean
 
+# repo ildizidagi umumiy modullar (smartup_stream va h.k.)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def get_cookies_from_browser(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(url)
-    input("🌐 Зайдите на сайт и нажмите Enter после авторизации...")
-    cookies = driver.get_cookies()
-    driver.quit()
-    return {cookie['name']: cookie['value'] for cookie in cookies}
+from smartup_session import get_session  # noqa: E402
+from smartup_archive import get_archive, iter_archived_items  # noqa: E402
+from smartup_flatten import VISIT_TABLES, Flattener  # noqa: E402
+from smartup_metrics import METRICS, metered_chunks, timer  # noqa: E402
+from smartup_stream import CHUNK_SIZE, iter_json_items  # noqa: E402
+
+STREAM_JSON = True  # visit$export javobini oqim rejimida o'qish
+REPLAY = False  # --replay: javob smartup_archive'dan o'qiladi (tarmoqsiz)
+VISIT_URL = "https://smartup.online/b/trade/txs/tvt/visit$export"
+
+# Inkremental yuklash: [min(faol filial watermark) - INCREMENTAL_BUFFER_DAYS, bugun] WINDOW_DAYS kunlik oynalarda
+LOADSTATE_TABLE = "dbo.LoadState_Visit"
+BEGIN_DATE = datetime(2025, 1, 1)  # watermark hali yo'q bo'lsa shu sanadan
+INCREMENTAL_BUFFER_DAYS = 3  # kechikib yozilgan/tahrirlangan visit'lar uchun qayta yuklanadigan kunlar
+WATERMARK_LOOKBACK_DAYS = 31  # eng yangi watermark'dan shuncha kun ortda qolgan filial hisobga olinmaydi
+WINDOW_DAYS = 7  # bitta visit$export so'rovi oralig'i (javob hajmi shu bilan cheklanadi)
+FETCH_WORKERS = 4  # parallel visit$export so'rovlari
+PREFETCH_WINDOWS = 4  # tartibda kutayotgan (yuklangan/yuklanayotgan) oynalar chegarasi
+ALL_FILIALS = "*"  # filial_code bo'sh kelgan header'lar uchun watermark kaliti
+
+
+def split_url(data_url):
+    """URL → (endpoint, query parametrlari dict) — arxiv kaliti uchun."""
+    parts = urllib.parse.urlsplit(data_url)
+    endpoint = urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+    return endpoint, dict(urllib.parse.parse_qsl(parts.query))
+
+
+def visit_windows(start: datetime, end: datetime, days: int = WINDOW_DAYS):
+    """[start, end] → [(from, to), ...] (yyyy-mm-dd, ikkala chet kiradi, oynalar kesishmaydi)."""
+    out = []
+    d = start.date() if isinstance(start, datetime) else start
+    end = end.date() if isinstance(end, datetime) else end
+    while d <= end:
+        e = min(d + timedelta(days=days - 1), end)
+        out.append((d.strftime("%Y-%m-%d"), e.strftime("%Y-%m-%d")))
+        d = e + timedelta(days=1)
+    return out
+
+
+def window_url(date_from: str, date_to: str) -> str:
+    return f"{VISIT_URL}?{urllib.parse.urlencode({'from': date_from, 'to': date_to})}"
 
 
 def fetch_and_flatten(data_url):
     try:
-        cookies = get_cookies_from_browser("https://smartup.online")
         print("⬇️ Загружаем данные...")
-        response = requests.get(data_url, cookies=cookies)
-        response.raise_for_status()
-        data = response.json()
-
-        if "visit" not in data:
-            raise ValueError("❌ JSON formatida 'visit' topilmadi")
-
-        visits = data["visit"]
-
-        visit_headers, stocks, merchandisings, quizzes, comments = [], [], [], [], []
-
-        for v in visits:
-            vid = v.get("visit_headers", [{}])[0].get("visit_id")
-            for h in v.get("visit_headers", []):
-                visit_headers.append(h)
-
-            for s in v.get("stocks", []):
-                s["visit_id"] = vid
-                stocks.append(s)
-
-            for m in v.get("merchandisings", []):
-                m["visit_id"] = vid
-                merchandisings.append(m)
-
-            for q in v.get("quizzes", []):
-                q["visit_id"] = vid
-                quizzes.append(q)
-
-            for c in v.get("comments", []):
-                c["visit_id"] = vid
-                comments.append(c)
-
-        df_dict = {}
-        if visit_headers:
-            df_dict["visit_headers"] = pd.DataFrame(visit_headers)
-        if stocks:
-            df_dict["visit_stocks"] = pd.DataFrame(stocks)
-        if merchandisings:
-            df_dict["visit_merchandisings"] = pd.DataFrame(merchandisings)
-        if quizzes:
-            df_dict["visit_quizzes"] = pd.DataFrame(quizzes)
-        if comments:
-            df_dict["visit_comments"] = pd.DataFrame(comments)
+        endpoint, request = split_url(data_url)
+        window = (request.get("from"), request.get("to"))
+        t0 = time.perf_counter()
+        if REPLAY:
+            visits = iter_json_items(get_archive(required=True).chunks_for(endpoint, request), "visit")
+        else:
+            with timer("http_wait"):
+                response = get_session().get(data_url, stream=STREAM_JSON)
+            response.raise_for_status()
+            archive = get_archive()
+            if STREAM_JSON:
+                visits = iter_archived_items(metered_chunks(response.iter_content(chunk_size=CHUNK_SIZE)), "visit",
+                                             archive, endpoint, request, window)
+            else:
+                with timer("http_wait"):
+                    body = response.content
+                METRICS.inc("bytes_received_total", len(body))
+                if archive is not None:
+                    archive.put(endpoint, request, body, window)
+                data = response.json()
+                if "visit" not in data:
+                    raise ValueError("❌ JSON formatida 'visit' topilmadi")
+                visits = data["visit"]
+
+        # visit_headers va bola jadvallar (visit_id birinchi header'dan) bitta o'tishda
+        flat = Flattener(VISIT_TABLES)
+        with timer("decode"):  # oqimda bo'laklarni kutish bu yerdan ayrilib http_wait'ga yoziladi
+            flat.feed(visits)
+        METRICS.observe("window_seconds", time.perf_counter() - t0)
+        METRICS.inc("items_total", flat.rows("visit_headers"))
+
+        with timer("flatten"):
+            df_dict = flat.frames(skip_empty=True)
 
         print("✅ Flatten qilingan DF lar:", [k for k in df_dict.keys()])
         return df_dict
 
     except Exception as e:
         print(f"❌ Ошибка при загрузке: {e}")
+        METRICS.inc("errors_total", stage="fetch")
         return None
 
 
@@ -119,55 +147,280 @@ def map_sql_types(df: pd.DataFrame):
     return type_map
 
 
-def upload_to_sql(df_dict):
+# Jadval kalitlari: header — visit_id, bola qatorlar — (visit_id, line_no) (line_no: smartup_flatten.VISIT_TABLES)
+VISIT_KEYS = {
+    "visit_headers": ["visit_id"],
+    "visit_stocks": ["visit_id", "line_no"],
+    "visit_merchandisings": ["visit_id", "line_no"],
+    "visit_quizzes": ["visit_id", "line_no"],
+    "visit_comments": ["visit_id", "line_no"],
+}
+
+
+def get_engine():
+    params = urllib.parse.quote_plus(
+        "DRIVER={ODBC Driver 17 for SQL Server};"
+        "SERVER=WIN-LORQJU2719N;"
+        "DATABASE=SmartUp;"
+        "Trusted_Connection=yes;"
+        "TrustServerCertificate=yes;"
+    )
+    return create_engine(f"mssql+pyodbc:///?odbc_connect={params}", fast_executemany=True)
+
+
+def _ensure_target(conn, table_name, df, column_types, keys):
+    """Jadval bo'lmasa yaratadi, yangi ustunlarni qo'shadi va kalit indeksini ta'minlaydi."""
+    dialect = conn.engine.dialect
+    if not dialect.has_table(conn, table_name):
+        print(f"🆕 {table_name} jadvali yo‘q, yangisini yaratamiz...")
+        df.head(0).to_sql(table_name, con=conn, index=False, dtype=column_types)
+    existing = {r[0] for r in conn.exec_driver_sql(
+        "SELECT name FROM sys.columns WHERE object_id = OBJECT_ID(?)", (table_name,))}
+    for col in df.columns:
+        if col not in existing:
+            sa_type = column_types[col]
+            sa_type = sa_type() if isinstance(sa_type, type) else sa_type  # map_sql_types: Integer yoki String(n)
+            conn.exec_driver_sql(f"ALTER TABLE [{table_name}] ADD [{col}] {sa_type.compile(dialect=dialect)} NULL")
+    key_cols = ", ".join(f"[{k}]" for k in keys)
+    conn.exec_driver_sql(f"""
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table_name}_key' AND object_id = OBJECT_ID('{table_name}'))
+    CREATE INDEX [IX_{table_name}_key] ON [{table_name}]({key_cols});
+""")
+
+
+def _insert_new(conn, table_name, df, keys) -> int:
+    """
+    DataFrame → #stage (fast_executemany) → INSERT ... WHERE NOT EXISTS (kalitlar bo'yicha, server tomonida).
+    Mavjud id'lar Python'ga o'qilmaydi — vaqt faqat yangi partiya hajmiga bog'liq.
+    Birinchi kalitdan keyingilar (line_no) nishonda NULL bo'lsa ham mos deb olinadi: oldingi versiya bola
+    qatorlarni line_no'siz, visit bo'yicha yozgan — bunday visit'lar to'liq yuklangan hisoblanadi.
+    Qaytadi: qo'shilgan qatorlar soni.
+    """
+    cols = list(df.columns)
+    col_list = ", ".join(f"[{c}]" for c in cols)
+    stage = f"#stage_{table_name}"
+    conn.exec_driver_sql(f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage}; "
+                         f"SELECT TOP 0 {col_list} INTO {stage} FROM [{table_name}];")
+
+    with timer("staging_insert"):
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        cursor = conn.connection.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany(f"INSERT INTO {stage} ({col_list}) VALUES ({', '.join('?' * len(cols))})", list(rows))
+
+    on = " AND ".join(f"T.[{k}] = S.[{k}]" if i == 0 else f"(T.[{k}] = S.[{k}] OR T.[{k}] IS NULL)"
+                      for i, k in enumerate(keys))
+    with timer("merge"):
+        inserted = conn.exec_driver_sql(f"""
+SET NOCOUNT ON;
+INSERT INTO [{table_name}] ({col_list})
+SELECT {", ".join(f"S.[{c}]" for c in cols)} FROM {stage} AS S
+WHERE NOT EXISTS (SELECT 1 FROM [{table_name}] AS T WHERE {on});
+SELECT @@ROWCOUNT;
+""").scalar()
+        conn.exec_driver_sql(f"DROP TABLE {stage};")
+    return inserted or 0
+
+
+def ensure_loadstate_table(conn):
+    conn.exec_driver_sql(f"""
+IF OBJECT_ID('{LOADSTATE_TABLE}','U') IS NULL
+BEGIN
+  CREATE TABLE {LOADSTATE_TABLE}
+  (
+      filial_code     nvarchar(50) NOT NULL PRIMARY KEY,
+      last_visit_date date         NULL,
+      last_run_utc    datetime2    NULL,
+      last_rowcount   int          NULL
+  );
+END
+""")
+
+
+def _incremental_start(watermarks: dict) -> datetime:
+    """
+    {filial_code: last_visit_date} → faol filiallar watermark'larining eng kichigi - INCREMENTAL_BUFFER_DAYS.
+    Eng yangisidan WATERMARK_LOOKBACK_DAYS dan ko'p ortda qolgan (visit'i to'xtagan) filial tashlanadi —
+    aks holda har run oynani o'sha sanagacha qayta yuklaydi. Loader butunlay to'xtagan bo'lsa hamma birga ortda.
+    """
+    dates = {f: d for f, d in watermarks.items() if d is not None}
+    if not dates:
+        return BEGIN_DATE
+    cutoff = max(dates.values()) - timedelta(days=WATERMARK_LOOKBACK_DAYS)
+    stale = sorted(f for f, d in dates.items() if d < cutoff)
+    if stale:
+        print(f"⚠️ {len(stale)} ta filial watermark'i {WATERMARK_LOOKBACK_DAYS} kundan ko'p ortda, "
+              f"hisobga olinmadi: {', '.join(stale)}")
+    start = min(d for d in dates.values() if d >= cutoff)
+    start = datetime.combine(start, datetime.min.time()) - timedelta(days=INCREMENTAL_BUFFER_DAYS)
+    return max(BEGIN_DATE, start)
+
+
+def get_incremental_start(engine) -> datetime:
+    """
+    Yuklash boshlanadigan sana (_incremental_start). visit$export filial bo'yicha filtrlamaydi — eng orqada
+    qolgan faol filial hal qiladi.
+    """
+    with engine.begin() as conn:
+        ensure_loadstate_table(conn)
+        rows = conn.exec_driver_sql(f"SELECT filial_code, last_visit_date FROM {LOADSTATE_TABLE}").fetchall()
+    return _incremental_start({str(f): d for f, d in rows})
+
+
+def _filial_watermarks(headers_df: pd.DataFrame) -> dict:
+    """visit_headers → {filial_code: (max visit_date, visit soni)} (visit_date: dd.mm.yyyy)."""
+    if headers_df is None or headers_df.empty or "visit_date" not in headers_df.columns:
+        return {}
+    dates = pd.to_datetime(headers_df["visit_date"].astype(str).str.slice(0, 10), format="%d.%m.%Y", errors="coerce")
+    if "filial_code" in headers_df.columns:
+        filials = headers_df["filial_code"].fillna(ALL_FILIALS).astype(str)
+    else:
+        filials = pd.Series(ALL_FILIALS, index=headers_df.index)
+    tmp = pd.DataFrame({"filial_code": filials, "d": dates}).dropna()
+    return {f: (g["d"].max().date(), len(g)) for f, g in tmp.groupby("filial_code")}
+
+
+def upload_to_sql(df_dict, engine=None, update_watermark=False) -> bool:
+    """
+    Jadvallarni yozadi; update_watermark=True bo'lsa LoadState_Visit shu tranzaksiyada yangilanadi
+    (yozish muvaffaqiyatsiz bo'lsa watermark ham siljimaydi). Qaytadi: muvaffaqiyat.
+    """
     try:
         print("🔌 Подключение к SQL Server...")
-        params = urllib.parse.quote_plus(
-            "DRIVER={ODBC Driver 17 for SQL Server};"
-            "SERVER=WIN-LORQJU2719N;"
-            "DATABASE=SmartUp;"
-            "Trusted_Connection=yes;"
-            "TrustServerCertificate=yes;"
-        )
-        engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-
-        with engine.begin() as conn:
+        engine = engine or get_engine()
+        watermarks = _filial_watermarks(df_dict.get("visit_headers")) if update_watermark else {}
+
+        with engine.connect() as conn:
+            tx = conn.begin()  # commit vaqti alohida o'lchanadi; xatoda ulanish yopilganda rollback
             for table_name, df in df_dict.items():
+                keys = VISIT_KEYS.get(table_name, ["visit_id"])
+                if df is None or df.empty or any(k not in df.columns for k in keys):
+                    print(f"⏭ {table_name}: bo‘sh yoki kalit ustunlari {keys} yo‘q – o‘tkazib yuborildi.")
+                    continue
+
                 # 🧹 datetime ustunlarni tozalash
-                df = clean_datetime_columns(df)
-
-                if "visit_id" in df.columns:
-                    df = df.drop_duplicates(subset=["visit_id"])
-
-                column_types = map_sql_types(df)
-
-                if engine.dialect.has_table(conn, table_name):
-                    if "visit_id" in df.columns:
-                        existing_ids = pd.read_sql(
-                            text(f"SELECT DISTINCT visit_id FROM {table_name}"), conn
-                        )
-                        new_df = df[~df["visit_id"].isin(existing_ids["visit_id"])]
-                    else:
-                        new_df = df
-
-                    if not new_df.empty:
-                        print(f"📥 {table_name} ga {len(new_df)} ta yangi qator qo‘shilmoqda...")
-                        new_df.to_sql(table_name, con=conn, index=False, if_exists="append", dtype=column_types)
-                    else:
-                        print(f"⚡ {table_name} da yangi ma'lumot yo‘q, o‘tkazib yuborildi.")
+                with timer("coerce"):
+                    df = clean_datetime_columns(df)
+
+                # partiya ichidagi takrorlar va kalitsiz qatorlar
+                with timer("dedupe"):
+                    df = df.dropna(subset=keys).drop_duplicates(subset=keys)
+
+                with timer("coerce"):
+                    column_types = map_sql_types(df)
+
+                _ensure_target(conn, table_name, df, column_types, keys)
+                inserted = _insert_new(conn, table_name, df, keys)
+                METRICS.inc("rows_total", inserted, table=table_name)
+                if inserted:
+                    print(f"📥 {table_name} ga {inserted} ta yangi qator qo‘shildi ({len(df)} tadan).")
                 else:
-                    print(f"🆕 {table_name} jadvali yo‘q, yangisini yaratamiz...")
-                    df.to_sql(table_name, con=conn, index=False, if_exists="replace", dtype=column_types)
+                    print(f"⚡ {table_name} da yangi ma'lumot yo‘q, o‘tkazib yuborildi.")
+
+            if watermarks:
+                ensure_loadstate_table(conn)
+            for filial_code, (last_date, n) in watermarks.items():
+                conn.exec_driver_sql(f"""
+MERGE {LOADSTATE_TABLE} AS T
+USING (SELECT ? AS filial_code, ? AS last_visit_date, ? AS last_rowcount) AS S
+   ON T.filial_code = S.filial_code
+WHEN MATCHED THEN UPDATE SET
+    last_visit_date = CASE WHEN T.last_visit_date IS NULL OR S.last_visit_date > T.last_visit_date
+                           THEN S.last_visit_date ELSE T.last_visit_date END,
+    last_run_utc    = SYSUTCDATETIME(),
+    last_rowcount   = S.last_rowcount
+WHEN NOT MATCHED THEN
+    INSERT (filial_code, last_visit_date, last_run_utc, last_rowcount)
+    VALUES (S.filial_code, S.last_visit_date, SYSUTCDATETIME(), S.last_rowcount);
+""", (filial_code, last_date, n))
+            with timer("commit"):
+                tx.commit()
 
         print("✅ Все данные успешно записаны в SQL Server (to‘g‘ri turlar bilan, dublikatlarsiz).")
+        return True
 
     except Exception as e:
         print(f"❌ Ошибка при записи в SQL: {e}")
+        METRICS.inc("errors_total", stage="upload")
+        return False
+
+
+def iter_visit_windows(windows):
+    """
+    Oynalarni FETCH_WORKERS ta thread'da parallel yuklab flatten qiladi (smartup_session sessiyalari thread bo'yicha).
+    Natijalar qat'iy oyna tartibida qaytadi; oldinda ko'pi bilan PREFETCH_WINDOWS ta oyna turadi — iste'molchi
+    (SQL yozish) sekin bo'lsa ham xotirada bir necha haftalik javoblargina bo'ladi.
+    Qaytadi: (date_from, date_to, df_dict | None)
+    """
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        pending = deque()
+        it = iter(windows)
+
+        def _submit_next():
+            w = next(it, None)
+            if w is not None:
+                pending.append((w, pool.submit(fetch_and_flatten, window_url(*w))))
+
+        for _ in range(max(PREFETCH_WINDOWS, FETCH_WORKERS)):
+            _submit_next()
+        try:
+            while pending:
+                (date_from, date_to), fut = pending.popleft()
+                _submit_next()
+                yield date_from, date_to, fut.result()
+        finally:
+            for _, fut in pending:  # iste'molchi to'xtasa boshlanmagan oynalar bekor qilinadi
+                fut.cancel()
+
+
+def load_incremental(engine, start: datetime = None, end: datetime = None) -> bool:
+    """
+    [watermark - buffer, bugun] oralig'ini WINDOW_DAYS kunlik oynalarda yuklaydi. Oynalar tartibda yoziladi;
+    birinchi xato oynada to'xtaydi — watermark undan oldinga siljimaydi, keyingi run shu joydan davom etadi.
+    """
+    start = start or get_incremental_start(engine)
+    end = end or datetime.today()
+    windows = visit_windows(start, end)
+    print(f"📅 Yuklash oralig'i: {start:%Y-%m-%d} → {end:%Y-%m-%d} ({len(windows)} ta oyna)")
+    for date_from, date_to, df_dict in iter_visit_windows(windows):
+        if df_dict is None:
+            print(f"⛔ {date_from} → {date_to} oynasi yuklanmadi, to'xtatildi.")
+            return False
+        if not df_dict:
+            print(f"⏭ {date_from} → {date_to}: visit yo'q.")
+            continue
+        print(f"🪟 {date_from} → {date_to}")
+        if not upload_to_sql(df_dict, engine, update_watermark=True):
+            return False
+    return True
+
+
+def replay_from_archive(engine) -> bool:
+    """
+    Arxivdagi visit$export javoblarini qayta parse qilib yozadi (tarmoqsiz). Live yo'l kabi birinchi o'qilmagan
+    yoki yozilmagan oynada to'xtaydi — keyingi oynalar xato oynani yashirib qo'ymaydi.
+    """
+    entries = get_archive(required=True).entries(VISIT_URL)
+    print(f"📼 Replay: {len(entries)} ta arxivlangan javob")
+    for entry in entries:
+        url = f"{VISIT_URL}?{urllib.parse.urlencode(entry['request'])}"
+        df_dict = fetch_and_flatten(url)
+        if df_dict is None or (df_dict and not upload_to_sql(df_dict, engine)):
+            print(f"⛔ Replay {entry.get('window')} oynasida to'xtatildi.")
+            return False
+    return True
 
 
 if __name__ == "__main__":
-    today = datetime.today().strftime("%Y-%m-%d")
-    DATA_URL = f"https://smartup.online/b/trade/txs/tvt/visit$export?from=2025-01-01&to={today}"
-    df_dict = fetch_and_flatten(DATA_URL)
-    if df_dict:
-        upload_to_sql(df_dict)
+    parser = argparse.ArgumentParser(description="SmartUp visit$export → SQL Server")
+    parser.add_argument("--replay", action="store_true", help="tarmoqsiz: arxivdagi javoblarni qayta yuklash")
+    args = parser.parse_args()
+    engine = get_engine()
+    METRICS.start_run("visit")
+    if args.replay:
+        REPLAY = True
+        ok = replay_from_archive(engine)
+    else:
+        ok = load_incremental(engine)
+    METRICS.finish_run(success=ok)
+    sys.exit(0 if ok else 1)